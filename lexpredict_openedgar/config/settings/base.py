@@ -318,6 +318,9 @@ ADMIN_URL = r'^admin/'
 # Base configuration
 BASE_PATH = "./"
 DATA_PATH = pathlib.Path(BASE_PATH, "data")
+# Local caches and indices are kept with downloaded filings, outside the source tree
+DOWNLOAD_PATH = env('DOWNLOAD_PATH', default=str(pathlib.Path.home().joinpath("openedgar")))
+STATE_PATH = pathlib.Path(env('STATE_PATH', default=str(pathlib.Path(DOWNLOAD_PATH, ".openedgar"))))
 MODEL_PATH = pathlib.Path(BASE_PATH, "model")
 
 # HTTP configuration
@@ -327,6 +330,16 @@ HTTP_SEC_FILING_PATH = "/Archives/"
 HTTP_SEC_LOCAL_PATH = pathlib.Path(DATA_PATH, "sec-http")
 HTTP_FAIL_SLEEP = [15, 30, 60, 300]
 HTTP_SLEEP_DEFAULT = 0.0
+# SEC fair access policy: at most 10 requests per second, with a declared User-Agent
+HTTP_SEC_RATE_LIMIT = float(env('HTTP_SEC_RATE_LIMIT', default=10.0))
+HTTP_SEC_USER_AGENT = env('HTTP_SEC_USER_AGENT', default="OpenEDGAR admin@localhost")
+HTTP_MAX_WORKERS = int(env('HTTP_MAX_WORKERS', default=8))
+# Bytes inspected when screening downloads and stored files for error pages
+PAYLOAD_HEAD_SIZE = int(env('PAYLOAD_HEAD_SIZE', default=4096))
+# Conditional GET cache for EDGAR listings and index files
+HTTP_CACHE_PATH = env('HTTP_CACHE_PATH', default=str(pathlib.Path(STATE_PATH, "http-cache.sqlite3")))
+HTTP_CACHE_TTL = int(env('HTTP_CACHE_TTL', default=3600))
+HTTP_CACHE_MAX_BYTES = int(env('HTTP_CACHE_MAX_BYTES', default=512 * 1024 * 1024))
 
 # S3 bucket configuration
 S3_ACCESS_KEY = env('S3_ACCESS_KEY', default="")
@@ -335,6 +348,38 @@ S3_BUCKET = env('S3_BUCKET', default="")
 S3_DOCUMENT_PATH = env('S3_DOCUMENT_PATH', default="openedgar")
 S3_PREFIX = env('S3_PREFIX', default="documents")
 S3_COMPRESSION_LEVEL = int(env('S3_COMPRESSION_LEVEL', default=6))
+# Optional S3-compatible endpoint, e.g., MinIO or a local test stand-in
+S3_ENDPOINT_URL = env('S3_ENDPOINT_URL', default="") or None
+S3_REGION = env('S3_REGION', default="") or None
+S3_MAX_POOL_CONNECTIONS = int(env('S3_MAX_POOL_CONNECTIONS', default=50))
+S3_MAX_ATTEMPTS = int(env('S3_MAX_ATTEMPTS', default=10))
+S3_RETRY_MODE = env('S3_RETRY_MODE', default="adaptive")
+# Multipart part size for streaming uploads; S3 requires at least 5MB for all but the last part
+S3_MULTIPART_PART_SIZE = max(int(env('S3_MULTIPART_PART_SIZE', default=8 * 1024 * 1024)), 5 * 1024 * 1024)
+# S3 integrity sweeps: objects stored at or below SWEEP_SUSPECT_SIZE bytes get a ranged GET of their head
+SWEEP_SUSPECT_SIZE = int(env('SWEEP_SUSPECT_SIZE', default=64 * 1024))
+
+# Storage compression codecs: none, zlib, gzip, zstd or lz4; unavailable codecs fall back to zlib
+S3_CODEC = env('S3_CODEC', default="zlib")
+LOCAL_CODEC = env('LOCAL_CODEC', default="none")
+
+# Content-addressed document blob store; zstd for cold raw documents, lz4 for hot text
+BLOB_RAW_CODEC = env('BLOB_RAW_CODEC', default="zstd")
+BLOB_TEXT_CODEC = env('BLOB_TEXT_CODEC', default="lz4")
+# Cached DocumentContent line models, stored per document sha1 under LINE_CACHE_ROOT
+LINE_CACHE_ROOT = env('LINE_CACHE_ROOT', default="lines")
+LINE_CACHE_CODEC = env('LINE_CACHE_CODEC', default="zstd")
+BLOB_BLOOM_PATH = env('BLOB_BLOOM_PATH', default=str(pathlib.Path(STATE_PATH, "blob-bloom.bin")))
+BLOB_BLOOM_CAPACITY = int(env('BLOB_BLOOM_CAPACITY', default=10000000))
+BLOB_BLOOM_ERROR_RATE = float(env('BLOB_BLOOM_ERROR_RATE', default=0.01))
+
+# Segment storage backend: blobs packed into append-only segment files with a SQLite offset index
+SEGMENT_PATH = env('SEGMENT_PATH', default=str(pathlib.Path(STATE_PATH, "segments")))
+SEGMENT_MAX_BYTES = int(env('SEGMENT_MAX_BYTES', default=1024 * 1024 * 1024))
+SEGMENT_CODEC = env('SEGMENT_CODEC', default="zstd")
+
+# Concurrent storage I/O for the asyncio client wrappers
+STORAGE_MAX_CONCURRENCY = int(env('STORAGE_MAX_CONCURRENCY', default=32))
 
 # Tika configuration
 TIKA_HOST = "tika"
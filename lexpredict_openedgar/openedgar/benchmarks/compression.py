@@ -0,0 +1,107 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Benchmark storage codecs on EDGAR submissions: compression ratio against compress and decode throughput.
+
+Usage: python -m openedgar.benchmarks.compression [corpus_path] [max_files]
+
+corpus_path defaults to DOWNLOAD_PATH/edgar/data and is searched recursively for .txt submissions.
+"""
+
+# Libraries
+import os
+import sys
+import time
+
+# Project
+import openedgar.clients.compression
+
+# Codec and level combinations to compare
+CODEC_LEVELS = [("zlib", 1), ("zlib", 6), ("gzip", 6), ("zstd", 1), ("zstd", 3), ("zstd", 9), ("zstd", 19),
+                ("lz4", 0), ("lz4", 9)]
+
+
+def load_corpus(corpus_path: str, max_files: int = 200):
+    """
+    Load up to max_files submissions from a directory tree.
+    :param corpus_path: directory to search
+    :param max_files: maximum number of files to load
+    :return: list of buffers
+    """
+    buffers = []
+    for root, _, file_names in os.walk(corpus_path):
+        for file_name in sorted(file_names):
+            if not file_name.endswith(".txt"):
+                continue
+            with open(os.path.join(root, file_name), "rb") as in_file:
+                buffers.append(openedgar.clients.compression.decode(in_file.read()))
+            if len(buffers) >= max_files:
+                return buffers
+    return buffers
+
+
+def run(corpus_path: str = None, max_files: int = 200):
+    """
+    Compress and decode the corpus with each codec and level and print ratio and throughput.
+    :param corpus_path: directory of submissions
+    :param max_files: maximum number of files to load
+    :return: list of result dicts
+    """
+    corpus_path = corpus_path or os.path.join(os.environ.get("DOWNLOAD_PATH", "."), "edgar", "data")
+    buffers = load_corpus(corpus_path, max_files)
+    if len(buffers) == 0:
+        print("No .txt submissions found under {0}".format(corpus_path))
+        return []
+    total_bytes = sum(len(buffer) for buffer in buffers)
+    print("{0} submissions, {1:,.1f} MB from {2}".format(len(buffers), total_bytes / 1e6, corpus_path))
+    print("{0:<6}{1:>6}{2:>10}{3:>16}{4:>16}".format("codec", "level", "ratio", "compress MB/s", "decode MB/s"))
+
+    results = []
+    for codec_name, level in CODEC_LEVELS:
+        codec = openedgar.clients.compression.CODECS[codec_name]
+        if not codec.available:
+            print("{0:<6}{1:>6}  not installed".format(codec_name, level))
+            continue
+
+        start = time.perf_counter()
+        encoded_buffers = [openedgar.clients.compression.encode(buffer, codec, level) for buffer in buffers]
+        compress_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for encoded_buffer in encoded_buffers:
+            openedgar.clients.compression.decode(encoded_buffer)
+        decode_seconds = time.perf_counter() - start
+
+        result = {"codec": codec_name, "level": level,
+                  "ratio": total_bytes / sum(len(buffer) for buffer in encoded_buffers),
+                  "compress_mbps": total_bytes / 1e6 / compress_seconds,
+                  "decode_mbps": total_bytes / 1e6 / decode_seconds}
+        results.append(result)
+        print("{codec:<6}{level:>6}{ratio:>10.2f}{compress_mbps:>16.1f}{decode_mbps:>16.1f}".format(**result))
+    return results
+
+
+if __name__ == "__main__":
+    run(sys.argv[1] if len(sys.argv) > 1 else None, int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -0,0 +1,283 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+"""
+Benchmark line model building: the single-pass SECFilingContentParser.process_html and process_text
+against the legacy_process_html and legacy_process_text builders they replaced, on 10-K documents given on the command line
+(.txt paths are parsed as plain-text filings) or on synthetic 10-K documents in the markup style
+of EDGAR filing agents and of the text-era filings before them.
+
+Usage: python -m openedgar.benchmarks.content_parser [path ...]
+"""
+
+# Libraries
+import itertools
+import random
+import re
+import sys
+import timeit
+import tracemalloc
+
+# Project imports
+from openedgar.parsers.html_table_parser import HTMLTableParser
+from openedgar.parsers.sec_filing_content_parser import SECFilingContentParser
+from openedgar.parsers.text_table_parser import TextTableParser
+
+ITEM_LIST = ["1", "1A", "1B", "2", "3", "4", "5", "6", "7", "7A", "8", "9", "9A", "9B", "10", "11", "12", "13", "14",
+             "15"]
+ACCOUNT_LIST = ["Cash and cash equivalents", "Accounts receivable, net", "Inventories", "Total current assets",
+                "Property and equipment, net", "Goodwill", "Total assets", "Accounts payable", "Accrued liabilities",
+                "Long-term debt", "Total liabilities", "Retained earnings", "Total stockholders&#8217; equity"]
+
+
+def build_10k_html(paragraphs_per_item: int = 40, tables_per_item: int = 3, seed: int = 0):
+    """
+    Build a synthetic 10-K HTML document with styled div/font markup, page breaks and financial tables.
+    :param paragraphs_per_item: number of paragraphs in each item section
+    :param tables_per_item: number of tables in each item section
+    :param seed: random seed
+    :return: document bytes
+    """
+    rng = random.Random(seed)
+    parts = ['<html><head><title>10-K</title></head><body style="font-family:Times New Roman">']
+    for item in ITEM_LIST:
+        parts.append('<div style="margin-top:12pt"><font style="font-size:10pt;font-weight:bold">Item&#160;{0}.'
+                     '</font><font style="font-size:10pt"> Section heading</font></div>'.format(item))
+        for i in range(paragraphs_per_item):
+            parts.append('<div style="text-align:justify"><font style="font-size:10pt">{0}</font></div>'.format(
+                " ".join("word{0}".format(rng.randint(0, 5000)) for _ in range(rng.randint(20, 80)))))
+            if i % (paragraphs_per_item // max(tables_per_item, 1) or 1) == 0:
+                rows = "".join('<tr><td style="padding-left:12pt"><font>{0}</font></td><td>$</td>'
+                               '<td style="text-align:right">{1:,}</td><td>&#160;</td><td>$</td>'
+                               '<td style="text-align:right">{2:,}</td></tr>'
+                               .format(account, rng.randint(1000, 900000), rng.randint(1000, 900000))
+                               for account in ACCOUNT_LIST)
+                parts.append('<table style="width:100%;border-collapse:collapse"><tr><td></td>'
+                             '<td colspan="2">2018</td><td></td><td colspan="2">2017</td></tr>{0}</table>'.format(rows))
+            if i % 10 == 9:
+                parts.append('<div style="page-break-after:always"></div><hr/>')
+    parts.append("</body></html>")
+    return "".join(parts).encode("ascii")
+
+
+def build_10k_text(paragraphs_per_item: int = 40, tables_per_item: int = 3, seed: int = 0):
+    """
+    Build a synthetic plain-text 10-K document with <PAGE> breaks and <TABLE> regions.
+    :param paragraphs_per_item: number of paragraphs in each item section
+    :param tables_per_item: number of tables in each item section
+    :param seed: random seed
+    :return: document bytes
+    """
+    rng = random.Random(seed)
+    lines = ["FORM 10-K".center(80)]
+    for item in ITEM_LIST:
+        lines.extend(["", "ITEM {0}.  SECTION HEADING".format(item), ""])
+        for i in range(paragraphs_per_item):
+            words = ["word{0}".format(rng.randint(0, 5000)) for _ in range(rng.randint(20, 80))]
+            lines.extend("     " + " ".join(words[j:j + 10]) for j in range(0, len(words), 10))
+            lines.append("")
+            if i % (paragraphs_per_item // max(tables_per_item, 1) or 1) == 0:
+                lines.extend(["<TABLE>", "<CAPTION>", "{0:>54}{1:>12}".format("1998", "1997"),
+                              "{0:>54}{0:>12}".format("--------"), "<S>{0:>51}{0:>12}".format("<C>")])
+                lines.extend("{0:.<42}  ${1:>9,}   ${2:>9,}".format(account.replace("&#8217;", "'"),
+                                                                       rng.randint(1000, 900000),
+                                                                       rng.randint(1000, 900000))
+                             for account in ACCOUNT_LIST)
+                lines.append("</TABLE>")
+            if i % 10 == 9:
+                lines.extend(["", "<PAGE>   {0}".format(rng.randint(1, 200)), ""])
+    return "\n".join(lines).encode("ascii")
+
+
+def legacy_process_html(parser: SECFilingContentParser):
+    """
+    Line model builder SECFilingContentParser.process_html replaced: cleans and re-parses the document,
+    swaps each table for a placeholder, then walks every element.  Kept to benchmark and check against.
+    :param parser: parser holding an HTML document
+    :return: list of line dicts
+    """
+    html_doc, tables = parser.extract_tables_from_html()
+    lines = []
+    text = ""
+    style= ""
+    item_number = None
+    element_position=0
+    page_number = 1
+    for i, e in enumerate(html_doc.iter()):
+        if not e.tag in parser.inline():
+            element_position=i
+            search = re.search("^\s*item\s*[0-9]+[A-Za-z]*", text, re.IGNORECASE)
+            if search:
+                numbers = re.search("[0-9]+[A-Za-z]*", text, re.IGNORECASE)
+                item_number = numbers.group(0)
+            if e.tag == "table":
+                table_index = e.get("name")
+                table_doc = tables[table_index]
+                table_data = HTMLTableParser(table_doc).parsed_table_unclean()
+                table_text = parser.extract_table_content(table_doc)
+                line_data = {"line_index": len(lines), "element_index": element_position, "item_number": item_number, "page_number": page_number,\
+                    "tag": e.tag, "style": style, "content": table_text, "table_index": table_index, "table_data": table_data}
+            else:
+                line_data = {"line_index": len(lines), "element_index": element_position, "item_number": item_number, "page_number": page_number,\
+                "tag": e.tag, "style": style, "content": text.strip(), "table_index": None, "table_data": None}
+            lines.append(line_data)
+            text = ""
+            style = ""
+        if e.text:
+            text = text + e.text.replace(u'\xa0',' ')
+        if e.tail:
+            text = text + e.tail.replace(u'\xa0',' ')
+        if e.get("style"):
+            style = style + e.get("style").strip() + ";"
+        if e.tag == "hr":
+            page_number = page_number + 1
+        elif e.tag == "div" and e.get("style"):
+            if "page-break-" in e.get("style"):
+                page_number = page_number + 1                    
+    return lines
+
+
+def legacy_process_text(parser: SECFilingContentParser):
+    """
+    Line model builder SECFilingContentParser.process_text replaced: one regex scan per line, then a
+    table pass that is quadratic in the number of lines.  Kept to benchmark and check against.
+    :param parser: parser holding a plain-text document
+    :return: list of line dicts
+    """
+    final_lines = []
+    style=None
+    item_number=None
+    element_position = None
+    page_number = 1
+    table_index = 1
+    table_index_place_holder = None
+    for i, e in enumerate(parser.raw_content):
+        item_num_search = re.search("^item\s+[0-9]+[A-Za-z]*", e.strip(), re.IGNORECASE)
+        if item_num_search:
+            numbers = re.search("[0-9]+[A-Za-z]*", e.strip(), re.IGNORECASE)
+            item_number = numbers.group(0)
+        page_num_search = re.search("<page>", e.strip(), re.IGNORECASE)
+        if page_num_search:
+            page_number = page_number + 1
+        table_start_index_search = re.search("[<]table[>]", e.strip(), re.IGNORECASE)
+        if table_start_index_search:
+            table_index_place_holder = table_index
+        table_end_index_search = re.search("[<][/]table[>]", e.strip(), re.IGNORECASE)
+        if table_end_index_search:
+            table_index_place_holder = None
+            table_index += 1
+        line_data = {"line_index": i, "element_index": element_position, "item_number": item_number, "page_number": page_number,\
+            "tag": None, "style": None, "content": e, "table_index": table_index_place_holder, "table_data": None}
+        final_lines.append(line_data)
+    table_dict = {}
+    for index, table in itertools.groupby(final_lines, key=lambda x: x['table_index']):
+        if index:
+            content = [tab['content'] for tab in list(table)]
+            try:
+                table_dict[index] = {}
+                table_dict[index]["table_data"] = TextTableParser(content).parse_table()
+                table_dict[index]["content"] = content    
+            except:
+                table_dict[index] = {}
+                table_dict[index]["table_data"] = content    
+                table_dict[index]["content"] = content
+    table_indicies = list(set([l['table_index'] for l in final_lines if l['table_index']]))
+    for ti in table_indicies:
+        first_line = [l for l in final_lines if l['table_index'] == ti][0]
+        index = final_lines.index(first_line)
+        new_line = first_line
+        new_line['tag'] = "table"
+        new_line['content'] = table_dict[new_line['table_index']]['content']
+        new_line['table_data'] = table_dict[new_line['table_index']]['table_data']
+        for l in final_lines:
+            if l['table_index'] == ti:
+                final_lines.remove(l)
+        final_lines.insert(index, new_line)
+    return final_lines
+
+
+def legacy_text_lines(lines):
+    """
+    Drop the table rows legacy_process_text leaves behind: it removes rows from its line list while
+    iterating over it, so every second row of a collapsed table survives as a stray line.
+    :param lines: lines from legacy_process_text
+    :return: list of line dicts comparable to process_text
+    """
+    return [line for line in lines if line["tag"] == "table" or line["table_index"] is None]
+
+
+def measure(method, repeat: int):
+    """
+    Time a line model builder and measure its peak traced memory.
+    :param method: callable building the line model, e.g., parser.process_html
+    :param repeat: number of timed runs
+    :return: tuple of best seconds and peak bytes
+    """
+    seconds = min(timeit.repeat(method, number=1, repeat=repeat))
+    tracemalloc.start()
+    method()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def run(path_list=None, repeat: int = 3):
+    """
+    Time both builders on each document, check they agree, and print timings and peak memory.
+    :param path_list: optional 10-K paths; synthetic documents are used if empty
+    :param repeat: number of timed runs per builder
+    :return: dict of results by document
+    """
+    if path_list:
+        documents = {}
+        for path in path_list:
+            with open(path, "rb") as document_file:
+                documents[path] = (document_file.read(), path.lower().endswith(".txt"))
+    else:
+        documents = {}
+        for size in [10, 40, 160]:
+            documents["synthetic-{0}".format(size)] = (build_10k_html(paragraphs_per_item=size, seed=size), False)
+        for size in [10, 40, 160]:
+            documents["synthetic-text-{0}".format(size)] = (build_10k_text(paragraphs_per_item=size, seed=size), True)
+
+    results = {}
+    for name, (document, is_text_file) in documents.items():
+        parser = SECFilingContentParser(document, is_text_file)
+        if is_text_file:
+            method, legacy_method = parser.process_text, lambda: legacy_process_text(parser)
+            assert method() == legacy_text_lines(legacy_method()), "Line models differ for {0}".format(name)
+        else:
+            method, legacy_method = parser.process_html, lambda: legacy_process_html(parser)
+            assert method() == legacy_method(), "Line models differ for {0}".format(name)
+        legacy_seconds, legacy_peak = measure(legacy_method, repeat)
+        seconds, peak = measure(method, repeat)
+        results[name] = {"bytes": len(document), "lines": len(parser.lines), "legacy_seconds": legacy_seconds,
+                         "seconds": seconds, "legacy_peak": legacy_peak, "peak": peak}
+        print("{0:<24}{1:>12,} bytes {2:>8,} lines  legacy {3:>7.3f}s {4:>10,.0f}KB  single-pass {5:>7.3f}s "
+              "{6:>10,.0f}KB  {7:>5.1f}x".format(name, len(document), len(parser.lines), legacy_seconds,
+                                                 legacy_peak / 1024, seconds, peak / 1024, legacy_seconds / seconds))
+    return results
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:])
@@ -0,0 +1,110 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Benchmark index parsing: header-derived boundaries in parse_index_buffer against the previous
+read_fwf(colspecs="infer") path.
+
+Usage: python -m openedgar.benchmarks.index_parser [row_count] [repeat]
+"""
+
+# Libraries
+import gzip
+import io
+import random
+import sys
+import timeit
+
+# Packages
+import pandas
+
+# Project imports
+import openedgar.parsers.edgar
+
+FORM_TYPE_LIST = ["10-K", "10-Q", "8-K", "SC 13G/A", "4", "S-1/A", "DEF 14A"]
+
+
+def build_form_index(row_count: int, seed: int = 0):
+    """
+    Build a synthetic daily form index with the EDGAR fixed-width layout.
+    :param row_count: number of data rows
+    :param seed: random seed
+    :return: index str
+    """
+    rng = random.Random(seed)
+    lines = ["Description:           Daily Index of EDGAR Dissemination Feed by Form Type",
+             "Last Data Received:    January 02, 2018",
+             "Comments:              webmaster@sec.gov",
+             "Anonymous FTP:         ftp://ftp.sec.gov/edgar/",
+             "", "", "", "",
+             "{0:<12}{1:<62}{2:<12}{3:<12}{4}".format("Form Type", "Company Name", "CIK", "Date Filed", "File Name"),
+             "-" * 141]
+    for i in range(row_count):
+        cik = rng.randint(1000, 1999999)
+        lines.append("{0:<12}{1:<62}{2:<12}{3:<12}{4}".format(
+            rng.choice(FORM_TYPE_LIST), "SAMPLE COMPANY {0} INC".format(i), cik, "20180102",
+            "edgar/data/{0}/{1:010d}-18-{2:06d}.txt".format(cik, cik, i)))
+    return "\n".join(lines) + "\n"
+
+
+def parse_index_buffer_fwf(index_buffer: str):
+    """
+    Previous implementation: re-assemble the buffer and infer column specs with read_fwf.
+    :param index_buffer: decoded index str
+    :return: data frame
+    """
+    header_line_pos = index_buffer.find("\nForm Type") + 1
+    separator_line_pos = index_buffer.find("-", header_line_pos + 1)
+    data_line_pos = index_buffer.find("\n", separator_line_pos + 1)
+    data_buffer = io.StringIO(index_buffer[header_line_pos:separator_line_pos].replace("\n", "\t")
+                              + index_buffer[data_line_pos:])
+    data_table = pandas.read_fwf(data_buffer, colspecs="infer", encoding="utf-8")
+    return data_table.loc[:, openedgar.parsers.edgar.INDEX_COLUMNS]
+
+
+def run(row_count: int = 100000, repeat: int = 3):
+    """
+    Time both parsers on the same synthetic index and print the best run of each.
+    :param row_count: number of index rows
+    :param repeat: number of timed runs per parser
+    :return: dict of best timings in seconds
+    """
+    index_buffer = build_form_index(row_count)
+    index_bytes = index_buffer.encode("utf-8")
+    index_gzip = gzip.compress(index_bytes)
+
+    results = {
+        "read_fwf": min(timeit.repeat(lambda: parse_index_buffer_fwf(index_buffer), number=1, repeat=repeat)),
+        "parse_index_buffer": min(timeit.repeat(lambda: openedgar.parsers.edgar.parse_index_buffer(index_bytes),
+                                                number=1, repeat=repeat)),
+        "parse_index_buffer (gzip)": min(timeit.repeat(
+            lambda: openedgar.parsers.edgar.parse_index_buffer(index_gzip), number=1, repeat=repeat)),
+    }
+    for name, seconds in results.items():
+        print("{0:<28}{1:>10.3f}s  {2:>12,.0f} rows/s".format(name, seconds, row_count / seconds))
+    return results
+
+
+if __name__ == "__main__":
+    run(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,105 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+"""
+Benchmark statement location: the compiled TermMatcher against searching each term with re.search,
+over the lines of synthetic 10-K documents and the statement term lists in openedgar.references.
+
+Usage: python -m openedgar.benchmarks.term_matcher [repeat]
+"""
+
+# Libraries
+import re
+import sys
+import timeit
+
+# Project imports
+import openedgar.references
+from openedgar.benchmarks.content_parser import build_10k_html, build_10k_text
+from openedgar.parsers.sec_filing_content_parser import SECFilingContentParser
+from openedgar.parsers.term_matcher import get_term_matcher
+
+TERM_LISTS = {"balance_sheet": openedgar.references.balance_sheet_terms,
+              "income_statement": openedgar.references.income_statement_terms,
+              "cash_flow_statement": openedgar.references.cash_flow_statement_terms,
+              "equity_statement": openedgar.references.equity_statement_terms,
+              "comprehensive_income": openedgar.references.comprehensive_income_terms}
+
+
+def line_texts(line):
+    """
+    Get the strings searched for a line: each cell of a table, or the line content.
+    :param line: line dict
+    :return: list of str
+    """
+    if line["tag"] == "table":
+        return [str(content_line) for content_line in line["content"]]
+    return [str(line["content"])]
+
+
+def search_each_term(lines, terms):
+    """
+    Find matching lines by searching each term in turn, as DocumentContent.execute_search used to.
+    :param lines: line dicts
+    :param terms: search terms
+    :return: list of matching lines
+    """
+    return [line for line in lines
+            if any(any([re.search(term, text, re.IGNORECASE) for term in terms]) for text in line_texts(line))]
+
+
+def search_matcher(lines, terms):
+    """
+    Find matching lines with the compiled term matcher.
+    :param lines: line dicts
+    :param terms: search terms
+    :return: list of matching lines
+    """
+    matcher = get_term_matcher(tuple(terms))
+    return [line for line in lines if any(matcher.matches_any(text) for text in line_texts(line))]
+
+
+def run(repeat: int = 3):
+    """
+    Time both searches for each statement term list, check they agree, and print timings.
+    :param repeat: number of timed runs
+    :return: dict of results by document and term list
+    """
+    documents = {"synthetic-160": (build_10k_html(paragraphs_per_item=160), False),
+                 "synthetic-text-160": (build_10k_text(paragraphs_per_item=160), True)}
+    results = {}
+    for name, (document, is_text_file) in documents.items():
+        lines = SECFilingContentParser(document, is_text_file).parse()
+        for statement, terms in TERM_LISTS.items():
+            assert search_each_term(lines, terms) == search_matcher(lines, terms)
+            each_seconds = min(timeit.repeat(lambda: search_each_term(lines, terms), number=1, repeat=repeat))
+            matcher_seconds = min(timeit.repeat(lambda: search_matcher(lines, terms), number=1, repeat=repeat))
+            results[(name, statement)] = {"each_seconds": each_seconds, "matcher_seconds": matcher_seconds}
+            print("{0:<20}{1:<22}{2:>8,} lines  per-term {3:>7.3f}s  matcher {4:>7.3f}s  {5:>5.1f}x"
+                  .format(name, statement, len(lines), each_seconds, matcher_seconds,
+                          each_seconds / matcher_seconds))
+    return results
+
+
+if __name__ == "__main__":
+    run(*[int(arg) for arg in sys.argv[1:2]])
@@ -21,3 +21,38 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+
+# Libraries
+import os
+
+# Client type used when CLIENT_TYPE is unset or empty
+DEFAULT_CLIENT_TYPE = "LOCAL"
+
+
+def get_client_type():
+    """
+    Get the configured storage client type from the CLIENT_TYPE environment variable.
+    :return: client type name, DEFAULT_CLIENT_TYPE if unset or empty
+    """
+    return os.environ.get("CLIENT_TYPE") or DEFAULT_CLIENT_TYPE
+
+
+def get_client(client_type: str = None):
+    """
+    Build the storage client for a client type: "S3" for S3Client, "SEGMENT" for the packed
+    SegmentClient, and LocalClient for anything else.
+    :param client_type: client type name; defaults to the configured get_client_type()
+    :return: storage client
+    """
+    if client_type is None:
+        client_type = get_client_type()
+
+    if client_type == "S3":
+        from openedgar.clients.s3 import S3Client
+        return S3Client()
+    elif client_type == "SEGMENT":
+        from openedgar.clients.segment import SegmentClient
+        return SegmentClient()
+    else:
+        from openedgar.clients.local import LocalClient
+        return LocalClient()
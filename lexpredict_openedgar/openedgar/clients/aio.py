@@ -0,0 +1,133 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import asyncio
+import concurrent.futures
+import logging
+from typing import Callable, Iterable, Union
+
+# Project
+from config.settings.base import STORAGE_MAX_CONCURRENCY
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+console.setFormatter(formatter)
+logger.addHandler(console)
+
+
+class AsyncStorageClient:
+    """
+    asyncio interface over a storage client (LocalClient, S3Client, SegmentClient or BlobStore).
+    Calls run on a shared thread pool and at most max_concurrency are in flight at once, so many
+    round-trips overlap instead of waiting on each other.  The S3 client shares one pooled,
+    thread-safe boto3 client across threads, so the pool size bounds open connections.
+    """
+
+    def __init__(self, client, max_concurrency: int = STORAGE_MAX_CONCURRENCY,
+                 executor: concurrent.futures.Executor = None):
+        """
+        :param client: synchronous storage client
+        :param max_concurrency: maximum number of calls in flight
+        :param executor: optional executor; a thread pool of max_concurrency threads by default
+        """
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency)
+        self.semaphores = {}
+
+    def get_semaphore(self):
+        """
+        Get the concurrency semaphore for the running event loop.
+        :return: asyncio.Semaphore
+        """
+        loop = asyncio.get_running_loop()
+        if loop not in self.semaphores:
+            self.semaphores = {loop: asyncio.Semaphore(self.max_concurrency)}
+        return self.semaphores[loop]
+
+    async def acall(self, func: Callable, *args, **kwargs):
+        """
+        Run a blocking storage call on the executor.
+        :param func: callable
+        :return: result of func
+        """
+        async with self.get_semaphore():
+            return await asyncio.get_running_loop().run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    async def aget_buffer(self, path: str, **kwargs):
+        return await self.acall(self.client.get_buffer, path, **kwargs)
+
+    async def aput_buffer(self, path: str, buffer: Union[bytes, str], **kwargs):
+        return await self.acall(self.client.put_buffer, path, buffer, **kwargs)
+
+    async def apath_exists(self, path: str):
+        return await self.acall(self.client.path_exists, path)
+
+    async def amap(self, func: Callable, args_list: Iterable[tuple], return_exceptions: bool = True):
+        """
+        Run a blocking call once per argument tuple, concurrently.
+        :param func: callable
+        :param args_list: argument tuples
+        :param return_exceptions: return exceptions in place of results instead of raising
+        :return: list of results in argument order
+        """
+        return await asyncio.gather(*[self.acall(func, *args) for args in args_list],
+                                    return_exceptions=return_exceptions)
+
+    async def aget_many(self, path_list: Iterable[str], return_exceptions: bool = True):
+        """
+        Retrieve many buffers concurrently.
+        :param path_list: storage paths
+        :param return_exceptions: return exceptions in place of buffers instead of raising
+        :return: list of buffers in path order
+        """
+        return await self.amap(self.client.get_buffer, [(path,) for path in path_list],
+                               return_exceptions=return_exceptions)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def map_concurrent(client, func: Callable, args_list: Iterable[tuple], max_concurrency: int = STORAGE_MAX_CONCURRENCY):
+    """
+    Synchronous entry point for tasks: run a storage call per argument tuple concurrently.
+    :param client: synchronous storage client
+    :param func: callable, usually a bound method of client
+    :param args_list: argument tuples
+    :param max_concurrency: maximum number of calls in flight
+    :return: list of results or exceptions in argument order
+    """
+    with AsyncStorageClient(client, max_concurrency=max_concurrency) as async_client:
+        return asyncio.run(async_client.amap(func, args_list))
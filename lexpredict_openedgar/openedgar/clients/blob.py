@@ -0,0 +1,355 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import atexit
+import hashlib
+import logging
+import math
+import os
+import pathlib
+import struct
+import threading
+from typing import Iterable, Union
+
+# Packages
+import botocore.exceptions
+import numpy
+
+# Project
+from config.settings.base import BLOB_RAW_CODEC, BLOB_TEXT_CODEC, BLOB_BLOOM_PATH, BLOB_BLOOM_CAPACITY, \
+    BLOB_BLOOM_ERROR_RATE
+import openedgar.clients.compression
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+console.setFormatter(formatter)
+logger.addHandler(console)
+
+BLOOM_MAGIC = b"OEBLOOM1"
+BLOOM_SAVE_INTERVAL = 10000
+
+
+class BloomFilter:
+    """
+    Bloom filter over blob keys, optionally persisted to disk.  The filter is kept per host and
+    starts empty, so it only knows the keys added through it; a negative answer is a hint unless
+    the filter is complete, i.e., was seeded from a listing of the store.  A positive answer may be
+    false and still needs to be confirmed against the store.
+    """
+
+    def __init__(self, capacity: int = BLOB_BLOOM_CAPACITY, error_rate: float = BLOB_BLOOM_ERROR_RATE,
+                 path: str = None):
+        """
+        :param capacity: expected number of keys
+        :param error_rate: target false positive rate at capacity
+        :param path: optional file to load from and save to
+        """
+        self.bit_count = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.bit_count += -self.bit_count % 8
+        self.hash_count = max(1, int(round(self.bit_count / capacity * math.log(2))))
+        self.path = path
+        self.bits = numpy.zeros(self.bit_count // 8, dtype=numpy.uint8)
+        self.unsaved_count = 0
+        # Set by seed; not persisted, as other hosts may have written to the store since
+        self.complete = False
+        self.lock = threading.Lock()
+        if self.path is not None:
+            self.load()
+
+    def positions(self, key: str):
+        """
+        Bit positions for a key by double hashing its SHA1 digest.
+        :param key: key string
+        :return: list of bit positions
+        """
+        digest = hashlib.sha1(key.encode("utf-8")).digest()
+        h1, h2 = struct.unpack_from("<QQ", digest)
+        return [(h1 + i * (h2 | 1)) % self.bit_count for i in range(self.hash_count)]
+
+    def __contains__(self, key: str):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self.positions(key))
+
+    def add(self, key: str):
+        """
+        Add a key, saving to disk every BLOOM_SAVE_INTERVAL additions.
+        :param key: key string
+        :return:
+        """
+        with self.lock:
+            for p in self.positions(key):
+                self.bits[p >> 3] |= 1 << (p & 7)
+            self.unsaved_count += 1
+            save = self.path is not None and self.unsaved_count >= BLOOM_SAVE_INTERVAL
+        if save:
+            self.save()
+
+    def seed(self, keys: Iterable[str]):
+        """
+        Add every key of a store listing and mark the filter complete, so negative answers are definite.
+        :param keys: all keys in the store
+        :return:
+        """
+        for key in keys:
+            self.add(key)
+        self.complete = True
+
+    def read(self):
+        """
+        Read the bit array saved at path if it matches this filter's size.
+        :return: numpy array or None
+        """
+        try:
+            with open(self.path, "rb") as bloom_file:
+                header = bloom_file.read(len(BLOOM_MAGIC) + 16)
+                if len(header) < len(BLOOM_MAGIC) + 16 or not header.startswith(BLOOM_MAGIC):
+                    return None
+                bit_count, hash_count = struct.unpack_from("<QQ", header, len(BLOOM_MAGIC))
+                if bit_count != self.bit_count or hash_count != self.hash_count:
+                    logger.warning("Ignoring bloom filter {0} with different parameters".format(self.path))
+                    return None
+                return numpy.frombuffer(bloom_file.read(), dtype=numpy.uint8).copy()
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        """
+        Merge the saved filter into memory.
+        :return:
+        """
+        saved_bits = self.read()
+        if saved_bits is not None and saved_bits.shape == self.bits.shape:
+            with self.lock:
+                numpy.bitwise_or(self.bits, saved_bits, out=self.bits)
+
+    def save(self):
+        """
+        Merge with the saved filter, so concurrent processes do not drop each other's keys,
+        and atomically replace it.
+        :return:
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            saved_bits = self.read()
+            if saved_bits is not None and saved_bits.shape == self.bits.shape:
+                numpy.bitwise_or(self.bits, saved_bits, out=self.bits)
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temp_path = "{0}.{1}.{2}.tmp".format(self.path, os.getpid(), threading.get_ident())
+            with open(temp_path, "wb") as bloom_file:
+                bloom_file.write(BLOOM_MAGIC)
+                bloom_file.write(struct.pack("<QQ", self.bit_count, self.hash_count))
+                bloom_file.write(self.bits.tobytes())
+            os.replace(temp_path, self.path)
+            self.unsaved_count = 0
+
+
+class BlobStore:
+    """
+    Content-addressed store for raw and text document contents on a Local or S3 client.  Blobs live
+    at <root>/<kind>/ab/cd/<sha1>, with reads falling back to the legacy flat <root>/<kind>/<sha1>
+    path.  Writes skip the existence round-trip only when a complete bloom filter has never seen the blob.
+    Blobs are encoded with a per-kind codec and its header, so readers detect the codec.
+    """
+
+    def __init__(self, client, root: str, codecs: dict = None, bloom_filter: BloomFilter = None):
+        """
+        :param client: LocalClient or S3Client
+        :param root: storage root containing raw/ and text/
+        :param codecs: codec name by kind; defaults to BLOB_RAW_CODEC and BLOB_TEXT_CODEC
+        :param bloom_filter: bloom filter of stored keys; defaults to the process-wide filter
+        """
+        self.client = client
+        self.root = root
+        codecs = codecs if codecs is not None else {"raw": BLOB_RAW_CODEC, "text": BLOB_TEXT_CODEC}
+        self.codecs = {kind: openedgar.clients.compression.get_codec(name) for kind, name in codecs.items()}
+        self.bloom_filter = bloom_filter if bloom_filter is not None else get_bloom_filter()
+        self.stats = {"puts": 0, "stored": 0, "deduped": 0, "bytes_in": 0, "bytes_new": 0, "bytes_stored": 0}
+        self.stats_lock = threading.Lock()
+
+    def path(self, kind: str, sha1: str):
+        """
+        Sharded storage path for a blob.
+        :param kind: raw or text
+        :param sha1: content hash
+        :return: path
+        """
+        return pathlib.Path(self.root, kind, sha1[0:2], sha1[2:4], sha1).as_posix()
+
+    def legacy_path(self, kind: str, sha1: str):
+        """
+        Flat storage path used before sharding.
+        :param kind: raw or text
+        :param sha1: content hash
+        :return: path
+        """
+        return pathlib.Path(self.root, kind, sha1).as_posix()
+
+    def exists(self, kind: str, sha1: str):
+        """
+        Check whether a blob is stored, consulting the bloom filter first.
+        :param kind: raw or text
+        :param sha1: content hash
+        :return: true if stored at the sharded or legacy path
+        """
+        key = "{0}/{1}".format(kind, sha1)
+        if self.bloom_filter.complete and key not in self.bloom_filter:
+            return False
+        stored = self.client.path_exists(self.path(kind, sha1)) or \
+            self.client.path_exists(self.legacy_path(kind, sha1))
+        if stored and key not in self.bloom_filter:
+            self.bloom_filter.add(key)
+        return stored
+
+    def exists_many(self, kind: str, sha1_list: Iterable[str]):
+        """
+        Check many blobs with the client's batched paths_exist, consulting the bloom filter first.
+        :param kind: raw or text
+        :param sha1_list: content hashes
+        :return: set of hashes stored at the sharded or legacy path
+        """
+        candidates = set(sha1_list)
+        if self.bloom_filter.complete:
+            candidates = {sha1 for sha1 in candidates if "{0}/{1}".format(kind, sha1) in self.bloom_filter}
+        if len(candidates) == 0:
+            return set()
+
+        sharded = self.client.paths_exist([self.path(kind, sha1) for sha1 in candidates])
+        stored = {sha1 for sha1 in candidates if sharded[self.path(kind, sha1)]}
+        remaining = candidates - stored
+        if len(remaining) > 0:
+            legacy = self.client.paths_exist([self.legacy_path(kind, sha1) for sha1 in remaining])
+            stored.update(sha1 for sha1 in remaining if legacy[self.legacy_path(kind, sha1)])
+        for sha1 in stored:
+            key = "{0}/{1}".format(kind, sha1)
+            if key not in self.bloom_filter:
+                self.bloom_filter.add(key)
+        return stored
+
+    def seed_bloom_filter(self, sha1_lists: dict):
+        """
+        Seed the bloom filter from a listing of the store, after which its negative answers are trusted.
+        :param sha1_lists: iterable of stored content hashes by kind
+        :return:
+        """
+        self.bloom_filter.seed("{0}/{1}".format(kind, sha1) for kind, sha1_list in sha1_lists.items()
+                               for sha1 in sha1_list)
+
+    def put(self, kind: str, sha1: str, buffer: Union[bytes, str], exists: bool = None):
+        """
+        Store a blob unless already present.
+        :param kind: raw or text
+        :param sha1: content hash of the document
+        :param buffer: contents; str is stored as UTF-8
+        :param exists: result of an earlier exists_many check, to skip the per-blob check
+        :return: true if newly stored, false if deduplicated
+        """
+        if isinstance(buffer, str):
+            buffer = buffer.encode("utf-8")
+        key = "{0}/{1}".format(kind, sha1)
+
+        if exists is None:
+            exists = self.exists(kind, sha1)
+        if exists:
+            self.count(deduped=1, puts=1, bytes_in=len(buffer))
+            return False
+
+        # Encode here rather than in the client so each kind keeps its own codec
+        codec = self.codecs.get(kind, openedgar.clients.compression.CODECS["none"])
+        stored_buffer = openedgar.clients.compression.encode(buffer, codec)
+        self.client.put_buffer(self.path(kind, sha1), stored_buffer, codec="none")
+        self.bloom_filter.add(key)
+        self.count(stored=1, puts=1, bytes_in=len(buffer), bytes_new=len(buffer), bytes_stored=len(stored_buffer))
+        return True
+
+    def get(self, kind: str, sha1: str):
+        """
+        Retrieve a blob from the sharded path, falling back to the legacy flat path.
+        :param kind: raw or text
+        :param sha1: content hash
+        :return: decompressed contents; clients decode the codec header
+        """
+        path = self.path(kind, sha1)
+        try:
+            buffer = self.client.get_buffer(path)
+        except (OSError, botocore.exceptions.ClientError):
+            path = self.legacy_path(kind, sha1)
+            buffer = self.client.get_buffer(path)
+        return buffer
+
+    def count(self, **kwargs):
+        """
+        Add to store statistics.
+        :return:
+        """
+        with self.stats_lock:
+            for key, value in kwargs.items():
+                self.stats[key] += value
+
+    def dedupe_report(self):
+        """
+        Summarize deduplication and compression since the store was created.
+        :return: dict of counts and ratios
+        """
+        with self.stats_lock:
+            report = dict(self.stats)
+        report["dedupe_ratio"] = report["deduped"] / report["puts"] if report["puts"] else 0.0
+        report["bytes_deduped"] = report["bytes_in"] - report["bytes_new"]
+        report["compression_ratio"] = report["bytes_stored"] / report["bytes_new"] if report["bytes_new"] else 1.0
+        return report
+
+
+# Process-wide bloom filters by path
+_bloom_filters = {}
+_bloom_lock = threading.Lock()
+
+
+def save_bloom_filters():
+    """
+    Save all open bloom filters, e.g., at exit.
+    :return:
+    """
+    for bloom_filter in list(_bloom_filters.values()):
+        bloom_filter.save()
+
+
+def get_bloom_filter(path: str = BLOB_BLOOM_PATH):
+    """
+    Get the process-wide bloom filter for a path, loading it on first use or after a fork.
+    :param path: bloom filter file
+    :return: BloomFilter
+    """
+    key = (path, os.getpid())
+    with _bloom_lock:
+        if key not in _bloom_filters:
+            if len(_bloom_filters) == 0:
+                atexit.register(save_bloom_filters)
+            _bloom_filters[key] = BloomFilter(path=path)
+        return _bloom_filters[key]
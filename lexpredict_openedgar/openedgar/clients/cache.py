@@ -0,0 +1,192 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Project
+from config.settings.base import HTTP_CACHE_PATH, HTTP_CACHE_TTL, HTTP_CACHE_MAX_BYTES
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+console.setFormatter(formatter)
+logger.addHandler(console)
+
+
+class HTTPCacheEntry:
+    """
+    Cached response body and validators for a single URL.
+    """
+
+    def __init__(self, url: str, body: bytes, etag: str, last_modified: str, fetched_at: float):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def is_fresh(self, ttl: float):
+        """
+        Check whether the entry can be served without revalidating.
+        :param ttl: time to live in seconds
+        :return: true if fetched within ttl
+        """
+        return time.time() - self.fetched_at < ttl
+
+    def conditional_headers(self):
+        """
+        Build revalidation headers from the stored validators.
+        :return: dict of If-None-Match/If-Modified-Since headers
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HTTPCache:
+    """
+    Persistent SQLite-backed HTTP cache keyed by URL, storing ETag/Last-Modified validators
+    with TTL revalidation and least-recently-used eviction once max_bytes is exceeded.
+    """
+
+    def __init__(self, path: str = HTTP_CACHE_PATH, ttl: float = HTTP_CACHE_TTL, max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        """
+        :param path: SQLite database path
+        :param ttl: seconds an entry is served without revalidation
+        :param max_bytes: maximum total size of cached bodies
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        dir_name = os.path.dirname(path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name, exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS http_cache ("
+                                    "url TEXT PRIMARY KEY, body BLOB, etag TEXT, last_modified TEXT, "
+                                    "size INTEGER, fetched_at REAL, accessed_at REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS http_cache_accessed_at "
+                                    "ON http_cache (accessed_at)")
+
+    def get(self, url: str):
+        """
+        Get the cached entry for a URL.
+        :param url: absolute URL
+        :return: HTTPCacheEntry or None
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT body, etag, last_modified, fetched_at FROM http_cache "
+                                          "WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE http_cache SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        return HTTPCacheEntry(url, bytes(row[0]), row[1], row[2], row[3])
+
+    def put(self, url: str, body: bytes, etag: str = None, last_modified: str = None):
+        """
+        Store a response body and its validators, evicting old entries if over max_bytes.
+        :param url: absolute URL
+        :param body: response body
+        :param etag: ETag response header
+        :param last_modified: Last-Modified response header
+        :return:
+        """
+        if len(body) > self.max_bytes:
+            logger.info("Not caching {0}; {1} bytes exceeds cache size".format(url, len(body)))
+            return
+
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO http_cache "
+                                    "(url, body, etag, last_modified, size, fetched_at, accessed_at) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (url, body, etag, last_modified, len(body), now, now))
+            self.evict()
+
+    def touch(self, url: str):
+        """
+        Mark an entry as revalidated, e.g., after a 304 Not Modified.
+        :param url: absolute URL
+        :return:
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE http_cache SET fetched_at = ?, accessed_at = ? WHERE url = ?",
+                                    (now, now, url))
+
+    def evict(self):
+        """
+        Remove least recently used entries until total size is within max_bytes; caller holds the lock.
+        :return:
+        """
+        total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        for url, size in self.connection.execute("SELECT url, size FROM http_cache ORDER BY accessed_at").fetchall():
+            self.connection.execute("DELETE FROM http_cache WHERE url = ?", (url,))
+            total_size -= size
+            if total_size <= self.max_bytes:
+                break
+
+    def size(self):
+        """
+        Get the total size of cached bodies.
+        :return: bytes
+        """
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Get the process-wide HTTP cache, opening it on first use or after a fork.
+    :return: HTTPCache
+    """
+    global _cache, _cache_pid  # pylint: disable=global-statement
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = HTTPCache()
+            _cache_pid = os.getpid()
+        return _cache
@@ -0,0 +1,295 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import logging
+import zlib
+from typing import Union
+
+# Packages
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+console.setFormatter(formatter)
+logger.addHandler(console)
+
+# Stored objects start with HEADER_MAGIC and a codec id byte; the leading 0x89 cannot begin a text filing.
+# The "none" codec writes no header, so uncompressed objects stay byte-identical to the original.
+HEADER_MAGIC = b"\x89OEC"
+HEADER_SIZE = len(HEADER_MAGIC) + 1
+# Headerless buffers are treated as zlib only if this much of them inflates cleanly
+ZLIB_PROBE_SIZE = 1024
+ZSTD_FRAME_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class IdentityStream:
+    """
+    Pass-through stream object for the none codec.
+    """
+
+    def compress(self, data: bytes):
+        return data
+
+    def decompress(self, data: bytes):
+        return data
+
+    def flush(self):
+        return b""
+
+
+class LZ4CompressStream:
+    """
+    Adapt LZ4FrameCompressor to the compressobj interface.
+    """
+
+    def __init__(self, level: int):
+        self.compressor = lz4.frame.LZ4FrameCompressor(compression_level=level)
+        self.header = self.compressor.begin()
+
+    def compress(self, data: bytes):
+        header, self.header = self.header, b""
+        return header + self.compressor.compress(data)
+
+    def flush(self):
+        header, self.header = self.header, b""
+        return header + self.compressor.flush()
+
+
+class LZ4DecompressStream:
+    """
+    Adapt LZ4FrameDecompressor to the decompressobj interface.
+    """
+
+    def __init__(self):
+        self.decompressor = lz4.frame.LZ4FrameDecompressor()
+
+    def decompress(self, data: bytes):
+        return self.decompressor.decompress(data)
+
+    def flush(self):
+        return b""
+
+
+class ZstdDecompressStream:
+    """
+    Adapt the zstandard decompressobj to the zlib decompressobj interface.
+    """
+
+    def __init__(self):
+        self.decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes):
+        return self.decompressor.decompress(data)
+
+    def flush(self):
+        return b""
+
+
+class Codec:
+    """
+    Compression codec with one-shot and streaming interfaces.
+    """
+
+    def __init__(self, name: str, codec_id: int, default_level: int, available: bool = True):
+        self.name = name
+        self.codec_id = codec_id
+        self.default_level = default_level
+        self.available = available
+
+    @property
+    def header(self):
+        """
+        Header written before encoded payloads; empty for the none codec.
+        :return: bytes
+        """
+        return b"" if self.name == "none" else HEADER_MAGIC + bytes([self.codec_id])
+
+    def check(self):
+        if not self.available:
+            raise RuntimeError("Compression codec {0} is not installed".format(self.name))
+
+    def compress(self, buffer: bytes, level: int = None):
+        """
+        Compress a buffer without header.
+        :param buffer: bytes
+        :param level: compression level; codec default if None
+        :return: bytes
+        """
+        stream = self.compressobj(level)
+        return stream.compress(buffer) + stream.flush()
+
+    def decompress(self, buffer: bytes):
+        """
+        Decompress a buffer without header.
+        :param buffer: bytes
+        :return: bytes
+        """
+        self.check()
+        if self.name == "none":
+            return bytes(buffer)
+        elif self.name == "zlib":
+            return zlib.decompress(buffer)
+        elif self.name == "gzip":
+            return zlib.decompress(buffer, 16 + zlib.MAX_WBITS)
+        elif self.name == "zstd":
+            # Streamed frames carry no content size, so always decode through a decompressobj
+            return ZstdDecompressStream().decompress(bytes(buffer))
+        return lz4.frame.decompress(bytes(buffer))
+
+    def compressobj(self, level: int = None):
+        """
+        Streaming compressor with compress(data) and flush().
+        :param level: compression level; codec default if None
+        :return: stream object
+        """
+        self.check()
+        level = self.default_level if level is None else level
+        if self.name == "none":
+            return IdentityStream()
+        elif self.name == "zlib":
+            return zlib.compressobj(level)
+        elif self.name == "gzip":
+            return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif self.name == "zstd":
+            return zstandard.ZstdCompressor(level=level).compressobj()
+        return LZ4CompressStream(level)
+
+    def decompressobj(self):
+        """
+        Streaming decompressor with decompress(data) and flush().
+        :return: stream object
+        """
+        self.check()
+        if self.name == "none":
+            return IdentityStream()
+        elif self.name == "zlib":
+            return zlib.decompressobj()
+        elif self.name == "gzip":
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.name == "zstd":
+            return ZstdDecompressStream()
+        return LZ4DecompressStream()
+
+
+CODECS = {codec.name: codec for codec in [
+    Codec("none", 0, 0),
+    Codec("zlib", 1, 6),
+    Codec("gzip", 2, 6),
+    Codec("zstd", 3, 3, available=zstandard is not None),
+    Codec("lz4", 4, 0, available=lz4 is not None),
+]}
+CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+
+
+def get_codec(name: str, fallback: str = "zlib"):
+    """
+    Get a codec by name, falling back if its library is not installed.
+    :param name: none, zlib, gzip, zstd or lz4; empty means none
+    :param fallback: codec to use if the requested one is unavailable
+    :return: Codec
+    """
+    codec = CODECS.get(name or "none")
+    if codec is None:
+        raise ValueError("Unknown compression codec: {0}".format(name))
+    if not codec.available:
+        logger.warning("Compression codec {0} is not installed; using {1}".format(name, fallback))
+        codec = CODECS[fallback]
+    return codec
+
+
+def is_zlib_stream(buffer: bytes):
+    """
+    Check for a zlib stream: a deflate header with a valid header checksum whose first
+    ZLIB_PROBE_SIZE bytes also inflate.  The two header bytes alone match ordinary text, e.g. b"80".
+    :param buffer: stored bytes
+    :return: true if buffer looks like zlib output
+    """
+    if len(buffer) < 2 or buffer[0] & 0x0F != 8 or (buffer[0] * 256 + buffer[1]) % 31 != 0:
+        return False
+    try:
+        zlib.decompressobj().decompress(bytes(buffer[:ZLIB_PROBE_SIZE]))
+    except zlib.error:
+        return False
+    return True
+
+
+def detect_codec(buffer: bytes, legacy: str = None):
+    """
+    Identify the codec of a stored buffer from its header.
+    :param buffer: stored bytes, or at least the first HEADER_SIZE of them
+    :param legacy: codec for buffers without a header; "zlib" applies only if the buffer looks like a
+    zlib stream, as for S3 objects written before codec headers
+    :return: tuple of Codec, header length
+    """
+    if buffer[0:len(HEADER_MAGIC)] == HEADER_MAGIC and len(buffer) >= HEADER_SIZE:
+        codec = CODECS_BY_ID.get(buffer[len(HEADER_MAGIC)])
+        if codec is None:
+            raise ValueError("Unknown compression codec id: {0}".format(buffer[len(HEADER_MAGIC)]))
+        return codec, HEADER_SIZE
+    if legacy == "zlib" and not is_zlib_stream(buffer):
+        legacy = None
+    return CODECS[legacy or "none"], 0
+
+
+def encode(buffer: Union[bytes, str], codec: Union[Codec, str] = "none", level: int = None):
+    """
+    Compress a buffer and prefix the codec header.
+    :param buffer: bytes or str, stored as UTF-8
+    :param codec: Codec or codec name
+    :param level: compression level; codec default if None
+    :return: bytes
+    """
+    if isinstance(buffer, str):
+        buffer = buffer.encode("utf-8")
+    if not isinstance(codec, Codec):
+        codec = get_codec(codec)
+    if codec.name == "none":
+        return buffer
+    return codec.header + codec.compress(buffer, level)
+
+
+def decode(buffer: bytes, legacy: str = None):
+    """
+    Decompress a stored buffer, detecting its codec from the header.
+    :param buffer: stored bytes
+    :param legacy: codec assumed for buffers without a header
+    :return: bytes
+    """
+    codec, header_size = detect_codec(buffer, legacy)
+    if codec.name == "none":
+        return buffer
+    return codec.decompress(memoryview(buffer)[header_size:])
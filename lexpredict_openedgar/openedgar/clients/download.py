@@ -0,0 +1,326 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from typing import Iterable
+
+# Packages
+import dateutil.parser
+import requests
+import requests.adapters
+
+# Project
+from config.settings.base import HTTP_SEC_HOST, HTTP_FAIL_SLEEP, HTTP_SLEEP_DEFAULT, HTTP_SEC_RATE_LIMIT, \
+    HTTP_SEC_USER_AGENT, HTTP_MAX_WORKERS
+import openedgar.clients.payload
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+console.setFormatter(formatter)
+logger.addHandler(console)
+
+
+class RateLimitedError(RuntimeError):
+    """
+    Raised when EDGAR keeps answering with its rate threshold page after all retries.
+    """
+    pass
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the request rate shared by every worker.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        :param rate: tokens added per second
+        :param capacity: maximum burst size; defaults to one second of tokens
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available and take it.
+        :return:
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class DownloadEngine:
+    """
+    EDGAR download engine with a pooled keep-alive session, a shared token-bucket rate limit,
+    bounded thread concurrency and a global back-off when EDGAR reports its rate threshold.
+    """
+
+    def __init__(self, base_path: str = HTTP_SEC_HOST, rate: float = HTTP_SEC_RATE_LIMIT,
+                 max_workers: int = HTTP_MAX_WORKERS, fail_sleep: Iterable[float] = HTTP_FAIL_SLEEP,
+                 user_agent: str = HTTP_SEC_USER_AGENT):
+        """
+        :param base_path: base URL to resolve relative paths against
+        :param rate: maximum requests per second across all threads
+        :param max_workers: maximum concurrent requests
+        :param fail_sleep: back-off schedule in seconds; its length is the retry limit
+        :param user_agent: User-Agent header declared to EDGAR
+        """
+        self.base_path = base_path
+        self.max_workers = max_workers
+        self.fail_sleep = list(fail_sleep)
+        self.limiter = TokenBucket(rate)
+
+        # Pooled keep-alive session shared by all workers
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": user_agent, "Accept-Encoding": "gzip, deflate"})
+
+        # Global back-off shared by all workers
+        self.backoff_lock = threading.Lock()
+        self.backoff_until = 0.0
+        self.backoff_count = 0
+
+    def backoff(self, delay: float):
+        """
+        Pause every worker for at least delay seconds.
+        :param delay: seconds to pause
+        :return:
+        """
+        with self.backoff_lock:
+            self.backoff_until = max(self.backoff_until, time.monotonic() + delay)
+            self.backoff_count += 1
+
+    def wait(self):
+        """
+        Wait out any global back-off, then take a token from the rate limiter.
+        :return:
+        """
+        while True:
+            with self.backoff_lock:
+                remaining = self.backoff_until - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(remaining)
+        self.limiter.acquire()
+
+    def get_url(self, remote_path: str, base_path: str = None):
+        """
+        Build the absolute URL for a remote path.
+        :param remote_path: remote path on EDGAR
+        :param base_path: base path to prepend if not the engine default
+        :return: URL
+        """
+        return urllib.parse.urljoin(base_path or self.base_path, remote_path.lstrip("/"))
+
+    def get(self, remote_path: str, base_path: str = None, headers: dict = None):
+        """
+        Retrieve a remote path to memory, retrying on errors and backing off globally
+        when EDGAR returns its rate threshold page.
+        :param remote_path: remote path on EDGAR to retrieve
+        :param base_path: base path to prepend if not default EDGAR path
+        :param headers: optional extra request headers
+        :return: requests.Response, or None if every attempt failed with a connection error
+        """
+        remote_uri = self.get_url(remote_path, base_path)
+        failures = 0
+
+        while True:
+            self.wait()
+            try:
+                response = self.session.get(remote_uri, headers=headers)
+                if openedgar.clients.payload.classify_payload(response.content, response.headers.get("Content-Type"),
+                                                              response.status_code) == "rate_limited":
+                    if failures >= len(self.fail_sleep):
+                        raise RateLimitedError("Exceeded SEC request rate threshold; invalid data retrieved")
+                    logger.warning("Rate limited on {0}; backing off all workers for {1}s"
+                                   .format(remote_path, self.fail_sleep[failures]))
+                    self.backoff(self.fail_sleep[failures])
+                    failures += 1
+                    continue
+                if response.status_code >= 500:
+                    raise requests.HTTPError("HTTP {0}".format(response.status_code), response=response)
+
+                # Sleep if set gt0
+                if HTTP_SLEEP_DEFAULT > 0:
+                    time.sleep(HTTP_SLEEP_DEFAULT)
+                return response
+            except RateLimitedError:
+                raise
+            except Exception as e:  # pylint: disable=broad-except
+                # Handle and sleep
+                if failures < len(self.fail_sleep):
+                    logger.warning("File {0}, failure {1}: {2}".format(remote_path, failures, e))
+                    time.sleep(self.fail_sleep[failures])
+                    failures += 1
+                else:
+                    logger.error("File {0}, failure {1}: {2}".format(remote_path, failures, e))
+                    return None
+
+    def get_buffer(self, remote_path: str, base_path: str = None, cache=None):
+        """
+        Retrieve a remote path to memory.
+        :param remote_path: remote path on EDGAR to retrieve
+        :param base_path: base path to prepend if not default EDGAR path
+        :param cache: optional HTTPCache to serve and revalidate the response from
+        :return: file_buffer, last_modified_date
+        """
+        if cache is None:
+            response = self.get(remote_path, base_path)
+            if response is None:
+                return None, None
+            check_response(response)
+            return response.content, get_last_modified_date(response, remote_path)
+
+        # Serve fresh entries directly and revalidate stale ones with a conditional GET
+        remote_uri = self.get_url(remote_path, base_path)
+        entry = cache.get(remote_uri)
+        if entry is not None and entry.is_fresh(cache.ttl):
+            return entry.body, parse_last_modified_date(entry.last_modified, remote_path)
+
+        response = self.get(remote_path, base_path,
+                            headers=entry.conditional_headers() if entry is not None else None)
+        if response is None:
+            if entry is not None:
+                logger.warning("Serving stale cached copy of {0}".format(remote_path))
+                return entry.body, parse_last_modified_date(entry.last_modified, remote_path)
+            return None, None
+
+        if response.status_code == 304 and entry is not None:
+            cache.touch(remote_uri)
+            return entry.body, parse_last_modified_date(entry.last_modified, remote_path)
+
+        # Error pages are never cached or returned as contents
+        check_response(response)
+        if response.status_code == 200:
+            cache.put(remote_uri, response.content, response.headers.get("ETag"),
+                      response.headers.get("Last-Modified"))
+        return response.content, get_last_modified_date(response, remote_path)
+
+    def map_buffers(self, remote_paths: Iterable[str], base_path: str = None, cache=None):
+        """
+        Retrieve many remote paths concurrently, bounded by max_workers and the shared rate limit.
+        At most max_workers * 2 requests are submitted ahead of the consumer, and each result is
+        dropped once yielded, so memory is bounded by the window rather than the whole path list.
+        :param remote_paths: remote paths on EDGAR to retrieve
+        :param base_path: base path to prepend if not default EDGAR path
+        :param cache: optional HTTPCache to serve and revalidate responses from
+        :return: generator of (remote_path, file_buffer, last_modified_date, error) in completion order
+        """
+        remote_path_iter = iter(remote_paths)
+        window_size = self.max_workers * 2
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+            while True:
+                for remote_path in remote_path_iter:
+                    pending[executor.submit(self.get_buffer, remote_path, base_path, cache)] = remote_path
+                    if len(pending) >= window_size:
+                        break
+                if len(pending) == 0:
+                    return
+
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    remote_path = pending.pop(future)
+                    try:
+                        file_buffer, last_modified_date = future.result()
+                        yield remote_path, file_buffer, last_modified_date, None
+                    except Exception as e:  # pylint: disable=broad-except
+                        yield remote_path, None, None, e
+
+
+def check_response(response):
+    """
+    Raise BadPayloadError if a response is an error page, judging from its status, Content-Type
+    and first bytes.
+    :param response: requests.Response
+    :return:
+    """
+    openedgar.clients.payload.check_payload(response.content, response.headers.get("Content-Type"),
+                                            response.status_code)
+
+
+def get_last_modified_date(response, remote_path: str = None):
+    """
+    Parse the Last-Modified header of a response.
+    :param response: requests.Response
+    :param remote_path: path for logging
+    :return: date or None
+    """
+    return parse_last_modified_date(response.headers.get('Last-Modified'), remote_path)
+
+
+def parse_last_modified_date(last_modified: str, remote_path: str = None):
+    """
+    Parse a Last-Modified header value.
+    :param last_modified: header value or None
+    :param remote_path: path for logging
+    :return: date or None
+    """
+    if last_modified:
+        try:
+            return dateutil.parser.parse(last_modified).date()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Unable to update last modified date for {0}: {1}".format(remote_path, e))
+    return None
+
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Get the process-wide download engine, creating it on first use or after a fork.
+    :return: DownloadEngine
+    """
+    global _engine, _engine_pid  # pylint: disable=global-statement
+    with _engine_lock:
+        if _engine is None or _engine_pid != os.getpid():
+            _engine = DownloadEngine()
+            _engine_pid = os.getpid()
+        return _engine
@@ -23,21 +23,24 @@ SOFTWARE.
 """
 
 # Libraries
+import datetime
 import logging
 import urllib.parse
-import time
 
 # Packages
-import dateutil.parser
 import lxml.html
 import requests
 from openedgar.parsers.html_table_parser import HTMLTableParser
 import pandas
 import re
 # Project
-from typing import Union
+from typing import Iterable, Union
 import itertools
-from config.settings.base import HTTP_SEC_HOST, HTTP_FAIL_SLEEP, HTTP_SEC_INDEX_PATH, HTTP_SLEEP_DEFAULT
+import openedgar.clients.cache
+import openedgar.clients.download
+import openedgar.clients.payload
+import openedgar.parsers.edgar
+from config.settings.base import HTTP_SEC_HOST, HTTP_SEC_INDEX_PATH
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -49,64 +52,61 @@ console.setFormatter(formatter)
 logger.addHandler(console)
 
 
-def get_buffer(remote_path: str, base_path: str = HTTP_SEC_HOST):
+def get_buffer(remote_path: str, base_path: str = HTTP_SEC_HOST, use_cache: bool = False):
     """
-    Retrieve a remote path to memory.
+    Retrieve a remote path to memory through the shared download engine.
     :param remote_path: remote path on EDGAR to retrieve
     :param base_path: base path to prepend if not default EDGAR path
+    :param use_cache: whether to serve and revalidate through the persistent HTTP cache
     :return: file_buffer, last_modified_date
     """
     # Log entrance
     logger.info("Retrieving remote path {0} to memory".format(remote_path))
 
-    # Build URL
-    remote_uri = urllib.parse.urljoin(base_path, remote_path.lstrip("/"))
+    cache = openedgar.clients.cache.get_cache() if use_cache else None
+    file_buffer, last_modified_date = openedgar.clients.download.get_engine().get_buffer(remote_path, base_path,
+                                                                                       cache=cache)
+    if file_buffer is None:
+        return file_buffer, last_modified_date
 
-    # Try to retrieve the file
-    complete = False
-    failures = 0
-    file_buffer = None
-    last_modified_date = None
-
-    while not complete:
-        try:
-            with requests.Session() as s:
-                r = s.get(remote_uri)
-                if 'Last-Modified' in r.headers:
-                    try:
-                        last_modified_date = dateutil.parser.parse(r.headers['Last-Modified']).date()
-                    except Exception as e:  # pylint: disable=broad-except
-                        logger.error("Unable to update last modified date for {0}: {1}".format(remote_path, e))
-
-                file_buffer = r.content
-                complete = True
-
-                # Sleep if set gt0
-                if HTTP_SLEEP_DEFAULT > 0:
-                    time.sleep(HTTP_SLEEP_DEFAULT)
-        except Exception as e:  # pylint: disable=broad-except
-            # Handle and sleep
-            if failures < len(HTTP_FAIL_SLEEP):
-                logger.warning("File {0}, failure {1}: {2}".format(remote_path, failures, e))
-                time.sleep(HTTP_FAIL_SLEEP[failures])
-                failures += 1
-            else:
-                logger.error("File {0}, failure {1}: {2}".format(remote_path, failures, e))
-                return file_buffer, last_modified_date
-
-    if b"SEC.gov | Request Rate Threshold Exceeded" in file_buffer:
-        raise RuntimeError("Exceeded SEC request rate threshold; invalid data retrieved")
-    elif b"SEC.gov | File Not Found Error Alert (404)" in file_buffer:
-        raise RuntimeError("HTTP 404 for requested path")
-    elif b"<Error><Code>AccessDenied</Code><Message>Access Denied</Message><RequestId>" in file_buffer:
-        raise RuntimeError("Access denied accessing path")
+    check_buffer(file_buffer)
 
     # Log successful exit
-    if complete:
-        logger.info("Successfully retrieved file {0}; {1} bytes".format(remote_path, len(file_buffer)))
+    logger.info("Successfully retrieved file {0}; {1} bytes".format(remote_path, len(file_buffer)))
 
     return file_buffer, last_modified_date
 
+
+def get_buffers(remote_path_list: Iterable[str], base_path: str = HTTP_SEC_HOST, use_cache: bool = False):
+    """
+    Retrieve many remote paths concurrently through the shared download engine.
+    :param remote_path_list: remote paths on EDGAR to retrieve
+    :param base_path: base path to prepend if not default EDGAR path
+    :param use_cache: whether to serve and revalidate through the persistent HTTP cache
+    :return: generator of (remote_path, file_buffer, last_modified_date, error) in completion order
+    """
+    engine = openedgar.clients.download.get_engine()
+    cache = openedgar.clients.cache.get_cache() if use_cache else None
+    for remote_path, file_buffer, last_modified_date, error in engine.map_buffers(remote_path_list, base_path,
+                                                                                  cache=cache):
+        if error is None and file_buffer is not None:
+            try:
+                check_buffer(file_buffer)
+            except RuntimeError as e:
+                error = e
+        yield remote_path, file_buffer, last_modified_date, error
+
+
+def check_buffer(file_buffer: bytes):
+    """
+    Raise if a retrieved buffer is an EDGAR or S3 error page rather than the requested file.
+    Only the head of the buffer is inspected.
+    :param file_buffer: retrieved buffer
+    :return:
+    """
+    openedgar.clients.payload.check_payload(file_buffer)
+
+
 def xbrl_instance_path(cik, accession_number):
     links = list_folder_files(cik, accession_number)
     for l in links:
@@ -155,7 +155,7 @@ def list_path(remote_path: str):
     """
     # Log entrance
     logger.info("Retrieving directory listing from {0}".format(remote_path))
-    remote_buffer, _ = get_buffer(remote_path)
+    remote_buffer, _ = get_buffer(remote_path, use_cache=True)
 
     # Parse the index listing
     if remote_buffer is None:
@@ -189,52 +189,71 @@ def list_path(remote_path: str):
     return good_url_list
 
 
-def list_index_by_year(year: int):
+def list_index_by_year(year: int, index_type: str = "form", min_date: datetime.date = None):
     """
     Get list of index files for a given year.
     :param year: filing year to retrieve
+    :param index_type: index file prefix to list, e.g., form, company, or master
+    :param min_date: if set, skip quarters ending before and index files published on or before this date
     :return:
     """
     # Log entrance
-    logger.info("Locating form index list for {0}".format(year))
+    logger.info("Locating {0} index list for {1}".format(index_type, year))
 
     # Form index list
     year = str(year)
     form_index_list = []
+    index_prefix = "/{0}.".format(index_type.lower())
 
     # Get year directory list
     year_index_uri = urllib.parse.urljoin(HTTP_SEC_INDEX_PATH, str(year) + "/")
     year_root_list = list_path(year_index_uri)
-    print(year_root_list)
 
     # Get quarters
     quarter_list = [f for f in year_root_list if "/QTR" in f]
 
     # Iterate over quarters
     for quarter in quarter_list:
+        if min_date is not None:
+            quarter_number = int(re.search(r"/QTR(\d)", quarter).group(1))
+            if (int(year), quarter_number) < (min_date.year, (min_date.month - 1) // 3 + 1):
+                logger.info("Skipping quarter {0}".format(quarter))
+                continue
+
         quarter_root_list = list_path(quarter)
-        form_index_list.extend([q for q in quarter_root_list if "/form." in q.lower()])
+        form_index_list.extend([q for q in quarter_root_list if index_prefix in q.lower()])
 
     # Cleanup double /
     for i in range(len(form_index_list)):
         form_index_list[i] = form_index_list[i].replace("//", "/")
 
+    # Keep only indices newer than the minimum date
+    if min_date is not None:
+        form_index_list = [f for f in form_index_list
+                           if (openedgar.parsers.edgar.parse_index_path(f)[1] or datetime.date.min) > min_date]
+
     # Log exit
-    logger.info("Successfully located {0} form index files for {1}".format(len(form_index_list), year))
+    logger.info("Successfully located {0} {1} index files for {2}".format(len(form_index_list), index_type, year))
 
     # Return
     return form_index_list
 
 
-def list_index(min_year: int = 1950, max_year: int = 2050):
+def list_index(min_year: int = 1950, max_year: int = 2050, index_type: str = "form", min_date: datetime.date = None):
     """
     Get the list of form index files on SEC HTTP.
     :param min_year: min filing year to begin listing
     :param max_year: max filing year to list
+    :param index_type: index file prefix to list, e.g., form, company, or master
+    :param min_date: if set, list only index files published after this date
     :return:
     """
     # Log entrance
-    logger.info("Retrieving form index list")
+    logger.info("Retrieving {0} index list".format(index_type))
+
+    # Only walk years that can hold indices newer than the minimum date
+    if min_date is not None:
+        min_year = max(min_year, min_date.year)
 
     # Retrieve lists
     form_index_list = []
@@ -252,17 +271,17 @@ def list_index(min_year: int = 1950, max_year: int = 2050):
                 continue
 
             # Parse if it is
-            year_form_list = list_index_by_year(year)
+            year_form_list = list_index_by_year(year, index_type=index_type, min_date=min_date)
             form_index_list.extend(year_form_list)
 
         except ValueError as e:
             # Else, non-year
             logger.error(e)
-            if root_file.startswith("form."):
+            if root_file.startswith("{0}.".format(index_type)):
                 form_index_list.append(root_file)
 
     # Log exit
-    logger.info("Successfully located {0} form index files".format(len(form_index_list)))
+    logger.info("Successfully located {0} {1} index files".format(len(form_index_list), index_type))
 
     # Return
     return form_index_list
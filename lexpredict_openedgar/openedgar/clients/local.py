@@ -21,8 +21,17 @@ SOFTWARE.
 """
 
 # Libraries
+import collections
 import logging
+import mmap
 import os
+import threading
+import time
+from typing import Iterable
+
+# Project
+from config.settings.base import LOCAL_CODEC
+import openedgar.clients.compression
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -35,31 +44,198 @@ logger.addHandler(console)
 
 PATH_PREFIX = os.environ['DOWNLOAD_PATH']
 
+# Per-process cache of memory-mapped filings, keyed by absolute path
+MMAP_CACHE_SIZE = int(os.environ.get('LOCAL_MMAP_CACHE_SIZE', 64))
+_mmap_cache = collections.OrderedDict()
+_mmap_lock = threading.Lock()
+
+# Directory manifests for paths_exist: directories scanned, how long a scan is re-used, and how many
+# queried paths in one directory it takes before a scan is cheaper than a stat per path
+MANIFEST_CACHE_SIZE = int(os.environ.get('LOCAL_MANIFEST_CACHE_SIZE', 256))
+MANIFEST_TTL = float(os.environ.get('LOCAL_MANIFEST_TTL', 300))
+MANIFEST_MIN_PATHS = int(os.environ.get('LOCAL_MANIFEST_MIN_PATHS', 16))
+
+# Per-process cache of decoded compressed files, keyed by absolute path
+DECODED_CACHE_SIZE = int(os.environ.get('LOCAL_DECODED_CACHE_SIZE', 8))
+_decoded_cache = collections.OrderedDict()
+
+
+def get_mmap(path: str):
+    """
+    Memory-map a file read-only, re-using the mapping for the life of the process.
+    Least recently used mappings are dropped once MMAP_CACHE_SIZE is exceeded; any
+    memoryview still referencing a dropped mapping keeps it alive until released.
+    :param path: absolute file path
+    :return: mmap object, or None for an empty file
+    """
+    with _mmap_lock:
+        if path in _mmap_cache:
+            _mmap_cache.move_to_end(path)
+            return _mmap_cache[path]
+
+        with open(path, mode='rb') as localfile:
+            if os.fstat(localfile.fileno()).st_size == 0:
+                return None
+            file_map = mmap.mmap(localfile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        _mmap_cache[path] = file_map
+        while len(_mmap_cache) > MMAP_CACHE_SIZE:
+            _mmap_cache.popitem(last=False)
+        return file_map
+
+
+def release_mmap(path: str):
+    """
+    Drop a cached mapping and decoded buffer, e.g., after the underlying file is rewritten.
+    :param path: absolute file path
+    :return:
+    """
+    with _mmap_lock:
+        _mmap_cache.pop(path, None)
+        _decoded_cache.pop(path, None)
+
+
+def get_decoded(path: str, file_map: mmap.mmap):
+    """
+    Decode a compressed file once, re-using the buffer until it is evicted or released.
+    :param path: absolute file path
+    :param file_map: mapping of the compressed file
+    :return: decoded bytes
+    """
+    with _mmap_lock:
+        if path in _decoded_cache:
+            _decoded_cache.move_to_end(path)
+            return _decoded_cache[path]
+
+    buffer = openedgar.clients.compression.decode(file_map)
+    with _mmap_lock:
+        _decoded_cache[path] = buffer
+        while len(_decoded_cache) > DECODED_CACHE_SIZE:
+            _decoded_cache.popitem(last=False)
+    return buffer
+
+
 class LocalClient:
 
     def __init__(self):
         logger.info("Initialized local client")
+        # Directory manifest for paths_exist: absolute directory -> (scan time, set of file names)
+        self.manifest = collections.OrderedDict()
+        self.manifest_lock = threading.Lock()
+
+    def list_directory(self, dir_name: str):
+        """
+        Get the cached set of file names in a directory, scanning it on first use or once the scan
+        is older than MANIFEST_TTL.  At most MANIFEST_CACHE_SIZE directories are kept.
+        :param dir_name: absolute directory path
+        :return: set of file names
+        """
+        with self.manifest_lock:
+            entry = self.manifest.get(dir_name)
+            if entry is not None and time.monotonic() - entry[0] < MANIFEST_TTL:
+                self.manifest.move_to_end(dir_name)
+                return entry[1]
+
+        try:
+            with os.scandir(dir_name) as entries:
+                names = {entry.name for entry in entries}
+        except (FileNotFoundError, NotADirectoryError):
+            names = set()
+
+        with self.manifest_lock:
+            self.manifest[dir_name] = (time.monotonic(), names)
+            self.manifest.move_to_end(dir_name)
+            while len(self.manifest) > MANIFEST_CACHE_SIZE:
+                self.manifest.popitem(last=False)
+        return names
+
+    def clear_manifest(self):
+        """
+        Drop the directory manifest, e.g., after files were written by another process.
+        :return:
+        """
+        with self.manifest_lock:
+            self.manifest.clear()
+
+    def paths_exist(self, path_list: Iterable[str]):
+        """
+        Check many paths, scanning a directory only when at least MANIFEST_MIN_PATHS of them are in
+        it, so a few paths in a large flat directory cost a stat each rather than a full scan.  Scans
+        are cached and kept current by put_buffer; a name missing from a scan is confirmed with a
+        stat, so files written by other processes since the scan are still found.
+        :param path_list: paths under DOWNLOAD_PATH
+        :return: dictionary of path to true/false
+        """
+        dir_paths = {}
+        for path in path_list:
+            file_path = os.path.join(PATH_PREFIX, path)
+            dir_paths.setdefault(os.path.dirname(file_path), []).append((path, file_path))
+
+        result = {}
+        for dir_name, paths in dir_paths.items():
+            with self.manifest_lock:
+                is_scanned = dir_name in self.manifest
+            if len(paths) < MANIFEST_MIN_PATHS and not is_scanned:
+                result.update((path, os.path.exists(file_path)) for path, file_path in paths)
+                continue
+
+            names = self.list_directory(dir_name)
+            for path, file_path in paths:
+                result[path] = os.path.basename(file_path) in names or os.path.exists(file_path)
+        return result
 
     def path_exists(self, path: str):
         file_path = os.path.join(PATH_PREFIX, path)
 #        file_path = PATH_PREFIX + path
         return os.path.exists(file_path)
 
-    def put_buffer(self, file_path: str, buffer, write_bytes=True):
+    def put_buffer(self, file_path: str, buffer, write_bytes=True, codec: str = None):
 #        path = PATH_PREFIX + file_path
         path = os.path.join(PATH_PREFIX, file_path)
-        print("LOCAL CLIENT - path: {0}".format(path))
+        logger.debug("Writing local file {0}".format(path))
         dir_name = os.path.dirname(path)
         if not os.path.exists(dir_name):
             os.makedirs(dir_name)
+        # Compressed files are written with a codec header; "none" leaves the file as-is
+        codec = openedgar.clients.compression.get_codec(codec or LOCAL_CODEC)
+        if codec.name != "none":
+            buffer = openedgar.clients.compression.encode(buffer, codec)
+            write_bytes = True
         if write_bytes:
             mode="wb"
         else:
             mode="w"
-        with open(path, mode=mode) as localfile:
+        # Write to a temporary file and swap it in, so live mappings of the old file stay valid
+        temp_path = "{0}.{1}.{2}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(temp_path, mode=mode) as localfile:
             localfile.write(buffer)
+        os.replace(temp_path, path)
+        release_mmap(path)
+        with self.manifest_lock:
+            if dir_name in self.manifest:
+                self.manifest[dir_name][1].add(os.path.basename(path))
 
     def get_buffer(self, file_path: str):
         path = os.path.join(PATH_PREFIX, file_path)
         with open(path, mode='rb') as localfile:
-            return localfile.read()
+            return openedgar.clients.compression.decode(localfile.read())
+
+    def get_buffer_segment(self, file_path: str, start_pos: int, end_pos: int):
+        """
+        Get a byte range of a local file without reading the rest of it.
+        :param file_path: path under DOWNLOAD_PATH
+        :param start_pos: start byte offset
+        :param end_pos: end byte offset (exclusive)
+        :return: zero-copy memoryview over the memory-mapped file or its cached decoded buffer
+        """
+        path = os.path.join(PATH_PREFIX, file_path)
+        # Missing files raise FileNotFoundError
+        file_map = get_mmap(path)
+        if end_pos <= start_pos:
+            return memoryview(b"")
+        if file_map is None:
+            raise EOFError("Unable to read bytes {0}-{1} of empty file {2}".format(start_pos, end_pos, path))
+        if file_map[0:openedgar.clients.compression.HEADER_SIZE].startswith(openedgar.clients.compression.HEADER_MAGIC):
+            # Offsets refer to the uncompressed file, so compressed files are decoded in full, once
+            return memoryview(get_decoded(path, file_map))[start_pos:end_pos]
+        return memoryview(file_map)[start_pos:end_pos]
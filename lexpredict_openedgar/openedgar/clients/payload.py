@@ -0,0 +1,99 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import re
+
+# Project
+from config.settings.base import PAYLOAD_HEAD_SIZE
+
+# Kinds of bad payload: EDGAR error pages and S3 error envelopes stored or served in place of a file
+PAYLOAD_KINDS = ("rate_limited", "not_found", "access_denied", "s3_error")
+
+STATUS_KINDS = {403: "access_denied", 404: "not_found", 429: "rate_limited"}
+TITLE_RE = re.compile(rb"<title>\s*(.*?)\s*</title>", re.IGNORECASE | re.DOTALL)
+TITLE_KINDS = [(b"sec.gov | request rate threshold exceeded", "rate_limited"),
+               (b"sec.gov | file not found error alert (404)", "not_found"),
+               (b"access denied", "access_denied")]
+S3_ERROR_RE = re.compile(rb"^\s*(?:<\?xml[^>]*\?>\s*)?<Error>\s*<Code>\s*(\w+)\s*</Code>")
+S3_ERROR_KINDS = {b"AccessDenied": "access_denied", b"NoSuchKey": "not_found"}
+ERROR_MESSAGES = {"rate_limited": "Exceeded SEC request rate threshold; invalid data retrieved",
+                  "not_found": "HTTP 404 for requested path",
+                  "access_denied": "Access denied accessing path",
+                  "s3_error": "S3 error response stored for path"}
+
+
+class BadPayloadError(RuntimeError):
+    """
+    Raised when a retrieved buffer is an error page rather than the requested file.
+    """
+
+    def __init__(self, kind: str):
+        super().__init__(ERROR_MESSAGES[kind])
+        self.kind = kind
+
+
+def classify_payload(buffer: bytes, content_type: str = None, status_code: int = None):
+    """
+    Classify a response or stored file as a bad payload from its first PAYLOAD_HEAD_SIZE bytes,
+    its Content-Type and its HTTP status, so callers only ever need the head of a file.  The page
+    title and S3 error envelope take precedence over the status code.
+    :param buffer: file contents or their first bytes
+    :param content_type: optional Content-Type header; limits which checks apply
+    :param status_code: optional HTTP status code
+    :return: one of PAYLOAD_KINDS, or None for a good payload
+    """
+    head = bytes(buffer[:PAYLOAD_HEAD_SIZE])
+    content_type = (content_type or "").lower()
+
+    # HTML error pages are identified by title
+    if not content_type or "html" in content_type:
+        match = TITLE_RE.search(head)
+        if match is not None:
+            title = match.group(1).lower()
+            for title_prefix, kind in TITLE_KINDS:
+                if title.startswith(title_prefix):
+                    return kind
+
+    # S3 error envelopes are XML documents with an Error root
+    if not content_type or "xml" in content_type:
+        match = S3_ERROR_RE.match(head)
+        if match is not None:
+            return S3_ERROR_KINDS.get(match.group(1), "s3_error")
+
+    # The status is only a fallback: EDGAR serves its rate threshold page with a 403
+    return STATUS_KINDS.get(status_code)
+
+
+def check_payload(buffer: bytes, content_type: str = None, status_code: int = None):
+    """
+    Raise if a buffer is a bad payload.
+    :param buffer: file contents or their first bytes
+    :param content_type: optional Content-Type header
+    :param status_code: optional HTTP status code
+    :return:
+    """
+    kind = classify_payload(buffer, content_type, status_code)
+    if kind is not None:
+        raise BadPayloadError(kind)
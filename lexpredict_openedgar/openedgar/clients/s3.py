@@ -23,18 +23,23 @@ SOFTWARE.
 """
 
 # Libraries
+import concurrent.futures
 import logging
+import os
+import threading
 
 # Packages
 import boto3
+import boto3.session
+import botocore.config
 import botocore.exceptions
 
 # Project
-import zlib
+from typing import BinaryIO, Iterable, Union
 
-from typing import Union
-
-from config.settings.base import S3_ACCESS_KEY, S3_BUCKET, S3_COMPRESSION_LEVEL, S3_SECRET_KEY
+from config.settings.base import S3_ACCESS_KEY, S3_BUCKET, S3_COMPRESSION_LEVEL, S3_SECRET_KEY, S3_ENDPOINT_URL, \
+    S3_REGION, S3_MAX_POOL_CONNECTIONS, S3_MAX_ATTEMPTS, S3_RETRY_MODE, S3_MULTIPART_PART_SIZE, S3_CODEC
+import openedgar.clients.compression
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -45,6 +50,121 @@ formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
 console.setFormatter(formatter)
 logger.addHandler(console)
 
+# Listing page size for paths_exist, and how many HEAD requests one listing page is worth; a prefix is
+# listed for at most len(paths) // PATHS_EXIST_HEADS_PER_PAGE pages before the rest fall back to HEAD
+PATHS_EXIST_PAGE_SIZE = 1000
+PATHS_EXIST_HEADS_PER_PAGE = 16
+
+# Process-wide S3 client; boto3 clients are thread-safe, resources are not
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_resources = threading.local()
+
+
+def get_config():
+    """
+    Build the botocore configuration for pooled, retrying S3 connections.
+    :return: botocore Config
+    """
+    return botocore.config.Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                                  retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": S3_RETRY_MODE})
+
+
+def get_session():
+    """
+    Create a boto3 session with the configured credentials and region.
+    :return: boto3 Session
+    """
+    return boto3.session.Session(aws_access_key_id=S3_ACCESS_KEY or None,
+                                 aws_secret_access_key=S3_SECRET_KEY or None, region_name=S3_REGION)
+
+
+def get_shared_client():
+    """
+    Get the process-wide S3 client, creating it on first use or after a fork.  The client and
+    its connection pool are shared by all threads and task invocations in a worker process.
+    :return: boto3 S3 client
+    """
+    global _client, _client_pid  # pylint: disable=global-statement
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = get_session().client('s3', endpoint_url=S3_ENDPOINT_URL, config=get_config())
+            _client_pid = os.getpid()
+        return _client
+
+
+def get_thread_resource():
+    """
+    Get an S3 resource for the current thread, created on first use or after a fork.
+    :return: boto3 S3 resource
+    """
+    if getattr(_resources, "pid", None) != os.getpid():
+        _resources.resource = get_session().resource('s3', endpoint_url=S3_ENDPOINT_URL, config=get_config())
+        _resources.pid = os.getpid()
+    return _resources.resource
+
+
+def reset_shared_client():
+    """
+    Drop the shared client, e.g., after settings change in tests.
+    :return:
+    """
+    global _client, _client_pid  # pylint: disable=global-statement
+    with _client_lock:
+        _client = None
+        _client_pid = None
+    _resources.pid = None
+
+
+def get_level(codec):
+    """
+    Compression level for a codec; S3_COMPRESSION_LEVEL applies to the deflate codecs.
+    :param codec: Codec
+    :return: level, or None for the codec default
+    """
+    return S3_COMPRESSION_LEVEL if codec.name in ("zlib", "gzip") else None
+
+
+def iter_body(body, deflate: bool = True, chunk_size: int = 1024 * 1024):
+    """
+    Read an S3 response body in chunks, detecting the codec from the first chunk and
+    decompressing incrementally.
+    :param body: botocore StreamingBody
+    :param deflate: whether to decompress
+    :param chunk_size: size of chunks to read; also bounds zlib output per step
+    :return: generator of bytes
+    """
+    decompressor = None
+    first_chunk = True
+    while True:
+        chunk = body.read(chunk_size)
+        if not chunk:
+            break
+        if first_chunk and deflate:
+            codec, header_size = openedgar.clients.compression.detect_codec(chunk, legacy="zlib")
+            decompressor = codec.decompressobj()
+            chunk = chunk[header_size:]
+        first_chunk = False
+
+        if decompressor is None:
+            yield chunk
+        elif hasattr(decompressor, "unconsumed_tail"):
+            # Bound inflated output per call so highly compressed chunks do not balloon
+            data = decompressor.decompress(chunk, chunk_size)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+        else:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+
+    if decompressor is not None:
+        data = decompressor.flush()
+        if data:
+            yield data
+
 
 class S3Client:
 
@@ -54,30 +174,23 @@ class S3Client:
     def get_resource(self):
         """
         Get S3 resource.
-        :return: returns boto3 S3 resource object
+        :return: returns boto3 S3 resource object for the current thread
         """
-        # Create S3 resource
-        s3 = boto3.resource('s3', aws_access_key_id=S3_ACCESS_KEY, aws_secret_access_key=S3_SECRET_KEY)
-        return s3
+        return get_thread_resource()
 
     def get_client(self):
         """
         Get S3 client.
-        :return: returns boto3 S3 client object
+        :return: returns the shared boto3 S3 client object
         """
-        # Create S3 client
-        client = boto3.client('s3', aws_access_key_id=S3_ACCESS_KEY, aws_secret_access_key=S3_SECRET_KEY)
-        return client
+        return get_shared_client()
 
     def get_bucket(self):
         """
         Get S3 bucket
         :return: returns boto3 S3 bucket resource
         """
-        # Get bucket
-        s3 = boto3.resource('s3', aws_access_key_id=S3_ACCESS_KEY, aws_secret_access_key=S3_SECRET_KEY)
-        bucket = s3.Bucket(S3_BUCKET)
-        return bucket
+        return self.get_resource().Bucket(S3_BUCKET)
 
     def path_exists(self, path: str, client=None):
         """
@@ -99,6 +212,78 @@ class S3Client:
             else:
                 logger.error("Unable to check if path {0} exists: {1}".format(path, e))
 
+    def paths_exist(self, path_list: Iterable[str], client=None):
+        """
+        Check many S3 paths, listing parent prefixes where that saves requests.  A prefix is listed
+        for at most one page per PATHS_EXIST_HEADS_PER_PAGE queried paths under it, so a few paths
+        in a large flat folder never page through the whole folder; paths past the listed range
+        are checked with concurrent HEAD requests.
+        :param path_list: list of S3 keys
+        :param client: optional s3 client to re-use
+        :return: dictionary of path to true/false
+        """
+        if client is None:
+            client = self.get_client()
+
+        # Group paths by parent prefix
+        prefix_paths = {}
+        for path in path_list:
+            prefix = path.rsplit("/", 1)[0] + "/" if "/" in path else ""
+            prefix_paths.setdefault(prefix, set()).add(path)
+
+        result = {}
+        head_list = []
+        paginator = client.get_paginator('list_objects_v2')
+        for prefix, paths in prefix_paths.items():
+            max_pages = len(paths) // PATHS_EXIST_HEADS_PER_PAGE
+            if max_pages == 0:
+                head_list.extend(paths)
+                continue
+
+            # Keys are listed in order, so a truncated listing still settles every path up to its last key
+            keys = set()
+            last_key = None
+            is_complete = True
+            for page_number, page in enumerate(paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix, Delimiter='/',
+                                                                  PaginationConfig={
+                                                                      "PageSize": PATHS_EXIST_PAGE_SIZE})):
+                contents = page.get("Contents", [])
+                keys.update(o["Key"] for o in contents)
+                if len(contents) > 0:
+                    last_key = contents[-1]["Key"]
+                if page.get("IsTruncated") and page_number + 1 >= max_pages:
+                    is_complete = False
+                    break
+
+            for path in paths:
+                if is_complete or (last_key is not None and path <= last_key):
+                    result[path] = path in keys
+                else:
+                    head_list.append(path)
+
+        result.update(self.heads_exist(head_list, client=client))
+        return result
+
+    def heads_exist(self, path_list: Iterable[str], client=None):
+        """
+        Check paths with one HEAD request each, run concurrently on the shared connection pool.
+        :param path_list: list of S3 keys
+        :param client: optional s3 client to re-use
+        :return: dictionary of path to true/false
+        """
+        path_list = list(path_list)
+        if len(path_list) == 0:
+            return {}
+        if client is None:
+            client = self.get_client()
+        if len(path_list) == 1:
+            return {path_list[0]: bool(self.path_exists(path_list[0], client=client))}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(path_list),
+                                                                   S3_MAX_POOL_CONNECTIONS)) as executor:
+            exists_list = executor.map(lambda path: bool(self.path_exists(path, client=client)), path_list)
+            return dict(zip(path_list, exists_list))
+
     def delete_path(self, path: str, client=None):
         """
         Remove a key (non-recursively) from an S3 path.
@@ -141,6 +326,22 @@ class S3Client:
 
         return path_objects
 
+    def list_objects(self, path: str, client=None):
+        """
+        List all objects *recursively* under a given path with their stored sizes, from listing
+        metadata alone.
+        :param path: remote path prefix
+        :param client: optional s3 client to re-use
+        :return: generator of (key, size)
+        """
+        if client is None:
+            client = self.get_client()
+
+        paginator = client.get_paginator('list_objects_v2')
+        for result in paginator.paginate(Bucket=S3_BUCKET, Prefix=path):
+            for o in result.get("Contents", []):
+                yield o["Key"], o["Size"]
+
     def list_path_folders(self, path: str, client=None, limit: int = None):
         """
         List the "folder" under a given path, where folders are CommonPrefixes using the /
@@ -174,7 +375,7 @@ class S3Client:
         Get a file from S3 given a path and optional client.
         :param remote_path: S3 path under bucket
         :param client: optional client to re-use
-        :param deflate: whether to automatically zlib deflate contents
+        :param deflate: whether to automatically decompress contents, detecting the codec
         :return: buffer bytes/str
         """
         # Get client
@@ -189,44 +390,122 @@ class S3Client:
 
         # Deflate if requested
         if deflate:
-            return zlib.decompress(buffer)
+            return openedgar.clients.compression.decode(buffer, legacy="zlib")
         else:
             return buffer
 
+    def get_stream(self, remote_path: str, client=None, deflate: bool = True, chunk_size: int = 1024 * 1024):
+        """
+        Stream a file from S3, decompressing incrementally so only a few chunks are held in memory.
+        :param remote_path: S3 path under bucket
+        :param client: optional client to re-use
+        :param deflate: whether to automatically decompress contents, detecting the codec
+        :param chunk_size: size of chunks to read from the response body
+        :return: generator of buffer bytes
+        """
+        # Get client
+        if client is None:
+            client = self.get_client()
+
+        s3_object = client.get_object(Bucket=S3_BUCKET, Key=remote_path)
+        body = s3_object["Body"]
+        try:
+            yield from iter_body(body, deflate, chunk_size)
+        finally:
+            body.close()
+
     def get_file(self, remote_path: str, local_path: str, client=None, deflate: bool = True):
         """
-        Save a local file from S3 given a path and optional client.
+        Save a local file from S3 given a path and optional client, streaming to disk.
         :param remote_path: S3 path under bucket
         :param local_path: local path to save to
         :param client: optional client to re-use
-        :param deflate: whether to automatically zlib deflate contents
+        :param deflate: whether to automatically decompress contents
         :return:
         """
-        # Open and write buffer
+        # Open and write chunks as they are inflated
         with open(local_path, "wb") as out_file:
-            out_file.write(self.get_buffer(remote_path, client, deflate))
+            for chunk in self.get_stream(remote_path, client, deflate):
+                out_file.write(chunk)
 
-    def get_buffer_segment(self, remote_path: str, start_pos: int, end_pos: int, client=None, deflate: bool = True):
+    def get_buffer_segment(self, remote_path: str, start_pos: int, end_pos: int, client=None, deflate: bool = True,
+                           chunk_size: int = 1024 * 1024):
         """
-        Get a file from S3 given a path and optional client.
+        Get a byte range of a file from S3 given a path and optional client.  Uncompressed objects are
+        fetched with a ranged GET; compressed objects are streamed and inflated only up to end_pos.
         :param remote_path: S3 path under bucket
-        :param start_pos:
-        :param end_pos:
+        :param start_pos: start byte offset into the uncompressed file
+        :param end_pos: end byte offset (exclusive) into the uncompressed file
         :param client: optional client to re-use
-        :param deflate: whether to automatically zlib deflate contents
-        :return:
+        :param deflate: whether to automatically decompress contents
+        :param chunk_size: size of compressed chunks to read while inflating
+        :return: buffer bytes
+        """
+        # Get client
+        if client is None:
+            client = self.get_client()
+
+        if end_pos <= start_pos:
+            return b""
+
+        if not deflate:
+            # Only the requested bytes cross the wire
+            s3_object = client.get_object(Bucket=S3_BUCKET, Key=remote_path,
+                                          Range="bytes={0}-{1}".format(start_pos, end_pos - 1))
+            return s3_object["Body"].read()
+
+        # Compressed streams cannot be entered mid-way, so decompress from the start and stop at end_pos
+        s3_object = client.get_object(Bucket=S3_BUCKET, Key=remote_path)
+        body = s3_object["Body"]
+        segment = []
+        position = 0
+        try:
+            for data in iter_body(body, deflate, chunk_size):
+                if position + len(data) > start_pos:
+                    segment.append(data[max(start_pos - position, 0):end_pos - position])
+                position += len(data)
+                if position >= end_pos:
+                    break
+        finally:
+            body.close()
+
+        return b"".join(segment)
+
+    def get_buffer_head(self, remote_path: str, size: int = 4096, client=None, deflate: bool = True):
         """
-        # Retrieve buffer and return subset
-        buffer = self.get_buffer(remote_path, client, deflate)
-        return buffer[start_pos:end_pos]
+        Get the first bytes of a file with a single ranged GET of the stored object.  Compressed
+        objects are inflated as far as the fetched bytes allow, so up to size bytes are returned.
+        :param remote_path: S3 path under bucket
+        :param size: number of bytes to fetch and return
+        :param client: optional client to re-use
+        :param deflate: whether to automatically decompress contents
+        :return: buffer bytes
+        """
+        if client is None:
+            client = self.get_client()
+
+        s3_object = client.get_object(Bucket=S3_BUCKET, Key=remote_path, Range="bytes=0-{0}".format(size - 1))
+        buffer = s3_object["Body"].read()
+        if not deflate:
+            return buffer
 
-    def put_buffer(self, remote_path: str, buffer: Union[str, bytes], client=None, deflate: bool = True):
+        codec, header_size = openedgar.clients.compression.detect_codec(buffer, legacy="zlib")
+        try:
+            return codec.decompressobj().decompress(buffer[header_size:])[:size]
+        except Exception as e:  # pylint: disable=broad-except
+            # Some stream decoders need more than the fetched prefix; fall back to a full read
+            logger.warning("Unable to inflate head of {0}, reading in full: {1}".format(remote_path, e))
+            return self.get_buffer(remote_path, client=client)[:size]
+
+    def put_buffer(self, remote_path: str, buffer: Union[str, bytes], client=None, deflate: bool = True,
+                   codec: str = None):
         """
         Upload a buffer to S3 given a path and optional client.
         :param remote_path: S3 path under bucket
         :param buffer: buffer to upload
         :param client: optional client to re-use
-        :param deflate: whether to automatically zlib deflate contents
+        :param deflate: whether to automatically compress contents
+        :param codec: compression codec; defaults to S3_CODEC
         :return:
         """
         # Get client
@@ -242,20 +521,87 @@ class S3Client:
             raise TypeError("buffer must be bytes or str")
 
         if deflate:
-            upload_buffer = zlib.compress(upload_buffer, S3_COMPRESSION_LEVEL)
+            codec = openedgar.clients.compression.get_codec(codec or S3_CODEC)
+            upload_buffer = openedgar.clients.compression.encode(upload_buffer, codec, get_level(codec))
 
         # Upload
         response = client.put_object(Bucket=S3_BUCKET, Key=remote_path, Body=upload_buffer)
         return True if response["ResponseMetadata"]["HTTPStatusCode"] == 200 else False
 
+    def put_stream(self, remote_path: str, in_stream: BinaryIO, client=None, deflate: bool = True,
+                   chunk_size: int = 1024 * 1024, part_size: int = S3_MULTIPART_PART_SIZE, codec: str = None):
+        """
+        Upload a file object to S3, compressing incrementally and sending multipart chunks, so that
+        only about one part of compressed output is held in memory.  Small uploads use a single
+        put_object; a failed multipart upload is aborted.
+        :param remote_path: S3 path under bucket
+        :param in_stream: binary file object to read from
+        :param client: optional client to re-use
+        :param deflate: whether to automatically compress contents
+        :param chunk_size: size of chunks to read from the stream
+        :param part_size: multipart part size; at least 5MB
+        :param codec: compression codec; defaults to S3_CODEC
+        :return: true on success
+        """
+        # Get client
+        if client is None:
+            client = self.get_client()
+
+        if deflate:
+            codec = openedgar.clients.compression.get_codec(codec or S3_CODEC)
+            compressor = codec.compressobj(get_level(codec))
+            part_buffer = bytearray(codec.header)
+        else:
+            compressor = None
+            part_buffer = bytearray()
+        upload_id = None
+        parts = []
+
+        def upload_part(data):
+            response = client.upload_part(Bucket=S3_BUCKET, Key=remote_path, UploadId=upload_id,
+                                          PartNumber=len(parts) + 1, Body=bytes(data))
+            parts.append({"ETag": response["ETag"], "PartNumber": len(parts) + 1})
+
+        try:
+            while True:
+                chunk = in_stream.read(chunk_size)
+                if not chunk:
+                    break
+                part_buffer += compressor.compress(chunk) if compressor is not None else chunk
+
+                # Send full parts as they accumulate
+                while len(part_buffer) >= part_size:
+                    if upload_id is None:
+                        upload_id = client.create_multipart_upload(Bucket=S3_BUCKET, Key=remote_path)["UploadId"]
+                    upload_part(part_buffer[0:part_size])
+                    del part_buffer[0:part_size]
+
+            if compressor is not None:
+                part_buffer += compressor.flush()
+
+            if upload_id is None:
+                response = client.put_object(Bucket=S3_BUCKET, Key=remote_path, Body=bytes(part_buffer))
+                return response["ResponseMetadata"]["HTTPStatusCode"] == 200
+
+            if len(part_buffer) > 0:
+                upload_part(part_buffer)
+            response = client.complete_multipart_upload(Bucket=S3_BUCKET, Key=remote_path, UploadId=upload_id,
+                                                        MultipartUpload={"Parts": parts})
+            return response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        except Exception:
+            if upload_id is not None:
+                logger.error("Aborting multipart upload of {0}".format(remote_path))
+                client.abort_multipart_upload(Bucket=S3_BUCKET, Key=remote_path, UploadId=upload_id)
+            raise
+
     def put_file(self, remote_path: str, local_path: str, client=None, deflate: bool = True):
         """
-        Save a local file from S3 given a path and optional client.
+        Upload a local file to S3 given a path and optional client, streaming from disk.
         :param remote_path: S3 path under bucket
-        :param local_path: local path to save to
+        :param local_path: local path to read from
         :param client: optional client to re-use
-        :param deflate: whether to automatically zlib deflate contents
+        :param deflate: whether to automatically decompress contents
         :return:
         """
         with open(local_path, "rb") as in_file:
-            self.put_buffer(remote_path, in_file.read(), client, deflate)
+            return self.put_stream(remote_path, in_file, client, deflate)
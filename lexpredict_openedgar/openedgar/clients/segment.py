@@ -0,0 +1,268 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import collections
+import fcntl
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable, Union
+
+# Project
+from config.settings.base import SEGMENT_PATH, SEGMENT_MAX_BYTES, SEGMENT_CODEC
+import openedgar.clients.compression
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+console.setFormatter(formatter)
+logger.addHandler(console)
+
+SEGMENT_NAME_RE = re.compile(r"^segment-(\d{8})\.dat$")
+DECODE_CACHE_SIZE = 8
+
+
+class SegmentClient:
+    """
+    Local storage backend that packs blobs into append-only segment files instead of one file per
+    path, with a SQLite index of (segment, offset, length) by path.  Each blob is encoded with a
+    codec header; uncompressed blobs support true ranged reads, and compressed blobs are decoded
+    once and kept in a small cache for repeated ranged reads of the same filing.  Appends are
+    serialized across threads and processes with a file lock; rewriting a path appends a new copy
+    and repoints the index.
+    """
+
+    def __init__(self, root: str = SEGMENT_PATH, max_segment_bytes: int = SEGMENT_MAX_BYTES,
+                 codec: str = SEGMENT_CODEC):
+        """
+        :param root: directory holding segment files and the index
+        :param max_segment_bytes: size after which a new segment file is started
+        :param codec: default compression codec for put_buffer
+        """
+        self.root = root
+        self.max_segment_bytes = max_segment_bytes
+        self.codec = openedgar.clients.compression.get_codec(codec)
+        os.makedirs(self.root, exist_ok=True)
+        self.index_path = os.path.join(self.root, "index.sqlite3")
+        self.lock_path = os.path.join(self.root, "write.lock")
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.file_lock = threading.Lock()
+        self.files = {}
+        self.files_pid = os.getpid()
+        self.decode_cache = collections.OrderedDict()
+        self.decode_lock = threading.Lock()
+        with self.get_connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS segment_index (path TEXT PRIMARY KEY, "
+                               "segment INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, "
+                               "raw_length INTEGER NOT NULL, codec TEXT NOT NULL, created REAL NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS segment_state (name TEXT PRIMARY KEY, "
+                               "value INTEGER NOT NULL)")
+        logger.info("Initialized segment client at {0}".format(self.root))
+
+    def get_connection(self):
+        """
+        Get the SQLite index connection for this thread, reopening after a fork.
+        :return: sqlite3 connection
+        """
+        if getattr(self.local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.index_path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def segment_path(self, segment: int):
+        return os.path.join(self.root, "segment-{0:08d}.dat".format(segment))
+
+    def get_file(self, segment: int):
+        """
+        Get a cached read-only descriptor for a segment file.
+        :param segment: segment number
+        :return: file descriptor
+        """
+        with self.file_lock:
+            if self.files_pid != os.getpid():
+                self.files = {}
+                self.files_pid = os.getpid()
+            if segment not in self.files:
+                self.files[segment] = os.open(self.segment_path(segment), os.O_RDONLY)
+            return self.files[segment]
+
+    def lookup(self, path: str):
+        """
+        Find a blob in the index.
+        :param path: storage path
+        :return: tuple of segment, offset, length, codec name; or None
+        """
+        return self.get_connection().execute("SELECT segment, offset, length, codec FROM segment_index "
+                                             "WHERE path = ?", (path,)).fetchone()
+
+    def read(self, segment: int, offset: int, length: int):
+        """
+        Read bytes from a segment file.
+        :return: bytes
+        """
+        return os.pread(self.get_file(segment), length, offset)
+
+    def path_exists(self, path: str):
+        return self.lookup(path) is not None
+
+    def paths_exist(self, path_list: Iterable[str]):
+        """
+        Check many paths with batched index queries.
+        :param path_list: storage paths
+        :return: dictionary of path to true/false
+        """
+        path_list = list(path_list)
+        result = dict.fromkeys(path_list, False)
+        connection = self.get_connection()
+        for i in range(0, len(path_list), 500):
+            batch = path_list[i:i + 500]
+            query = "SELECT path FROM segment_index WHERE path IN ({0})".format(", ".join("?" * len(batch)))
+            result.update((row[0], True) for row in connection.execute(query, batch))
+        return result
+
+    def get_active_segment(self, connection: sqlite3.Connection):
+        """
+        Get the segment appends go to, recorded in the index; stores written before it was recorded
+        fall back to the newest indexed segment.  Call with the write lock held.
+        :param connection: index connection
+        :return: segment number, 0 if nothing has been written
+        """
+        row = connection.execute("SELECT value FROM segment_state WHERE name = 'active_segment'").fetchone()
+        if row is not None:
+            return row[0]
+        return connection.execute("SELECT COALESCE(MAX(segment), 0) FROM segment_index").fetchone()[0]
+
+    def put_buffer(self, file_path: str, buffer: Union[bytes, str], write_bytes: bool = True, codec: str = None):
+        """
+        Append a blob to the current segment and index it.
+        :param file_path: storage path
+        :param buffer: contents; str is stored as UTF-8
+        :param write_bytes: accepted for LocalClient compatibility; str buffers are always encoded
+        :param codec: compression codec; defaults to the client codec
+        :return: true on success
+        """
+        if isinstance(buffer, str):
+            buffer = buffer.encode("utf-8")
+        codec = openedgar.clients.compression.get_codec(codec) if codec is not None else self.codec
+        stored_buffer = openedgar.clients.compression.encode(buffer, codec)
+
+        with self.write_lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Append to the active segment recorded in the index, rolling over when full
+                connection = self.get_connection()
+                segment = max(self.get_active_segment(connection), 1)
+                segment_file = open(self.segment_path(segment), "ab")
+                try:
+                    offset = segment_file.seek(0, os.SEEK_END)
+                    if offset > 0 and offset + len(stored_buffer) > self.max_segment_bytes:
+                        segment_file.close()
+                        segment += 1
+                        segment_file = open(self.segment_path(segment), "ab")
+                        offset = segment_file.seek(0, os.SEEK_END)
+                    segment_file.write(stored_buffer)
+                finally:
+                    segment_file.close()
+
+                with connection:
+                    connection.execute("INSERT OR REPLACE INTO segment_state VALUES ('active_segment', ?)",
+                                       (segment,))
+                    connection.execute("INSERT OR REPLACE INTO segment_index VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                       (file_path, segment, offset, len(stored_buffer), len(buffer), codec.name,
+                                        time.time()))
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        with self.decode_lock:
+            self.decode_cache.pop(file_path, None)
+        return True
+
+    def get_buffer(self, file_path: str):
+        """
+        Read and decode a blob.
+        :param file_path: storage path
+        :return: bytes
+        """
+        entry = self.lookup(file_path)
+        if entry is None:
+            raise FileNotFoundError(file_path)
+        segment, offset, length, _ = entry
+        return openedgar.clients.compression.decode(self.read(segment, offset, length))
+
+    def get_buffer_segment(self, file_path: str, start_pos: int, end_pos: int):
+        """
+        Get a byte range of a blob.  Uncompressed blobs are read directly from the segment file;
+        compressed blobs are decoded once and cached.
+        :param file_path: storage path
+        :param start_pos: start byte offset
+        :param end_pos: end byte offset (exclusive)
+        :return: memoryview
+        """
+        entry = self.lookup(file_path)
+        if entry is None:
+            raise FileNotFoundError(file_path)
+        segment, offset, length, codec_name = entry
+        if end_pos <= start_pos:
+            return memoryview(b"")
+
+        if codec_name == "none":
+            start_pos = min(start_pos, length)
+            end_pos = min(end_pos, length)
+            return memoryview(self.read(segment, offset + start_pos, end_pos - start_pos))
+
+        with self.decode_lock:
+            buffer = self.decode_cache.get(file_path)
+            if buffer is not None:
+                self.decode_cache.move_to_end(file_path)
+        if buffer is None:
+            buffer = openedgar.clients.compression.decode(self.read(segment, offset, length))
+            with self.decode_lock:
+                self.decode_cache[file_path] = buffer
+                while len(self.decode_cache) > DECODE_CACHE_SIZE:
+                    self.decode_cache.popitem(last=False)
+        return memoryview(buffer)[start_pos:end_pos]
+
+    def stats(self):
+        """
+        Summarize the store: blob count, raw and stored bytes, and segment file bytes including
+        space held by superseded copies.
+        :return: dict
+        """
+        blob_count, raw_bytes, stored_bytes = self.get_connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(raw_length), 0), COALESCE(SUM(length), 0) FROM segment_index").fetchone()
+        segment_bytes = sum(os.path.getsize(os.path.join(self.root, name)) for name in os.listdir(self.root)
+                            if SEGMENT_NAME_RE.match(name))
+        return {"blobs": blob_count, "raw_bytes": raw_bytes, "stored_bytes": stored_bytes,
+                "segment_bytes": segment_bytes}
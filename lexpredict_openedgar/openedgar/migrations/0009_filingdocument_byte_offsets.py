@@ -0,0 +1,23 @@
+# Generated by Django 2.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedgar', '0008_filing_notes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='filingdocument',
+            name='start_pos',
+            field=models.BigIntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='filingdocument',
+            name='end_pos',
+            field=models.BigIntegerField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+def backfill_index_type(apps, schema_editor):
+    """
+    Populate index type and publication date of existing indices from their file names.
+    """
+    import openedgar.parsers.edgar
+    FilingIndex = apps.get_model('openedgar', 'FilingIndex')
+    filing_index_list = []
+    for filing_index in FilingIndex.objects.filter(index_type__isnull=True).iterator():
+        index_type, date_published = openedgar.parsers.edgar.parse_index_path(filing_index.edgar_url)
+        filing_index.index_type = index_type
+        filing_index.date_published = filing_index.date_published or date_published
+        filing_index_list.append(filing_index)
+    FilingIndex.objects.bulk_update(filing_index_list, ['index_type', 'date_published'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedgar', '0009_filingdocument_byte_offsets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filingindex',
+            name='index_type',
+            field=models.CharField(db_index=True, max_length=32, null=True),
+        ),
+        migrations.RunPython(backfill_index_type, migrations.RunPython.noop),
+    ]
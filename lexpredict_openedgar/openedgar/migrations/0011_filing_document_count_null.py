@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedgar', '0010_filingindex_index_type'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='filing',
+            name='document_count',
+            field=models.IntegerField(default=0, null=True),
+        ),
+    ]
@@ -29,9 +29,12 @@ from django.db.models import Q
 import os
 import logging
 import pathlib 
-from openedgar.clients.local import LocalClient
+import openedgar.clients
 import openedgar.parsers.edgar
 from openedgar.parsers.sec_filing_content_parser import SECFilingContentParser
+from openedgar.parsers.line_cache import get_line_cache
+from openedgar.parsers.line_store import LineStore
+from openedgar.parsers.term_matcher import TermMatcher, get_term_matcher
 
 from pathlib import Path
 
@@ -126,6 +129,7 @@ class FilingIndex(django.db.models.Model):
 
     # Key fields
     edgar_url = django.db.models.CharField(max_length=1024, primary_key=True)
+    index_type = django.db.models.CharField(max_length=32, db_index=True, null=True)
     date_published = django.db.models.DateField(db_index=True, null=True)
     date_downloaded = django.db.models.DateField(default=django.utils.timezone.now, db_index=True)
     total_record_count = django.db.models.IntegerField(default=0)
@@ -156,7 +160,7 @@ class Filing(django.db.models.Model):
     company = django.db.models.ForeignKey(Company, db_index=True, on_delete=django.db.models.CASCADE, null=True)
     sha1 = django.db.models.CharField(max_length=1024, db_index=True, null=True)
     s3_path = django.db.models.CharField(max_length=1024, db_index=True)
-    document_count = django.db.models.IntegerField(default=0)
+    document_count = django.db.models.IntegerField(default=0, null=True)
     is_processed = django.db.models.BooleanField(default=False, db_index=True)
     is_error = django.db.models.BooleanField(default=False, db_index=True)
     notes = django.db.models.TextField(default=False, db_index=True, null=True)
@@ -173,7 +177,7 @@ class Filing(django.db.models.Model):
 
     def get_buffer(self, filing_path):
         logger.info("Retrieving buffer from S3...")
-        client = LocalClient()
+        client = openedgar.clients.get_client()
         filing_buffer = client.get_buffer(filing_path)
         return openedgar.parsers.edgar.parse_filing(filing_buffer)
 
@@ -199,8 +203,7 @@ class Filing(django.db.models.Model):
 
     def search_document(self, search_terms):
         doc = self.document_content()
-        found_lines = doc.search(search_terms, how="all", row_type="tables")
-        return doc.search(search_terms, how="all", row_type ="tables")
+        return doc.search(search_terms, how="all", row_type="tables")
 
     def financial_statements(self, statement_type):
         if statement_type=="balance_sheet":
@@ -217,35 +220,79 @@ class Filing(django.db.models.Model):
         return doc.biggest_table_on_page(terms, page_lines=range(0,9))
 
 
+# Tags of lines that are part of a table
+TABLE_TAGS = ("table", "tr", "td", "th")
+
+
 class DocumentContent():
 
 # This class represents the information content of a filing and provides a standardized format
 # for searching and obtaining information from a filing.
 
 # Filings are initially parsed into a List of Dicts, with each element in the list representing
-# a row of text in the filing. 
+# a row of text in the filing. The lines are then held column-wise in a LineStore, whose rows
+# read like the original dicts.
 
-    def __init__(self, content_string, is_text_file):
-        self.content_string = content_string
+    def __init__(self, content_string, is_text_file, lines=None):
+        # content_string may be a callable returning the content, so cached line models skip the read
+        self._content_string = content_string
         # The following converts the string content of a filing into dict for each row of text from a filing
         # For HTML files, each line reprsents an HTML tag that is a block tag; all inline tags children of a block tag 
         # are concatenated and included as a part of the block tag line; HTML tables are parsed into a list of dicts
-        self.lines = SECFilingContentParser(content_string, is_text_file).parse()
+        if lines is None:
+            lines = SECFilingContentParser(self.content_string, is_text_file).parse()
+        self.lines = LineStore.from_lines(lines)
+        self._biggest_tables = None
+
+    @property
+    def content_string(self):
+        if callable(self._content_string):
+            self._content_string = self._content_string()
+        return self._content_string
 
     def all_lines(self):
         return {"type": "lines", "results": self.lines}
 
     def tables(self):
         # Gather all lines part of a table
-        return [t for t in self.lines if t['tag'] == "table"]
+        return self.lines.find("tag", "table")
 
     def nonTableRows(self):
         # Gather all non-table lines
-        new_rows = []
-        for row in lines:
-            if row["tag"] != "table" and row["tag"] != "tr" and row["tag"] != "td" and row["tag"] != "th":
-                new_rows.append(row)
-        return new_rows
+        return self.lines.select(self.row_ids("rows"))
+
+    def row_ids(self, row_type=None):
+        # Positions of the lines of a row type, in document order
+        if row_type == "rows":
+            excluded = set(itertools.chain.from_iterable(self.lines.rows("tag", tag) for tag in TABLE_TAGS))
+            return [row for row in range(len(self.lines)) if row not in excluded]
+        elif row_type == "tables":
+            return self.lines.rows("tag", "table")
+        return range(len(self.lines))
+
+    def is_row_type(self, row, row_type):
+        if row_type == "rows":
+            return self.lines.get_value(row, "tag") not in TABLE_TAGS
+        elif row_type == "tables":
+            return self.lines.get_value(row, "tag") == "table"
+        return True
+
+    def page_lines(self, page_number):
+        # All lines on a page, from the page index
+        return self.lines.find("page_number", page_number)
+
+    def biggest_tables(self):
+        # Largest table on each page by parsed row count, the first one winning ties; built once
+        if self._biggest_tables is None:
+            biggest_tables = {}
+            for row in self.lines.rows("tag", "table"):
+                line = self.lines[row]
+                size = len(line['table_data'] or [])
+                page_number = line['page_number']
+                if page_number not in biggest_tables or biggest_tables[page_number][0] < size:
+                    biggest_tables[page_number] = (size, line)
+            self._biggest_tables = {page_number: line for page_number, (size, line) in biggest_tables.items()}
+        return self._biggest_tables
 
     def biggest_table_on_page(self, search_terms, how="any", row_type=None, item_sections=[], page_lines=[], response_type="lines"):
         search_response = self.search(search_terms=search_terms, how=how, row_type=row_type, item_sections=item_sections, page_lines=page_lines,\
@@ -254,50 +301,50 @@ class DocumentContent():
             results = search_response['results']
             # Gather all of the page numbers from the matched lines
             page_nums = list(set([c['page_number'] for c in results]))
-            new_results = []
-            # Find biggest table on each page
-            for p in page_nums:
-                page_lines = [line for line in self.lines if line['page_number'] == p]
-                tables = [l for l in page_lines if l['tag'] == "table"]
-                if tables:
-                    final_table = None
-                    for t in tables:
-                        if final_table:
-                            if len(final_table['table_data']) < len(t['table_data']):
-                                final_table = t
-                        else:
-                            final_table = t
-                new_results.append(final_table)
+            # Find biggest table on each page; pages without a table are skipped
+            biggest_tables = self.biggest_tables()
+            new_results = [biggest_tables[p] for p in page_nums if p in biggest_tables]
             return {"type": "lines", "results": new_results}
 
 
     def search(self, search_terms, how="any", row_type=None, item_sections=[], page_lines=[], response_type="lines"):
-        # Only searching lines that are not part of a table
-        if row_type == "rows":
-            searched_lines = self.nonTableRows()
-        # Only searching lines that are part of a table
-        elif row_type == "tables":
-            searched_lines = self.tables()
-        # Search all lines
-        else:
-            searched_lines = self.lines
-
+        # Lines are narrowed with the page, item and tag indexes of the line store rather than rescanned
         # Search only certain item sections
+        item_rows = None
         if item_sections:
-            searched_lines = [line for line in searched_lines if line['item_number'] in item_sections]
+            item_rows = sorted(set(itertools.chain.from_iterable(self.lines.rows("item_number", item)
+                                                                 for item in item_sections)))
 
-        # Search only certain page lines
+        # Search only certain page lines, counting the lines with content on each page
         if page_lines:
-            new_searched_lines = []
-            lines_w_content = [line for line in searched_lines if line['content']]
-            for page_num, page in itertools.groupby(lines_w_content, key=lambda x: x['page_number']):
-                new_searched_lines = new_searched_lines + [l for index, l in enumerate(page) if index in page_lines]
-            searched_lines = new_searched_lines
+            page_lines = set(page_lines)
+            last_page_line = max(page_lines)
+            allowed_rows = set(item_rows) if item_rows is not None else None
+            searched_rows = []
+            for page_rows in self.lines.index("page_number").values():
+                index = 0
+                for row in page_rows:
+                    if allowed_rows is not None and row not in allowed_rows:
+                        continue
+                    if not self.is_row_type(row, row_type) or not self.lines.get_value(row, "content"):
+                        continue
+                    if index in page_lines:
+                        searched_rows.append(row)
+                    index += 1
+                    if index > last_page_line:
+                        break
+        elif item_rows is not None:
+            searched_rows = [row for row in item_rows if self.is_row_type(row, row_type)]
+        else:
+            # Search only lines that are not part of a table, only table lines, or all lines
+            searched_rows = self.row_ids(row_type)
 
-        # Run search
+        # Run search; the terms are compiled once per term set
+        matcher = get_term_matcher(tuple(search_terms))
         found = []
-        for line in searched_lines:
-            if self.execute_search(line, search_terms, how):
+        for row in searched_rows:
+            line = self.lines[row]
+            if self.execute_search(line, matcher, how):
                 found.append(line)
 
         # Put together response
@@ -309,8 +356,7 @@ class DocumentContent():
                 r = []
                 page_nums = list(set([c['page_number'] for c in found]))
                 for p in page_nums:
-                    page_lines = [line for line in self.lines if line['page_number'] == p]
-                    r.append(page_lines)
+                    r.append(self.page_lines(p))
                 final_search_results['results'] = r
             # Only delivers the lines that have matched
             else:
@@ -319,23 +365,28 @@ class DocumentContent():
             return final_search_results
 
     def execute_search(self, line, terms, how):
+        # Returns the matched term when searching for any term, True when all terms match
+        matcher = terms if isinstance(terms, TermMatcher) else get_term_matcher(tuple(terms))
         # Search that matches any of the search terms
         if how == "any":
             if line['tag'] == "table":
                 for content_line in line['content']:
-                    if any([re.search(term, str(content_line), re.IGNORECASE) for term in terms]):
-                        return True
+                    term = matcher.search(content_line if isinstance(content_line, str) else str(content_line))
+                    if term is not None:
+                        return term or True
             else:
-                if any([re.search(term, str(line['content']), re.IGNORECASE) for term in terms]):
-                    return True
+                content = line['content']
+                term = matcher.search(content if isinstance(content, str) else str(content))
+                if term is not None:
+                    return term or True
         # Search that must match all search terms
         else:
             if line['tag'] == "table":
-                table_line = " ".join(line['content'])
-                if all([re.search(term, table_line, re.IGNORECASE) for term in terms]):
+                if matcher.matches_all(" ".join(line['content'])):
                     return True
             else:
-                if all([re.search(term, str(line['content']), re.IGNORECASE) for term in terms]):
+                content = line['content']
+                if matcher.matches_all(content if isinstance(content, str) else str(content)):
                     return True
 
 
@@ -352,8 +403,9 @@ class FilingDocument(django.db.models.Model):
     content_type = django.db.models.CharField(max_length=1024, null=True)
     description = django.db.models.CharField(max_length=1024, null=True)
     sha1 = django.db.models.CharField(max_length=1024, db_index=True)
-    start_pos = django.db.models.IntegerField(db_index=True)
-    end_pos = django.db.models.IntegerField(db_index=True)
+    # Byte offsets of the <DOCUMENT> block within the raw filing at Filing.s3_path
+    start_pos = django.db.models.BigIntegerField(db_index=True)
+    end_pos = django.db.models.BigIntegerField(db_index=True)
     is_processed = django.db.models.BooleanField(default=False, db_index=True)
     is_error = django.db.models.BooleanField(default=False, db_index=True)
 
@@ -379,13 +431,32 @@ class FilingDocument(django.db.models.Model):
         elif self.content_type == "text/plain":
             return True
 
+    def content_view(self):
+        """
+        This document's bytes within its filing, from the storage client CLIENT_TYPE selects.  On
+        LocalClient and SegmentClient this is a view of the mapped or segment file, with compressed
+        filings decoded once and cached.  S3Client makes no ranged GET here: each call streams the
+        object from its start up to end_pos, inflating it when compressed (the default S3_CODEC is
+        zlib), so later documents of a large filing cost most of the filing's download.
+        :return: memoryview, or bytes on S3
+        """
+        client = openedgar.clients.get_client()
+        return client.get_buffer_segment(self.filing.s3_path, self.start_pos, self.end_pos)
+
     def content(self):
-        client = LocalClient()
-        filing_buffer = client.get_buffer(self.filing.s3_path)
-        return filing_buffer[self.start_pos:self.end_pos]
+        return bytes(self.content_view())
 
     def document_content(self):
-        return DocumentContent(self.content(), self.is_text_file())
+        # Parsed line models are cached per sha1 and parser version
+        is_text_file = self.is_text_file()
+        line_cache = get_line_cache()
+        lines = line_cache.get(self.sha1, is_text_file)
+        if lines is not None:
+            return DocumentContent(self.content, is_text_file, lines=lines)
+
+        document_content = DocumentContent(self.content(), is_text_file)
+        line_cache.put(self.sha1, document_content.lines, is_text_file)
+        return document_content
 
 class TableBookmark(django.db.models.Model):
 
@@ -24,6 +24,8 @@ SOFTWARE.
 
 # Libraries
 import binascii
+import codecs
+import datetime
 import gzip
 import hashlib
 import io
@@ -36,6 +38,7 @@ from typing import Union
 
 # Packages
 import dateutil.parser
+import numpy
 import pandas
 import tika.parser
 
@@ -51,6 +54,19 @@ formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
 console.setFormatter(formatter)
 logger.addHandler(console)
 
+# SGML tags used by the streaming filing parser
+FILING_DOCUMENT_START_TAG = b"<DOCUMENT>"
+FILING_DOCUMENT_END_TAG = b"</DOCUMENT>"
+FILING_CONTENT_START_TAG = b"<TEXT>"
+FILING_CONTENT_END_TAG = b"</TEXT>"
+FILING_DOCUMENT_FIELD_RE = re.compile(rb"^<(TYPE|SEQUENCE|FILENAME|DESCRIPTION)>(.+)")
+
+# Index file header and output columns
+INDEX_HEADER_RE = re.compile(r"^\s*(FORM\s+TYPE|COMPANY\s+NAME|CIK\|)", re.IGNORECASE)
+INDEX_COLUMNS = ["CIK", "Company Name", "Date Filed", "File Name", "Form Type"]
+INDEX_FILE_NAME_RE = re.compile(r"^(?P<index_type>[a-z]+)(?:\.(?P<date>\d{6}|\d{8}))?\.(?:idx|sit)(?:\.gz|\.Z)?$",
+                                re.IGNORECASE)
+
 
 def uudecode(buffer: Union[bytes, str]):
     """
@@ -167,35 +183,9 @@ def parse_index_file(file_name: str, double_gz: bool = False):
             logger.error("First 10 bytes: {0}".format(index_buffer[0:10]))
             return pandas.DataFrame()
 
-    # Get header line and data line starts
-    header_line_pos = index_buffer.find("\nForm Type") + 1
-    separator_line_pos = index_buffer.find("-", header_line_pos + 1)
-    data_line_pos = index_buffer.find("\n", separator_line_pos + 1)
-
-    # Build buffer and parse as fixed-width file
-    data_buffer = io.StringIO(index_buffer[header_line_pos:separator_line_pos].replace("\n", "\t")
-                              + index_buffer[data_line_pos:])
-    data_table = pandas.read_fwf(data_buffer,
-                                 colspecs="infer",
-                                 encoding="utf-8")
-
-    # Deal with broken field names
-    if "Form" in data_table.columns and "Form Type" not in data_table.columns:
-        logger.warning("Index file has abnormal columns: {0}".format(file_name))
-        data_table["Form Type"] = data_table["Form"]
-        del data_table["Form"]
-
-    # Remove unknown field names
-    good_columns = ["CIK", "Company Name", "Date Filed", "File Name", "Form Type"]
-    try:
-        data_table = data_table.loc[:, good_columns]
-    except KeyError:
-        logger.error("Unable to identify proper columns in {0}".format(file_name))
-        logger.error("Columns found: {0}".format(data_table.columns))
-
-    # Make sure Date Filed column is an integer not float
-    data_table["Date Filed"].astype(int)
-    
+    # Parse from the decoded buffer
+    data_table = parse_index_buffer(index_buffer)
+
     # Log exit
     logger.info("Completed parsing index file: {0}".format(file_name))
     logger.info("Index data shape: {0}".format(data_table.shape))
@@ -204,6 +194,104 @@ def parse_index_file(file_name: str, double_gz: bool = False):
     return data_table
 
 
+def parse_index_path(index_path: str):
+    """
+    Identify the type and publication date of an index file from its name, e.g.,
+    form.20210126.idx, company.093094.idx, or master.idx for quarterly full indices.
+    :param index_path: remote or storage path to index file
+    :return: tuple of index_type, date_published; date_published is None for undated indices
+    """
+    match = INDEX_FILE_NAME_RE.match(os.path.basename(index_path))
+    if match is None:
+        return None, None
+
+    index_type = match.group("index_type").lower()
+    date_string = match.group("date")
+    if date_string is None:
+        return index_type, None
+
+    try:
+        if len(date_string) == 8:
+            date_published = datetime.datetime.strptime(date_string, "%Y%m%d").date()
+        else:
+            date_published = datetime.datetime.strptime(date_string, "%m%d%y").date()
+    except ValueError as e:
+        logger.warning("Unable to parse index date from {0}: {1}".format(index_path, e))
+        date_published = None
+
+    return index_type, date_published
+
+
+def parse_index_buffer(buffer: Union[bytes, str]):
+    """
+    Parse a form, company or master index from memory.  Column boundaries are computed once from
+    the header line; the last three fields (CIK, date, file name) never contain spaces, so each row
+    is split on the single leading boundary and then from the right, which tolerates rows that
+    drift from the header alignment.  Gzipped buffers are decompressed as they are read.
+    :param buffer: raw or gzipped index bytes, or decoded str
+    :return: data frame with CIK, Company Name, Date Filed, File Name and Form Type columns
+    """
+    # Stream lines from the buffer
+    if isinstance(buffer, str):
+        line_iter = io.StringIO(buffer)
+    elif buffer[0:2] == b"\x1f\x8b":
+        line_iter = io.TextIOWrapper(gzip.GzipFile(fileobj=io.BytesIO(buffer)), encoding="iso-8859-1")
+    else:
+        try:
+            line_iter = io.StringIO(buffer.decode("utf-8"))
+        except UnicodeDecodeError as _:
+            line_iter = io.StringIO(buffer.decode("iso-8859-1"))
+
+    # Locate the header line and skip the separator line
+    header_line = None
+    for line in line_iter:
+        if INDEX_HEADER_RE.match(line):
+            header_line = line.rstrip("\r\n")
+            break
+    if header_line is None:
+        logger.error("Unable to locate index header line")
+        return pandas.DataFrame(columns=INDEX_COLUMNS)
+
+    if "|" in header_line:
+        # Pipe-delimited master index: CIK|Company Name|Form Type|Date Filed|Filename
+        column_names = ["CIK", "Company Name", "Form Type", "Date Filed", "File Name"]
+        rows = []
+        for line in line_iter:
+            cik, _, tail = line.rstrip("\r\n").partition("|")
+            fields = tail.rsplit("|", 3)
+            if len(fields) == 4:
+                rows.append([cik] + fields)
+    else:
+        # Fixed-width form or company index; the first column ends where the second begins
+        header_upper = header_line.upper()
+        if header_upper.lstrip().startswith("FORM"):
+            column_names = ["Form Type", "Company Name", "CIK", "Date Filed", "File Name"]
+            boundary = header_upper.find("COMPANY NAME")
+        else:
+            column_names = ["Company Name", "Form Type", "CIK", "Date Filed", "File Name"]
+            boundary = header_upper.find("FORM TYPE")
+        rows = []
+        for line in line_iter:
+            fields = line[boundary:].rsplit(None, 3)
+            if len(fields) == 4:
+                rows.append([line[:boundary]] + fields)
+
+    # Drop separator and malformed rows, then type the columns
+    data_table = pandas.DataFrame(rows, columns=column_names, dtype=object)
+    cik_list = pandas.to_numeric(data_table["CIK"], errors="coerce")
+    data_table = data_table.loc[cik_list.notnull()]
+    date_list = data_table["Date Filed"].str.replace("-", "", regex=False)
+    data_table = pandas.DataFrame({
+        "CIK": cik_list.loc[data_table.index].astype(numpy.int64),
+        "Company Name": data_table["Company Name"].str.strip(),
+        "Date Filed": pandas.to_datetime(date_list, format="%Y%m%d", errors="coerce")
+        .fillna(pandas.to_datetime(date_list, format="%m%d%y", errors="coerce")),
+        "File Name": data_table["File Name"],
+        "Form Type": data_table["Form Type"].str.strip().astype("category")})
+
+    return data_table.loc[:, INDEX_COLUMNS].reset_index(drop=True)
+
+
 def extract_filing_header_field(buffer: Union[bytes, str], field: str):
     """
     Extract a given field from an SEC-HEADER buffer.
@@ -221,111 +309,125 @@ def extract_filing_header_field(buffer: Union[bytes, str], field: str):
     return buffer[p0:p1].strip()
 
 
+def parse_filing_header(header: str):
+    """
+    Parse the fields of an SEC-HEADER or IMS-HEADER block.
+    :param header: header block contents, excluding the enclosing tags
+    :return: dict of header fields
+    """
+    header_data = {}
+
+    # Get name
+    header_data["accession_number"] = extract_filing_header_field(header, "ACCESSION NUMBER")
+    header_data["form_type"] = extract_filing_header_field(header, "CONFORMED SUBMISSION TYPE")
+
+    try:
+        document_count_value = extract_filing_header_field(header, "PUBLIC DOCUMENT COUNT")
+        header_data["document_count"] = int(document_count_value)
+    except (TypeError, ValueError) as _:
+        logger.warning("Unable to set document_count")
+        header_data["document_count"] = None
+
+    try:
+        reporting_period_value = extract_filing_header_field(header, "CONFORMED PERIOD OF REPORT")
+        header_data["reporting_period"] = dateutil.parser.parse(
+            reporting_period_value).date() if reporting_period_value is not None else None
+    except ValueError as _:
+        logger.warning("Unable to set reporting_period")
+        header_data["reporting_period"] = None
+
+    try:
+        date_filed_value = extract_filing_header_field(header, "FILED AS OF DATE")
+        header_data["date_filed"] = dateutil.parser.parse(
+            date_filed_value).date() if date_filed_value is not None else None
+    except ValueError as _:
+        logger.warning("Unable to set date_filed")
+        header_data["date_filed"] = None
+
+    header_data["company_name"] = extract_filing_header_field(header, "COMPANY CONFORMED NAME")
+    header_data["cik"] = extract_filing_header_field(header, "CENTRAL INDEX KEY")
+    header_data["sic"] = extract_filing_header_field(header, "STANDARD INDUSTRIAL CLASSIFICATION")
+    header_data["irs_number"] = extract_filing_header_field(header, "IRS NUMBER")
+    header_data["state_incorporation"] = extract_filing_header_field(header, "STATE OF INCORPORATION")
+    header_data["state_location"] = extract_filing_header_field(header, "STATE")
+
+    return header_data
+
+
 def parse_filing(buffer: Union[bytes, str], extract: bool = False):
     """
-    Parse a filing file by returning each document within
+    Parse a filing file by returning each document within; start_pos and end_pos
+    are byte offsets into the raw (or UTF-8 encoded) buffer.
     :param buffer:
     :param extract: whether to extract raw text
     :return:
     """
-    # Start and end tags
-    start_tag = "<DOCUMENT>"
-    end_tag = "</DOCUMENT>"
-    filing_data = {"documents": [],
-                   "accession_number": None,
-                   "form_type": None,
-                   "document_count": None,
-                   "reporting_period": None,
-                   "date_filed": None,
-                   "company_name": None,
-                   "cik": None,
-                   "sic": None,
-                   "irs_number": None,
-                   "state_incorporation": None,
-                   "state_location": None}
-
     # Typing
-    if isinstance(buffer, bytes):
-        try:
-            # Start with UTF-8
-            buffer = str(buffer.decode("utf-8"))
-        except UnicodeDecodeError as _:
-            try:
-                # Fallback to ISO 8859-1
-                logger.warning("Falling back to ISO 8859-1 after failing to decode with UTF-8...")
-                buffer = str(buffer.decode("iso-8859-1"))
-            except UnicodeDecodeError as _:
-                # Give up if we can't
-                logger.error("Unable to decode with either UTF-8 or ISO 8859-1; giving up...")
-                return filing_data
-
-    # Check for SEC-HEADER block
-    if "<SEC-HEADER>" in buffer or "<IMS-HEADER>" in buffer:
-        # Get header subset
-        if "<SEC-HEADER>" in buffer:
-            header_p0 = buffer.find("<SEC-HEADER>")
-            header_p1 = buffer.find("</SEC-HEADER>")
-        elif "<IMS-HEADER>" in buffer:
-            header_p0 = buffer.find("<IMS-HEADER>")
-            header_p1 = buffer.find("</IMS-HEADER>")
-        else:
-            header_p0 = -1
-            header_p1 = -1
+    if isinstance(buffer, str):
+        buffer = buffer.encode("utf-8")
+
+    filing_data = {}
+    documents = []
+    encoding = get_filing_encoding(buffer)
+    for header_data, document_data in parse_filing_stream(io.BytesIO(buffer), extract=extract, encoding=encoding):
+        filing_data = header_data
+        if document_data is not None:
+            documents.append(document_data)
+
+    filing_data = dict(filing_data)
+    filing_data["documents"] = documents
+    return filing_data
 
-        if header_p0 == -1 or header_p1 == -1:
-            logger.error("Invalid HEADER block found in document")
-        else:
-            # Parse valid header
-            header = buffer[header_p0 + len("<SEC-HEADER>"):header_p1]
 
-            # Get name
-            filing_data["accession_number"] = extract_filing_header_field(header, "ACCESSION NUMBER")
-            filing_data["form_type"] = extract_filing_header_field(header, "CONFORMED SUBMISSION TYPE")
+def parse_filing_record(buffer: Union[bytes, str], extract: bool = False):
+    """
+    Parse a filing and hash its raw buffer.  Module-level with no database access so it can
+    run in a worker process.
+    :param buffer:
+    :param extract: whether to extract raw text
+    :return: parse_filing result with the filing "sha1" added
+    """
+    if isinstance(buffer, str):
+        buffer = buffer.encode("utf-8")
 
-            try:
-                document_count_value = extract_filing_header_field(header, "PUBLIC DOCUMENT COUNT")
-                filing_data["document_count"] = int(document_count_value)
-            except ValueError as _:
-                logger.warning("Unable to set document_count")
-                filing_data["document_count"] = None
+    filing_data = parse_filing(buffer, extract=extract)
+    filing_data["sha1"] = hashlib.sha1(buffer).hexdigest()
+    return filing_data
 
-            try:
-                reporting_period_value = extract_filing_header_field(header, "CONFORMED PERIOD OF REPORT")
-                filing_data["reporting_period"] = dateutil.parser.parse(
-                    reporting_period_value).date() if reporting_period_value is not None else None
-            except ValueError as _:
-                logger.warning("Unable to set reporting_period")
-                filing_data["reporting_period"] = None
 
-            try:
-                date_filed_value = extract_filing_header_field(header, "FILED AS OF DATE")
-                filing_data["date_filed"] = dateutil.parser.parse(
-                    date_filed_value).date() if date_filed_value is not None else None
-            except ValueError as _:
-                logger.warning("Unable to set date_filed")
-                filing_data["date_filed"] = None
-
-            filing_data["company_name"] = extract_filing_header_field(header, "COMPANY CONFORMED NAME")
-            filing_data["cik"] = extract_filing_header_field(header, "CENTRAL INDEX KEY")
-            filing_data["sic"] = extract_filing_header_field(header, "STANDARD INDUSTRIAL CLASSIFICATION")
-            filing_data["irs_number"] = extract_filing_header_field(header, "IRS NUMBER")
-            filing_data["state_incorporation"] = extract_filing_header_field(header, "STATE OF INCORPORATION")
-            filing_data["state_location"] = extract_filing_header_field(header, "STATE")
-
-    # Parse and yield by doc
-    p0 = buffer.find(start_tag)
-    while p0 != -1:
-        p1 = buffer.find(end_tag, p0)
-
-        # Parse document
-        document_buffer = buffer[p0:(p1 + len(end_tag))]
-        document_data = parse_filing_document(document_buffer, extract=extract)
-        document_data["start_pos"] = p0
-        document_data["end_pos"] = (p1 + len(end_tag))
-        filing_data["documents"].append(document_data)
-        p0 = buffer.find(start_tag, p1)
+def get_document_content_type(doc_text_head: str, file_name: str = None):
+    """
+    Determine the content type of a document from the head of its <TEXT> block.
+    :param doc_text_head: first 100 characters of the document content
+    :param file_name: optional document file name, used to guess uuencoded types
+    :return: tuple of content_type, is_uuencoded
+    """
+    is_uuencoded = False
+    doc_text_head_upper = doc_text_head.upper()
 
-    return filing_data
+    if "<PDF>" in doc_text_head_upper:
+        is_uuencoded = True
+        content_type = "application/pdf"
+    elif "<HTML" in doc_text_head_upper:
+        content_type = "text/html"
+    elif "<XML" in doc_text_head_upper:
+        content_type = "application/xml"
+    elif "<?XML" in doc_text_head_upper:
+        content_type = "application/xml"
+    elif doc_text_head.startswith("\nbegin "):
+        is_uuencoded = True
+        if file_name is not None:
+            content_type = mimetypes.guess_type(os.path.basename(file_name))
+            if content_type is None:
+                content_type = "application/octet-stream"
+            else:
+                content_type = content_type[0]
+        else:
+            content_type = "application/octet-stream"
+    else:
+        content_type = "text/plain"
+
+    return content_type, is_uuencoded
 
 
 def parse_filing_document(document_buffer: Union[bytes, str], extract: bool = False):
@@ -353,31 +455,8 @@ def parse_filing_document(document_buffer: Union[bytes, str], extract: bool = Fa
     doc_content = document_buffer[doc_content_p0:doc_content_p1]
 
     # Check content types
-    is_uuencoded = False
-    doc_text_head = doc_content[0:100]
-    doc_text_head_upper = doc_text_head.upper()
-
-    if "<PDF>" in doc_text_head_upper:
-        is_uuencoded = True
-        content_type = "application/pdf"
-    elif "<HTML" in doc_text_head_upper:
-        content_type = "text/html"
-    elif "<XML" in doc_text_head_upper:
-        content_type = "application/xml"
-    elif "<?XML" in doc_text_head_upper:
-        content_type = "application/xml"
-    elif doc_text_head.startswith("\nbegin "):
-        is_uuencoded = True
-        if len(doc_file_name) > 0:
-            content_type = mimetypes.guess_type(os.path.basename(doc_file_name[0]))
-            if content_type is None:
-                content_type = "application/octet-stream"
-            else:
-                content_type = content_type[0]
-        else:
-            content_type = "application/octet-stream"
-    else:
-        content_type = "text/plain"
+    content_type, is_uuencoded = get_document_content_type(doc_content[0:100],
+                                                           doc_file_name[0] if len(doc_file_name) > 0 else None)
 
     # uudecode if required and calculate hash for sharding/dedupe
     doc_content = doc_content.encode("utf-8")
@@ -399,3 +478,211 @@ def parse_filing_document(document_buffer: Union[bytes, str], extract: bool = Fa
             "sha1": doc_sha1,
             "content": doc_content,
             "content_text": doc_content_text}
+
+
+def get_filing_encoding(buffer: bytes, chunk_size: int = 1024 * 1024):
+    """
+    Choose the encoding parse_filing has always decoded a whole filing with: UTF-8 if every byte
+    of it is valid UTF-8, ISO 8859-1 otherwise.  Checked chunk by chunk so no decoded copy is kept.
+    :param buffer: raw filing bytes
+    :param chunk_size: bytes to decode per step
+    :return: "utf-8" or "iso-8859-1"
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    view = memoryview(buffer)
+    try:
+        for offset in range(0, len(view), chunk_size):
+            decoder.decode(view[offset:offset + chunk_size])
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError as _:
+        return "iso-8859-1"
+    return "utf-8"
+
+
+def encode_document_content(doc_content: bytes, encoding: str = None):
+    """
+    Re-encode raw document bytes as UTF-8 from the filing encoding, as parse_filing did when it
+    decoded the whole filing first.  Document sha1 values, and with them blob and line cache keys,
+    are computed over these bytes and so stay stable for non-UTF-8 filings.
+    :param doc_content: raw document bytes
+    :param encoding: filing encoding from get_filing_encoding; detected per document if None
+    :return: UTF-8 bytes
+    """
+    if encoding is None:
+        try:
+            doc_content.decode("utf-8")
+            return doc_content
+        except UnicodeDecodeError as _:
+            encoding = "iso-8859-1"
+    if encoding == "utf-8":
+        return doc_content
+    return doc_content.decode(encoding).encode("utf-8")
+
+
+def decode_filing_bytes(buffer: bytes):
+    """
+    Decode a segment of a filing, falling back from UTF-8 to ISO 8859-1.
+    :param buffer: raw bytes
+    :return: decoded str
+    """
+    try:
+        return buffer.decode("utf-8")
+    except UnicodeDecodeError as _:
+        return buffer.decode("iso-8859-1")
+
+
+def parse_filing_stream(stream, extract: bool = False, encoding: str = None):
+    """
+    Parse a filing from a binary file object or mmap in a single pass over its lines, yielding
+    each document as soon as its closing tag is read.  Only the SEC-HEADER block and the current
+    document are ever held in memory, and start_pos/end_pos are byte offsets into the stream.
+    :param stream: binary file-like object supporting readline(), e.g., open(..., "rb") or mmap
+    :param extract: whether to extract raw text
+    :param encoding: filing encoding from get_filing_encoding, used to re-encode document content
+    as UTF-8; detected per document if None
+    :return: generator of (filing_data, document_data) tuples; filing_data holds the header fields
+    and is shared across documents.  A filing without documents yields (filing_data, None) once.
+    """
+    filing_data = {"accession_number": None,
+                   "form_type": None,
+                   "document_count": None,
+                   "reporting_period": None,
+                   "date_filed": None,
+                   "company_name": None,
+                   "cik": None,
+                   "sic": None,
+                   "irs_number": None,
+                   "state_incorporation": None,
+                   "state_location": None}
+
+    # Parser state
+    position = 0
+    document_count = 0
+    header_lines = None
+    header_end_tag = None
+    header_done = False
+    document_start = None
+    document_fields = {}
+    content_lines = None
+    content_done = False
+
+    while True:
+        line = stream.readline()
+        if not line:
+            break
+        line_start = position
+        position += len(line)
+
+        # Collect the current document's <TEXT> block
+        if content_lines is not None and not content_done:
+            p = line.find(FILING_CONTENT_END_TAG)
+            if p == -1:
+                content_lines.append(line)
+                continue
+            content_lines.append(line[:p])
+            content_done = True
+            line = line[p:]
+            line_start += p
+
+        # Collect the header block
+        if header_lines is None and not header_done and document_start is None \
+                and (line.startswith(b"<SEC-HEADER>") or line.startswith(b"<IMS-HEADER>")):
+            header_end_tag = b"</SEC-HEADER>" if line.startswith(b"<SEC-HEADER>") else b"</IMS-HEADER>"
+            header_lines = []
+
+        if header_lines is not None:
+            header_lines.append(line)
+            if header_end_tag in line:
+                header = decode_filing_bytes(b"".join(header_lines))
+                header = header[len("<SEC-HEADER>"):header.find(header_end_tag.decode("ascii"))]
+                filing_data.update(parse_filing_header(header))
+                header_lines = None
+                header_done = True
+            continue
+
+        if document_start is None:
+            # Look for the next document
+            p = line.find(FILING_DOCUMENT_START_TAG)
+            if p == -1:
+                continue
+            document_start = line_start + p
+            document_fields = {}
+            content_lines = None
+            content_done = False
+            line = line[p + len(FILING_DOCUMENT_START_TAG):]
+            line_start += p + len(FILING_DOCUMENT_START_TAG)
+
+        if content_lines is None:
+            # Document metadata precedes the <TEXT> block
+            p = line.find(FILING_CONTENT_START_TAG)
+            if p != -1:
+                content_lines = []
+                rest = line[p + len(FILING_CONTENT_START_TAG):]
+                q = rest.find(FILING_CONTENT_END_TAG)
+                if q == -1:
+                    content_lines.append(rest)
+                    continue
+                content_lines.append(rest[:q])
+                content_done = True
+                line_start += p + len(FILING_CONTENT_START_TAG) + q
+                line = rest[q:]
+            else:
+                field_match = FILING_DOCUMENT_FIELD_RE.match(line)
+                if field_match is not None:
+                    field_name = field_match.group(1).decode("ascii").lower()
+                    if field_name not in document_fields:
+                        document_fields[field_name] = decode_filing_bytes(field_match.group(2).rstrip(b"\r\n"))
+
+        # Close the document
+        p = line.find(FILING_DOCUMENT_END_TAG)
+        if p != -1:
+            document_count += 1
+            document_data = build_filing_document(document_fields,
+                                                  b"".join(content_lines) if content_lines is not None else b"",
+                                                  extract=extract, encoding=encoding)
+            document_data["start_pos"] = document_start
+            document_data["end_pos"] = line_start + p + len(FILING_DOCUMENT_END_TAG)
+            document_start = None
+            content_lines = None
+            yield filing_data, document_data
+
+    if document_start is not None:
+        logger.error("Unterminated <DOCUMENT> block found at byte {0}".format(document_start))
+
+    if document_count == 0:
+        yield filing_data, None
+
+
+def build_filing_document(document_fields: dict, doc_content: bytes, extract: bool = False, encoding: str = None):
+    """
+    Build a document record from its header fields and raw <TEXT> bytes.
+    :param document_fields: dict of type, sequence, file_name and description values
+    :param doc_content: raw bytes between the <TEXT> tags
+    :param extract: whether to pass to Tika for text extraction
+    :param encoding: filing encoding; content is re-encoded from it as UTF-8 before hashing
+    :return: document record in the same format as parse_filing_document
+    """
+    # Check content types
+    content_type, is_uuencoded = get_document_content_type(doc_content[0:100].decode("iso-8859-1"),
+                                                           document_fields.get("filename"))
+
+    # uudecode if required and calculate hash for sharding/dedupe
+    doc_content = encode_document_content(doc_content, encoding)
+    if is_uuencoded:
+        doc_content = uudecode(doc_content)
+    doc_sha1 = hashlib.sha1(doc_content).hexdigest()
+
+    # extract text from tika if requested
+    if extract:
+        doc_content_text = extract_text(doc_content)
+    else:
+        doc_content_text = None
+
+    return {"type": document_fields.get("type"),
+            "sequence": document_fields.get("sequence"),
+            "file_name": document_fields.get("filename"),
+            "description": document_fields.get("description"),
+            "content_type": content_type,
+            "sha1": doc_sha1,
+            "content": doc_content,
+            "content_text": doc_content_text}
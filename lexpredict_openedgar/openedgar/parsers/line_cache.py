@@ -0,0 +1,157 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import json
+import logging
+import os
+import threading
+
+# Packages
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Project
+from config.settings.base import LINE_CACHE_ROOT, LINE_CACHE_CODEC
+import openedgar.clients
+from openedgar.clients.blob import BlobStore
+from openedgar.parsers.line_store import LineStore
+from openedgar.parsers.sec_filing_content_parser import SECFilingContentParser
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+console.setFormatter(formatter)
+logger.addHandler(console)
+
+FORMAT_MSGPACK = b"M"
+FORMAT_JSON = b"J"
+
+
+def encode_lines(lines, is_text_file: bool):
+    """
+    Serialize a line model column by column, with msgpack if installed and JSON otherwise.
+    :param lines: LineStore or line dicts from SECFilingContentParser
+    :param is_text_file: whether the lines were parsed as text
+    :return: bytes
+    """
+    store = LineStore.from_lines(lines)
+    model = {"version": SECFilingContentParser.VERSION, "is_text_file": bool(is_text_file), "count": len(store),
+             "columns": store.to_columns()}
+    if msgpack is not None:
+        return FORMAT_MSGPACK + msgpack.packb(model, use_bin_type=True)
+    return FORMAT_JSON + json.dumps(model, separators=(",", ":")).encode("utf-8")
+
+
+def decode_lines(buffer: bytes):
+    """
+    Deserialize a line model written by encode_lines.
+    :param buffer: bytes
+    :return: model dictionary with lines as a LineStore
+    """
+    buffer = bytes(buffer)
+    if buffer[:1] == FORMAT_MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack is required to read this line model")
+        model = msgpack.unpackb(buffer[1:], raw=False)
+    elif buffer[:1] == FORMAT_JSON:
+        model = json.loads(buffer[1:].decode("utf-8"))
+    else:
+        raise ValueError("Unknown line model format")
+
+    model["lines"] = LineStore.from_columns(model.pop("columns"))
+    return model
+
+
+class LineCache:
+    """
+    Persistent cache of parsed DocumentContent line models keyed by document sha1 and parser
+    version, so API requests skip re-reading and re-parsing the document.  Line models are stored
+    compressed in a BlobStore under <root>/v<version>/.
+    """
+
+    def __init__(self, client, root: str = LINE_CACHE_ROOT, codec: str = LINE_CACHE_CODEC,
+                 version: int = SECFilingContentParser.VERSION):
+        """
+        :param client: storage client
+        :param root: storage root for line models
+        :param codec: compression codec
+        :param version: parser version; models written by other versions are ignored
+        """
+        self.version = version
+        self.kind = "v{0}".format(version)
+        self.blob_store = BlobStore(client, root, codecs={self.kind: codec})
+
+    def get(self, sha1: str, is_text_file: bool):
+        """
+        Load a cached line model.
+        :param sha1: document sha1
+        :param is_text_file: whether the document is parsed as text
+        :return: LineStore, or None if not cached
+        """
+        try:
+            model = decode_lines(self.blob_store.get(self.kind, sha1))
+        except Exception:  # pylint: disable=broad-except
+            return None
+        if model["version"] != self.version or model["is_text_file"] != bool(is_text_file):
+            return None
+        return model["lines"]
+
+    def put(self, sha1: str, lines, is_text_file: bool):
+        """
+        Store a line model unless already cached; failures are logged rather than raised.
+        :param sha1: document sha1
+        :param lines: LineStore or line dicts from SECFilingContentParser
+        :param is_text_file: whether the document was parsed as text
+        :return: true unless storing failed
+        """
+        try:
+            self.blob_store.put(self.kind, sha1, encode_lines(lines, is_text_file))
+            return True
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning("Unable to cache line model for sha1={0}: {1}".format(sha1, e))
+            return False
+
+
+_line_cache = None
+_line_cache_pid = None
+_line_cache_lock = threading.Lock()
+
+
+def get_line_cache():
+    """
+    Get the process-wide line cache on the configured storage client.
+    :return: LineCache
+    """
+    global _line_cache, _line_cache_pid
+    with _line_cache_lock:
+        if _line_cache is None or _line_cache_pid != os.getpid():
+            _line_cache = LineCache(openedgar.clients.get_client())
+            _line_cache_pid = os.getpid()
+        return _line_cache
@@ -0,0 +1,277 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import array
+import collections.abc
+from typing import Iterable
+
+LINE_COLUMNS = ["line_index", "element_index", "item_number", "page_number", "tag", "style", "content",
+                "table_index", "table_data"]
+# Low-cardinality columns are dictionary-encoded as categories plus integer codes
+CATEGORICAL_COLUMNS = ["item_number", "tag", "style", "table_index"]
+# Integer columns are held in typed arrays; element_index is None for text lines, stored as -1
+INTEGER_COLUMNS = ["line_index", "element_index", "page_number"]
+NULL_INTEGER = -1
+
+
+class LineView(collections.abc.Mapping):
+    """
+    Read-only view of one row of a LineStore, usable wherever a line dict is expected.
+    """
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row: int):
+        """
+        :param store: LineStore
+        :param row: row position within the store
+        """
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, column):
+        return self.store.get_value(self.row, column)
+
+    def __iter__(self):
+        return iter(LINE_COLUMNS)
+
+    def __len__(self):
+        return len(LINE_COLUMNS)
+
+    def __repr__(self):
+        return "LineView({0!r})".format(self.to_dict())
+
+    def to_dict(self):
+        """
+        Copy the row into a plain line dict.
+        :return: dict
+        """
+        return {column: self.store.get_value(self.row, column) for column in LINE_COLUMNS}
+
+
+class LineStore(collections.abc.Sequence):
+    """
+    Column-oriented store for the line model of a parsed document.  Integer columns are typed
+    arrays, tags, item numbers, styles and table indices are dictionary-encoded so each distinct
+    value is held once, and table data is kept sparsely for table rows only.  Rows are read through
+    LineView objects created on access.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.integers = {column: array.array("q") for column in INTEGER_COLUMNS}
+        self.categories = {column: [] for column in CATEGORICAL_COLUMNS}
+        self.category_codes = {column: {} for column in CATEGORICAL_COLUMNS}
+        self.codes = {column: array.array("l") for column in CATEGORICAL_COLUMNS}
+        self.content = []
+        self.table_data = {}
+        self.indexes = {}
+
+    @classmethod
+    def from_lines(cls, lines: Iterable):
+        """
+        Build a store from line dicts, or return lines unchanged if already a store.
+        :param lines: iterable of line dicts
+        :return: LineStore
+        """
+        if isinstance(lines, LineStore):
+            return lines
+        store = cls()
+        for line in lines:
+            store.append(line)
+        return store
+
+    @classmethod
+    def from_columns(cls, columns: dict):
+        """
+        Build a store from the column layout of to_columns.
+        :param columns: dict of column values, with categorical columns as categories and codes
+        :return: LineStore
+        """
+        store = cls()
+        store.count = len(columns["content"])
+        for column in INTEGER_COLUMNS:
+            store.integers[column] = array.array("q", (NULL_INTEGER if value is None else value
+                                                       for value in columns[column]))
+        for column in CATEGORICAL_COLUMNS:
+            categories = list(columns[column]["categories"])
+            store.categories[column] = categories
+            store.category_codes[column] = {category: code for code, category in enumerate(categories)}
+            store.codes[column] = array.array("l", columns[column]["codes"])
+        store.content = list(columns["content"])
+        store.table_data = {row: value for row, value in enumerate(columns["table_data"]) if value is not None}
+        return store
+
+    def to_columns(self):
+        """
+        Get the store as columns, with categorical columns as categories and codes.
+        :return: dict of column values
+        """
+        columns = {}
+        for column in INTEGER_COLUMNS:
+            columns[column] = [None if value == NULL_INTEGER else value for value in self.integers[column]]
+        for column in CATEGORICAL_COLUMNS:
+            columns[column] = {"categories": list(self.categories[column]), "codes": self.codes[column].tolist()}
+        columns["content"] = list(self.content)
+        columns["table_data"] = [self.table_data.get(row) for row in range(self.count)]
+        return columns
+
+    def append(self, line):
+        """
+        Append a line.
+        :param line: line dict
+        :return:
+        """
+        for column in INTEGER_COLUMNS:
+            value = line[column]
+            self.integers[column].append(NULL_INTEGER if value is None else value)
+        for column in CATEGORICAL_COLUMNS:
+            self.codes[column].append(self.get_code(column, line[column], create=True))
+        self.content.append(line["content"])
+        if line["table_data"] is not None:
+            self.table_data[self.count] = line["table_data"]
+        self.count += 1
+        self.indexes.clear()
+
+    def get_code(self, column: str, value, create: bool = False):
+        """
+        Get the code of a categorical value.
+        :param column: categorical column
+        :param value: value
+        :param create: whether to add the value to the categories if missing
+        :return: code, or None if missing and not created
+        """
+        category_codes = self.category_codes[column]
+        try:
+            return category_codes[value]
+        except KeyError:
+            if not create:
+                return None
+            category_codes[value] = code = len(self.categories[column])
+            self.categories[column].append(value)
+            return code
+
+    def get_value(self, row: int, column: str):
+        """
+        Get a single value.
+        :param row: row position
+        :param column: column name
+        :return: value
+        """
+        if column in self.codes:
+            return self.categories[column][self.codes[column][row]]
+        if column in self.integers:
+            value = self.integers[column][row]
+            return None if value == NULL_INTEGER else value
+        if column == "content":
+            return self.content[row]
+        if column == "table_data":
+            return self.table_data.get(row)
+        raise KeyError(column)
+
+    def index(self, column: str):
+        """
+        Get the index of a column, mapping each value to the positions of its rows in order.  The
+        index is built in one pass on first use and kept until the store changes.
+        :param column: column name
+        :return: dict of value to list of row positions
+        """
+        try:
+            return self.indexes[column]
+        except KeyError:
+            pass
+        if column in self.codes:
+            code_rows = [[] for _ in self.categories[column]]
+            for row, code in enumerate(self.codes[column]):
+                code_rows[code].append(row)
+            index = {category: code_rows[code] for code, category in enumerate(self.categories[column])
+                     if code_rows[code]}
+        else:
+            index = {}
+            for row in range(self.count):
+                index.setdefault(self.get_value(row, column), []).append(row)
+        self.indexes[column] = index
+        return index
+
+    def rows(self, column: str, value):
+        """
+        Get the positions of the rows where a column equals a value.
+        :param column: column name
+        :param value: value
+        :return: list of row positions
+        """
+        return self.index(column).get(value, [])
+
+    def select(self, rows: Iterable[int]):
+        """
+        Get views of rows by position.
+        :param rows: row positions
+        :return: list of LineView
+        """
+        return [LineView(self, row) for row in rows]
+
+    def find(self, column: str, value):
+        """
+        Find the rows where a column equals a value.
+        :param column: column name
+        :param value: value
+        :return: list of LineView
+        """
+        return self.select(self.rows(column, value))
+
+    def to_dicts(self):
+        """
+        Copy all rows into plain line dicts.
+        :return: list of dict
+        """
+        return [LineView(self, row).to_dict() for row in range(self.count)]
+
+    def tolist(self):
+        """
+        Get all rows as views; JSON encoders such as the REST framework's call this for array-like
+        objects, and encode each view as a dict.
+        :return: list of LineView
+        """
+        return [LineView(self, row) for row in range(self.count)]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [LineView(self, row) for row in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("line index out of range")
+        return LineView(self, index)
+
+    def __len__(self):
+        return self.count
+
+    def __eq__(self, other):
+        if not isinstance(other, (LineStore, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(line == other_line for line, other_line in zip(self, other))
+
+    def __repr__(self):
+        return "LineStore(count={0})".format(self.count)
@@ -10,8 +10,47 @@ import numpy
 from openedgar.parsers.html_table_parser import HTMLTableParser
 from openedgar.parsers.text_table_parser import TextTableParser
 
+INLINE_TAGS = ["a","abbr","acronym","b","bdo","big","button","cite","code","dfn","em", "font", "i",\
+    "img","input", "kbd","label","map","object","output","q","samp","script","select","small",\
+    "span", "strong", "sub", "sup", "textarea", "time", "tt","var"]
+INLINE_TAG_SET = frozenset(INLINE_TAGS)
+ITEM_NUMBER_RE = re.compile(r"^\s*item\s*([0-9]+[A-Za-z]*)", re.IGNORECASE)
+TEXT_ITEM_NUMBER_RE = re.compile(r"\s*item\s+([0-9]+[A-Za-z]*)", re.IGNORECASE)
+TEXT_PAGE_RE = re.compile("<page>", re.IGNORECASE)
+TEXT_TABLE_START_RE = re.compile("<table>", re.IGNORECASE)
+TEXT_TABLE_END_RE = re.compile("</table>", re.IGNORECASE)
+
+
+class LineModelCleaner(Cleaner):
+    """
+    Cleaner that remembers its verdict on each distinct style string; filing agents repeat the same
+    handful of inline styles on thousands of elements.
+    """
+
+    max_cache_size = 10000
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.sneaky_cache = {}
+
+    def _has_sneaky_javascript(self, style):
+        try:
+            return self.sneaky_cache[style]
+        except KeyError:
+            if len(self.sneaky_cache) >= self.max_cache_size:
+                self.sneaky_cache.clear()
+            result = self.sneaky_cache[style] = super()._has_sneaky_javascript(style)
+            return result
+
+
+HTML_CLEANER = LineModelCleaner(comments=True, safe_attrs=lxml.html.defs.safe_attrs | set(['style']))
+
+
 class SECFilingContentParser():
 
+    # Version of the line model; bump whenever parsed output changes so cached line models are rebuilt
+    VERSION = 3
+
     def __init__(self, raw_content, is_text_file):
         self.is_text_file = is_text_file
         if is_text_file:
@@ -26,9 +65,7 @@ class SECFilingContentParser():
         return self.lines
 
     def inline(self): 
-        return ["a","abbr","acronym","b","bdo","big","button","cite","code","dfn","em", "font", "i",\
-        "img","input", "kbd","label","map","object","output","q","samp","script","select","small",\
-            "span", "strong", "sub", "sup", "textarea", "time", "tt","var"]
+        return INLINE_TAGS
 
     def all_html_elements(self):
         cleaner = Cleaner(comments=True, safe_attrs=lxml.html.defs.safe_attrs | set(['style'])) 
@@ -49,67 +86,59 @@ class SECFilingContentParser():
             parent.remove(table)
         return [doc, tables]
 
+    def parse_text_table(self, content):
+        """
+        Parse the lines of a <TABLE> region, falling back to the raw lines if they do not parse.
+        :param content: list of table lines
+        :return: table data
+        """
+        try:
+            return TextTableParser(content).parse_table()
+        except Exception:
+            return content
+
     def process_text(self):
-        final_lines = []
-        style=None
-        item_number=None
-        element_position = None
+        """
+        Build the line model of a plain-text filing in one pass.  Each <TABLE> region, from the
+        <TABLE> line up to the line before </TABLE>, is collapsed into a single table line at the
+        position of its first line as the lines stream past.
+        :return: list of line dicts
+        """
+        lines = []
+        item_number = None
         page_number = 1
         table_index = 1
         table_index_place_holder = None
+        table_line = None
         for i, e in enumerate(self.raw_content):
-            item_num_search = re.search("^item\s+[0-9]+[A-Za-z]*", e.strip(), re.IGNORECASE)
-            if item_num_search:
-                numbers = re.search("[0-9]+[A-Za-z]*", e.strip(), re.IGNORECASE)
-                item_number = numbers.group(0)
-            page_num_search = re.search("<page>", e.strip(), re.IGNORECASE)
-            if page_num_search:
+            match = TEXT_ITEM_NUMBER_RE.match(e)
+            if match:
+                item_number = match.group(1)
+            if TEXT_PAGE_RE.search(e):
                 page_number = page_number + 1
-            table_start_index_search = re.search("[<]table[>]", e.strip(), re.IGNORECASE)
-            if table_start_index_search:
+            if TEXT_TABLE_START_RE.search(e):
                 table_index_place_holder = table_index
-            table_end_index_search = re.search("[<][/]table[>]", e.strip(), re.IGNORECASE)
-            if table_end_index_search:
+            if TEXT_TABLE_END_RE.search(e):
                 table_index_place_holder = None
                 table_index += 1
-            line_data = {"line_index": i, "element_index": element_position, "item_number": item_number, "page_number": page_number,\
-                "tag": None, "style": None, "content": e, "table_index": table_index_place_holder, "table_data": None}
-            final_lines.append(line_data)
-        table_dict = {}
-        for index, table in itertools.groupby(final_lines, key=lambda x: x['table_index']):
-            if index:
-                content = [tab['content'] for tab in list(table)]
-                try:
-                    table_dict[index] = {}
-                    table_dict[index]["table_data"] = TextTableParser(content).parse_table()
-                    table_dict[index]["content"] = content    
-                except:
-                    table_dict[index] = {}
-                    table_dict[index]["table_data"] = content    
-                    table_dict[index]["content"] = content
-        table_indicies = list(set([l['table_index'] for l in final_lines if l['table_index']]))
-        for ti in table_indicies:
-            first_line = [l for l in final_lines if l['table_index'] == ti][0]
-            index = final_lines.index(first_line)
-            new_line = first_line
-            new_line['tag'] = "table"
-            new_line['content'] = table_dict[new_line['table_index']]['content']
-            new_line['table_data'] = table_dict[new_line['table_index']]['table_data']
-            for l in final_lines:
-                if l['table_index'] == ti:
-                    final_lines.remove(l)
-            final_lines.insert(index, new_line)
-#        final_df = pandas.DataFrame(final_lines)
-#        final_df = final_df.replace(numpy.nan, False, regex=True)
-#        final_df = final_df.drop_duplicates(subset="table_index")
-#        final_lines = final_df.to_dict("records")
-        #get a set of all the table indexes; then iterate over them, insert one table line before the first of each; then remove the rest
- #       for line in final_lines:
- #           if line['table_index']:
- #               line['tag'] = "table"
- #               line['content'] = table_dict[line['table_index']]["content"]
- #               line['table_data'] = table_dict[line['table_index']]['table_data']
-        return final_lines
+
+            if table_index_place_holder is None:
+                if table_line is not None:
+                    table_line["table_data"] = self.parse_text_table(table_line["content"])
+                    table_line = None
+                lines.append({"line_index": i, "element_index": None, "item_number": item_number,
+                              "page_number": page_number, "tag": None, "style": None, "content": e,
+                              "table_index": None, "table_data": None})
+            elif table_line is None:
+                table_line = {"line_index": i, "element_index": None, "item_number": item_number,
+                              "page_number": page_number, "tag": "table", "style": None, "content": [e],
+                              "table_index": table_index_place_holder, "table_data": None}
+                lines.append(table_line)
+            else:
+                table_line["content"].append(e)
+        if table_line is not None:
+            table_line["table_data"] = self.parse_text_table(table_line["content"])
+        return lines
 
     def test_process_html(self):
         html_doc, tables = self.extract_tables_from_html()
@@ -124,104 +153,86 @@ class SECFilingContentParser():
                 print(etree.tostring(e, encoding='unicode', method='text', pretty_print=True))
 
 
+    def clean_html_tree(self):
+        """
+        Parse and clean the document once, in place.  Cleaner.clean_html would serialize the cleaned
+        tree for a second parse; the only structural change that round trip makes is folding away a
+        <body> left under the root once <html> is dropped, so that is done here instead.
+        :return: root element
+        """
+        doc = fromstring(self.raw_content)
+        HTML_CLEANER(doc)
+        for body in doc.findall("body"):
+            body.drop_tag()
+        return doc
+
     def process_html(self):
-        html_doc, tables = self.extract_tables_from_html()
+        """
+        Build the line model in one pass over the cleaned tree.  Block elements start a new line
+        holding the text accumulated since the previous one; tables are parsed where they stand
+        and their subtree skipped, matching the placeholder handling of the legacy builder kept in
+        openedgar.benchmarks.content_parser.
+        :return: list of line dicts
+        """
+        html_doc = self.clean_html_tree()
         lines = []
-        text = ""
-        style= ""
+        text_parts = []
+        style_parts = []
         item_number = None
-        element_position=0
         page_number = 1
-        for i, e in enumerate(html_doc.iter()):
-            if not e.tag in self.inline():
-                element_position=i
-                search = re.search("^\s*item\s*[0-9]+[A-Za-z]*", text, re.IGNORECASE)
-                if search:
-                    numbers = re.search("[0-9]+[A-Za-z]*", text, re.IGNORECASE)
-                    item_number = numbers.group(0)
-                if e.tag == "table":
-                    table_index = e.get("name")
-                    table_doc = tables[table_index]
-                    table_data = HTMLTableParser(table_doc).parsed_table_unclean()
-                    table_text = self.extract_table_content(table_doc)
-                    line_data = {"line_index": len(lines), "element_index": element_position, "item_number": item_number, "page_number": page_number,\
-                        "tag": e.tag, "style": style, "content": table_text, "table_index": table_index, "table_data": table_data}
+        table_count = 0
+        element_position = -1
+        stack = [html_doc]
+        while stack:
+            e = stack.pop()
+            element_position += 1
+            tag = e.tag
+            if tag not in INLINE_TAG_SET:
+                text = "".join(text_parts)
+                match = ITEM_NUMBER_RE.match(text)
+                if match:
+                    item_number = match.group(1)
+                if tag == "table":
+                    line_data = {"line_index": len(lines), "element_index": element_position, "item_number": item_number,
+                                 "page_number": page_number, "tag": tag, "style": "".join(style_parts),
+                                 "content": self.extract_table_content(e), "table_index": str(table_count),
+                                 "table_data": HTMLTableParser(e).parsed_table_unclean()}
+                    table_count += 1
                 else:
-                    line_data = {"line_index": len(lines), "element_index": element_position, "item_number": item_number, "page_number": page_number,\
-                    "tag": e.tag, "style": style, "content": text.strip(), "table_index": None, "table_data": None}
+                    line_data = {"line_index": len(lines), "element_index": element_position, "item_number": item_number,
+                                 "page_number": page_number, "tag": tag, "style": "".join(style_parts),
+                                 "content": text.strip(), "table_index": None, "table_data": None}
                 lines.append(line_data)
-                text = ""
-                style = ""
+                text_parts = []
+                style_parts = []
+
+            # Tables stand in for their whole subtree, including their tail text
+            if tag == "table":
+                continue
             if e.text:
-                text = text + e.text.replace(u'\xa0',' ')
+                text_parts.append(e.text.replace(u'\xa0',' '))
             if e.tail:
-                text = text + e.tail.replace(u'\xa0',' ')
-            if e.get("style"):
-                style = style + e.get("style").strip() + ";"
-            if e.tag == "hr":
+                text_parts.append(e.tail.replace(u'\xa0',' '))
+            element_style = e.get("style")
+            if element_style:
+                style_parts.append(element_style.strip() + ";")
+            if tag == "hr":
                 page_number = page_number + 1
-            elif e.tag == "div" and e.get("style"):
-                if "page-break-" in e.get("style"):
-                    page_number = page_number + 1                    
+            elif tag == "div" and element_style:
+                if "page-break-" in element_style:
+                    page_number = page_number + 1
+            stack.extend(reversed(e))
         return lines
 
-
     def extract_table_content(self, table_doc):
         content = []
-        text = ""
+        text_parts = []
         for element in table_doc.iter():
-#            print(element.text)
-            if not element.tag in self.inline():
-                content.append(text.strip())
-                text = ""
+            if element.tag not in INLINE_TAG_SET:
+                content.append("".join(text_parts).strip())
+                text_parts = []
             if element.text:
-                text = text + element.text
+                text_parts.append(element.text)
             if element.tail:
-                text = text + element.tail
+                text_parts.append(element.tail)
         return content
-
-    def old_process_html(self):
-        lines = []
-        text = ""
-        style= ""
-        item_number = None
-        element_position=0
-        page_number = 1
-        table_index = None
-        table_data = None
-        for i, e in enumerate(self.elements):
-            if not e.tag in self.inline():
-                element_position=i
-                search = re.search("^\s*item\s*[0-9]+[A-Za-z]*", text, re.IGNORECASE)
-                if search:
-                    numbers = re.search("[0-9]+[A-Za-z]*", text, re.IGNORECASE)
-                    item_number = numbers.group(0)
-                if e.tag == "table":
-                    if table_index is None:
-                        table_index = 0
-                    else:
-                        table_index += 1
-                    table_data = HTMLTableParser(e).parsed_table_unclean()
-                    line_data = {"line_index": len(lines), "element_index": element_position, "item_number": item_number, "page_number": page_number,\
-                        "tag": e.tag, "style": style, "content": text.strip(), "table_index": table_index, "table_data": table_data}
-                elif e.tag == "tr" or e.tag=="td" or e.tag=="th":
-                    line_data = {"line_index": len(lines), "element_index": element_position, "item_number": item_number, "page_number": page_number,\
-                        "tag": e.tag, "style": style, "content": text.strip(), "table_index": table_index, "table_data": None}
-                else:
-                    line_data = {"line_index": len(lines), "element_index": element_position, "item_number": item_number, "page_number": page_number,\
-                    "tag": e.tag, "style": style, "content": text.strip(), "table_index": None, "table_data": None}
-                lines.append(line_data)
-                text = ""
-                style = ""
-            if e.text:
-                text = text + e.text.replace(u'\xa0',' ')
-            if e.tail:
-                text = text + e.tail.replace(u'\xa0',' ')
-            if e.get("style"):
-                style = style + e.get("style").strip() + ";"
-            if e.tag == "hr":
-                page_number = page_number + 1
-            elif e.tag == "div" and e.get("style"):
-                if "page-break-" in e.get("style"):
-                    page_number = page_number + 1                    
-        return lines
@@ -0,0 +1,116 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import functools
+import re
+from typing import Iterable
+
+TERM_GROUP = "_term{0}"
+
+
+class TermMatcher:
+    """
+    Case-insensitive matcher for a set of search term regular expressions.  The terms are compiled
+    once into a single alternation with one named group per term, so a line is scanned once to
+    find whether any term matches and which one did.  When every term is anchored with ^ and has no
+    top-level alternation of its own, the anchor is hoisted out of the alternation so non-matching
+    lines fail at their first character.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        """
+        :param terms: search term regular expressions, as passed to re.search
+        """
+        self.terms = tuple(terms)
+        self.patterns = [re.compile(term, re.IGNORECASE) for term in self.terms]
+        self.group_terms = {TERM_GROUP.format(i): term for i, term in enumerate(self.terms)}
+        self.pattern = self.compile_alternation()
+
+    def compile_alternation(self):
+        """
+        Compile the terms into one pattern, or return None if they cannot be combined, e.g. because
+        they use numbered back-references or repeat a group name.
+        :return: compiled pattern or None
+        """
+        if not self.terms or any(re.search(r"\\[1-9]", term) for term in self.terms):
+            return None
+        anchored = all(term.startswith("^") and "|" not in term for term in self.terms)
+        groups = []
+        for i, term in enumerate(self.terms):
+            groups.append("(?P<{0}>{1})".format(TERM_GROUP.format(i), term[1:] if anchored else term))
+        source = "|".join(groups)
+        if anchored:
+            source = "^(?:{0})".format(source)
+        try:
+            pattern = re.compile(source, re.IGNORECASE)
+        except re.error:
+            return None
+        return pattern
+
+    def search(self, text: str):
+        """
+        Find the first term, in term order among those matching at the leftmost position, that
+        matches the text.
+        :param text: text to search
+        :return: matched term, or None
+        """
+        if self.pattern is None:
+            for term, pattern in zip(self.terms, self.patterns):
+                if pattern.search(text):
+                    return term
+            return None
+        match = self.pattern.search(text)
+        if match is None:
+            return None
+        # Each term group encloses any groups of the term itself, so it is the last to close
+        return self.group_terms[match.lastgroup]
+
+    def matches_any(self, text: str):
+        """
+        Check whether any term matches the text.
+        :param text: text to search
+        :return: bool
+        """
+        if self.pattern is None:
+            return any(pattern.search(text) for pattern in self.patterns)
+        return self.pattern.search(text) is not None
+
+    def matches_all(self, text: str):
+        """
+        Check whether every term matches the text.
+        :param text: text to search
+        :return: bool
+        """
+        return all(pattern.search(text) for pattern in self.patterns)
+
+
+@functools.lru_cache(maxsize=256)
+def get_term_matcher(terms: tuple):
+    """
+    Get the compiled matcher for a term tuple, compiling it on first use.
+    :param terms: tuple of search term regular expressions
+    :return: TermMatcher
+    """
+    return TermMatcher(terms)
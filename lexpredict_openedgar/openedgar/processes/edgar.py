@@ -24,16 +24,18 @@ SOFTWARE.
 
 # Libraries
 from typing import Iterable
+import datetime
+import io
 import logging
 import os
+# Packages
+from django.db.models import Max
 # Project
 import openedgar.clients.edgar
-from openedgar.clients.s3 import S3Client
-from openedgar.clients.local import LocalClient
-import openedgar.clients.local
+import openedgar.clients
 import openedgar.parsers.edgar
-from openedgar.models import FilingDocument, SearchQueryTerm, SearchQuery, FilingIndex
-from openedgar.tasks import process_filing_index, search_filing_document_sha1
+from openedgar.models import Filing, FilingDocument, SearchQueryTerm, SearchQuery, FilingIndex
+from openedgar.tasks import process_filing_index, search_filing_documents_sha1, backfill_filing_document_offsets_chunk
 
 # Logging setup
 logger = logging.getLogger(__name__)
@@ -45,61 +47,74 @@ console.setFormatter(formatter)
 logger.addHandler(console)
 
 
-def download_filing_index_data(year: int = None):
+def download_filing_index_data(year: int = None, filing_index_list: Iterable[str] = None):
     """
     Download all filing index data.
     :param year:
+    :param filing_index_list: optional list of EDGAR index paths to download instead of listing
     :return:
     """
     # Get filing index list
-    if year is not None:
+    if filing_index_list is not None:
+        pass
+    elif year is not None:
         filing_index_list = openedgar.clients.edgar.list_index_by_year(year)
     else:
         filing_index_list = openedgar.clients.edgar.list_index()
 
     path_list = []
-    configured_client = os.environ["CLIENT_TYPE"]
+    configured_client = openedgar.clients.get_client_type()
     logger.info(msg="Configured client is: {}".format(configured_client))
     path_prefix = str()
 
-    if configured_client is None or configured_client == "S3":
-        # Create S3 client
-        download_client = S3Client()
-    else:
-        download_client = LocalClient()
+    download_client = openedgar.clients.get_client(configured_client)
+    if configured_client != "S3":
         path_prefix = os.environ["DOWNLOAD_PATH"]
 
-    # Now iterate through list to check if already on S3
+    # Map EDGAR index paths to storage paths
+    storage_paths = {}
     for filing_index_path in filing_index_list:
         # Cleanup path
         if filing_index_path.startswith("/Archives/"):
-            file_path = os.path.join(path_prefix, filing_index_path[len("/Archives/"):])
+            storage_paths[filing_index_path] = os.path.join(path_prefix, filing_index_path[len("/Archives/"):])
         else:
-            file_path = os.path.join(path_prefix, filing_index_path)
+            storage_paths[filing_index_path] = os.path.join(path_prefix, filing_index_path)
 
-        # Check if exists in database
-        try:
-            filing_index = FilingIndex.objects.get(edgar_url=filing_index_path)
-            is_processed = filing_index.is_processed
+    # Check database and storage in bulk
+    processed_indices = dict(FilingIndex.objects.filter(edgar_url__in=list(storage_paths))
+                             .values_list("edgar_url", "is_processed"))
+    stored_paths = download_client.paths_exist(storage_paths.values())
+
+    # Queue downloads for missing indices
+    missing_paths = {}
+    for filing_index_path, file_path in storage_paths.items():
+        if filing_index_path in processed_indices:
+            is_processed = processed_indices[filing_index_path]
             logger.info("Index {0} already exists in DB.".format(filing_index_path))
-        except FilingIndex.DoesNotExist:
+        else:
             is_processed = False
             logger.info("Index {0} does not exist in DB.".format(filing_index_path))
 
-        # Check if exists; download and upload to S3 if missing
-        if not download_client.path_exists(file_path):
-            # Download
-            buffer, _ = openedgar.clients.edgar.get_buffer(filing_index_path)
-
-            # Upload
-            download_client.put_buffer(file_path, buffer)
-
-            logger.info("Retrieved {0} and uploaded to S3.".format(filing_index_path))
-            path_list.append((file_path, True, is_processed))
+        if not stored_paths[file_path]:
+            missing_paths[filing_index_path] = (file_path, is_processed)
         else:
             logger.info("Index {0} already exists on S3.".format(filing_index_path))
             path_list.append((file_path, False, is_processed))
 
+    # Download missing indices concurrently and upload
+    index_buffers = openedgar.clients.edgar.get_buffers(missing_paths, use_cache=True)
+    for filing_index_path, buffer, _, error in index_buffers:
+        file_path, is_processed = missing_paths[filing_index_path]
+        if error is not None or buffer is None:
+            logger.error("Unable to retrieve {0}: {1}".format(filing_index_path, error))
+            continue
+
+        # Upload
+        download_client.put_buffer(file_path, buffer)
+
+        logger.info("Retrieved {0} and uploaded to S3.".format(filing_index_path))
+        path_list.append((file_path, True, is_processed))
+
     # Return list of updates
     return path_list
 
@@ -119,7 +134,7 @@ def process_all_filing_index(year: int = None, form_type_list: Iterable[str] = N
     # Get the list of file paths
     file_path_list = download_filing_index_data(year)
 
-    client_type = os.environ["CLIENT_TYPE"] or "S3"
+    client_type = openedgar.clients.get_client_type()
 
     # Process each file
     for s3_path, _, is_processed in file_path_list:
@@ -136,9 +151,66 @@ def process_all_filing_index(year: int = None, form_type_list: Iterable[str] = N
             logger.info("Skipping process_filing_index for {0}...".format(s3_path))
 
 
+def get_index_high_water_mark(index_type: str = "form"):
+    """
+    Get the publication date of the newest processed daily index of a given type.
+    :param index_type: index file prefix, e.g., form, company, or master
+    :return: date, or None if no dated index has been processed
+    """
+    return FilingIndex.objects.filter(index_type=index_type, is_processed=True, date_published__isnull=False) \
+        .aggregate(high_water_mark=Max("date_published"))["high_water_mark"]
+
+
+def process_daily_index_delta(index_type: str = "form", form_type_list: Iterable[str] = None,
+                              min_date: datetime.date = None, store_raw: bool = True, store_text: bool = True):
+    """
+    Ingest only the daily index files published after the last processed one.  Only the years and
+    quarters at or after the high-water mark are listed, and indices are processed in publication
+    order, stopping at the first failure so the mark never moves past an unprocessed day.
+    :param index_type: index file prefix, e.g., form, company, or master
+    :param form_type_list: optional list of form type to process
+    :param min_date: starting date if no index of this type has been processed yet
+    :param store_raw:
+    :param store_text:
+    :return: list of processed storage paths
+    """
+    # Locate index files newer than the high-water mark
+    high_water_mark = get_index_high_water_mark(index_type) or min_date
+    logger.info("High-water mark for {0} index: {1}".format(index_type, high_water_mark))
+    filing_index_list = openedgar.clients.edgar.list_index(index_type=index_type, min_date=high_water_mark)
+    filing_index_list = sorted(filing_index_list,
+                               key=lambda p: openedgar.parsers.edgar.parse_index_path(p)[1] or datetime.date.min)
+    if len(filing_index_list) == 0:
+        logger.info("No new {0} index files since {1}".format(index_type, high_water_mark))
+        return []
+
+    # Download new indices and process in publication order
+    file_path_list = download_filing_index_data(filing_index_list=filing_index_list)
+    file_path_map = {os.path.basename(file_path): file_path for file_path, _, _ in file_path_list}
+    client_type = openedgar.clients.get_client_type()
+
+    processed_path_list = []
+    for filing_index_path in filing_index_list:
+        file_path = file_path_map.get(os.path.basename(filing_index_path))
+        if file_path is None:
+            logger.error("Unable to retrieve filing index {0}; stopping delta".format(filing_index_path))
+            break
+
+        logger.info("Processing filing index for {0}...".format(file_path))
+        try:
+            process_filing_index(client_type, file_path, form_type_list=form_type_list, store_raw=store_raw,
+                                 store_text=store_text)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Unable to process filing index {0}; stopping delta: {1}".format(file_path, e))
+            break
+        processed_path_list.append(file_path)
+
+    return processed_path_list
+
+
 def search_filing_documents(term_list: Iterable[str], form_type_list: Iterable[str] = None, sequence: int = None,
                             case_sensitive: bool = False,
-                            token_search: bool = False, stem_search: bool = False):
+                            token_search: bool = False, stem_search: bool = False, batch_size: int = 100):
     """
     Search a filing document by sha1 hash.
     :param term_list: list of terms
@@ -147,6 +219,7 @@ def search_filing_documents(term_list: Iterable[str], form_type_list: Iterable[s
     :param case_sensitive:
     :param token_search:
     :param stem_search:
+    :param batch_size: number of documents per search task
     :return:
     """
 
@@ -171,13 +244,19 @@ def search_filing_documents(term_list: Iterable[str], form_type_list: Iterable[s
     if sequence is not None:
         document_list = document_list.filter(sequence=sequence)
 
-    # Create distributed search tasks
+    # Create distributed search tasks, one per batch of documents
     n = 0
-    for document in document_list.all():
-        search_filing_document_sha1.delay(document.sha1, term_list, search_query.id, document.id,
-                                          case_sensitive=case_sensitive, token_search=token_search,
-                                          stem_search=stem_search)
+    batch = []
+    for sha1, document_id in document_list.values_list("sha1", "id").iterator():
+        batch.append((sha1, document_id))
         n += 1
+        if len(batch) >= batch_size:
+            search_filing_documents_sha1.delay(batch, term_list, search_query.id, case_sensitive=case_sensitive,
+                                               token_search=token_search, stem_search=stem_search)
+            batch = []
+    if len(batch) > 0:
+        search_filing_documents_sha1.delay(batch, term_list, search_query.id, case_sensitive=case_sensitive,
+                                           token_search=token_search, stem_search=stem_search)
 
     logger.info("Searching {0} documents for {1} terms...".format(n, len(term_list)))
 
@@ -206,3 +285,71 @@ ORDER BY f.date_filed, f.company_id
 """.format(search_query_id)
     query_df = pandas.read_sql(query_string, django.db.connection)
     query_df.to_csv(output_file_path, encoding="utf-8", index=False)
+
+
+def backfill_filing_document_offsets(filing_id_list: Iterable[int] = None, batch_size: int = 500, client=None):
+    """
+    Recompute FilingDocument start_pos/end_pos as byte offsets into the stored filing.  Records
+    created before offsets were tracked in bytes hold character offsets, which drift on any
+    filing with non-ASCII content.  Document sha1 values are unchanged, as documents are still
+    hashed over their UTF-8 re-encoded content.
+    :param filing_id_list: optional list of Filing ids to limit the backfill to
+    :param batch_size: number of FilingDocument rows to update per query
+    :param client: optional storage client to re-use
+    :return: number of FilingDocument rows updated
+    """
+    if client is None:
+        client = openedgar.clients.get_client()
+
+    filing_list = Filing.objects.filter(is_processed=True).order_by("id")
+    if filing_id_list is not None:
+        filing_list = filing_list.filter(id__in=filing_id_list)
+
+    updated_count = 0
+    pending = []
+    for filing in filing_list.iterator():
+        try:
+            filing_buffer = client.get_buffer(filing.s3_path)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Unable to retrieve {0} for offset backfill: {1}".format(filing.s3_path, e))
+            continue
+
+        # Map document sequence to byte offsets
+        offsets = {}
+        for document in openedgar.parsers.edgar.parse_filing(filing_buffer)["documents"]:
+            try:
+                offsets[int(document["sequence"])] = (document["start_pos"], document["end_pos"])
+            except (TypeError, ValueError):
+                logger.warning("Skipping document with invalid sequence in {0}".format(filing.s3_path))
+
+        for filing_document in filing.filingdocument_set.all():
+            if filing_document.sequence not in offsets:
+                continue
+            start_pos, end_pos = offsets[filing_document.sequence]
+            if filing_document.start_pos != start_pos or filing_document.end_pos != end_pos:
+                filing_document.start_pos = start_pos
+                filing_document.end_pos = end_pos
+                pending.append(filing_document)
+
+        if len(pending) >= batch_size:
+            FilingDocument.objects.bulk_update(pending, ["start_pos", "end_pos"], batch_size=batch_size)
+            updated_count += len(pending)
+            pending = []
+
+    if len(pending) > 0:
+        FilingDocument.objects.bulk_update(pending, ["start_pos", "end_pos"], batch_size=batch_size)
+        updated_count += len(pending)
+
+    logger.info("Updated byte offsets for {0} filing documents".format(updated_count))
+    return updated_count
+
+
+def dispatch_offset_backfill(chunk_size: int = 1000):
+    """
+    Queue one offset backfill task per chunk of processed filings.
+    :param chunk_size: number of Filing ids per task
+    :return: list of AsyncResult
+    """
+    filing_id_list = list(Filing.objects.filter(is_processed=True).order_by("id").values_list("id", flat=True))
+    return [backfill_filing_document_offsets_chunk.delay(filing_id_list[i:i + chunk_size])
+            for i in range(0, len(filing_id_list), chunk_size)]
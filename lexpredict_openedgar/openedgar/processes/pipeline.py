@@ -0,0 +1,238 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from typing import Callable, Iterable
+
+# Packages
+import django.db
+
+# Project
+from config.settings.base import HTTP_MAX_WORKERS
+import openedgar.clients.edgar
+import openedgar.parsers.edgar
+
+# Logging setup
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+console.setFormatter(formatter)
+logger.addHandler(console)
+
+# Queue end marker
+STAGE_DONE = None
+
+
+def get_parse_context():
+    """
+    Multiprocessing context for the parse pool, preferring forkserver where the platform supports it.
+    :return: multiprocessing context
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+class FilingPipeline:
+    """
+    Three-stage filing pipeline: fetch (threads; storage or EDGAR), parse and hash (process pool
+    over parse_filing_record), and persist (a small number of database writer threads).  Stages
+    are joined by bounded queues, and at most queue_size filings are in flight between fetch and
+    persist, so a slow database throttles parsing and parsing throttles fetching.
+    """
+
+    def __init__(self, client, persist: Callable, store_raw: bool = False, store_text: bool = False,
+                 fetch_workers: int = HTTP_MAX_WORKERS, parse_workers: int = None, persist_workers: int = 1,
+                 queue_size: int = None):
+        """
+        :param client: storage client holding filings
+        :param persist: callable(client, file_path, filing_data, store_raw=, store_text=) returning None on error
+        :param store_raw: whether to store raw document contents
+        :param store_text: whether to extract and store document text
+        :param fetch_workers: number of fetch threads
+        :param parse_workers: number of parse processes; defaults to CPU count
+        :param persist_workers: number of database writer threads
+        :param queue_size: max filings in flight between fetch and persist; defaults to 2 per parse worker
+        """
+        self.client = client
+        self.persist = persist
+        self.store_raw = store_raw
+        self.store_text = store_text
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.persist_workers = persist_workers
+        self.queue_size = queue_size or 2 * self.parse_workers
+        self.stats = {"fetched": 0, "downloaded": 0, "parsed": 0, "persisted": 0, "errors": 0}
+        self.stats_lock = threading.Lock()
+
+    def count(self, key: str):
+        """
+        Increment a pipeline statistic.
+        :param key: statistic name
+        :return:
+        """
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def fetch(self, file_path: str):
+        """
+        Retrieve a filing from storage, or from EDGAR and store it if missing.
+        :param file_path: storage path, e.g., edgar/data/.../0000000000-18-000001.txt
+        :return: filing buffer, or None on error
+        """
+        if self.client.path_exists(file_path):
+            self.count("fetched")
+            return self.client.get_buffer(file_path)
+
+        try:
+            filing_buffer, _ = openedgar.clients.edgar.get_buffer("/Archives/{0}".format(file_path))
+        except RuntimeError as e:
+            logger.error("Unable to access resource {0} from EDGAR: {1}".format(file_path, e))
+            return None
+        if filing_buffer is None:
+            logger.error("Unable to retrieve resource {0} from EDGAR".format(file_path))
+            return None
+
+        self.client.put_buffer(file_path, filing_buffer)
+        self.count("downloaded")
+        return filing_buffer
+
+    def fetch_stage(self, path_queue: queue.Queue, fetch_queue: queue.Queue):
+        """
+        Fetch worker: move paths to buffers until the path queue is drained.
+        :param path_queue: queue of storage paths
+        :param fetch_queue: bounded queue of (file_path, filing_buffer)
+        :return:
+        """
+        while True:
+            try:
+                file_path = path_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            try:
+                filing_buffer = self.fetch(file_path)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Unable to fetch filing {0}: {1}".format(file_path, e))
+                filing_buffer = None
+
+            if filing_buffer is None:
+                self.count("errors")
+                continue
+            fetch_queue.put((file_path, filing_buffer))
+
+    def persist_stage(self, persist_queue: queue.Queue, in_flight: threading.BoundedSemaphore):
+        """
+        Persist worker: write parsed filings to the database until the end marker.
+        :param persist_queue: queue of (file_path, parse future)
+        :param in_flight: semaphore released as each filing leaves the pipeline
+        :return:
+        """
+        try:
+            while True:
+                item = persist_queue.get()
+                if item is STAGE_DONE:
+                    return
+
+                file_path, future = item
+                try:
+                    filing_data = future.result()
+                    self.count("parsed")
+                    if self.persist(self.client, file_path, filing_data, store_raw=self.store_raw,
+                                    store_text=self.store_text) is None:
+                        self.count("errors")
+                    else:
+                        self.count("persisted")
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.error("Unable to process filing {0}: {1}".format(file_path, e))
+                    self.count("errors")
+                finally:
+                    in_flight.release()
+        finally:
+            # Database connections are per thread
+            django.db.connection.close()
+
+    def run(self, file_path_list: Iterable[str]):
+        """
+        Run all filings through the pipeline.
+        :param file_path_list: storage paths of filings to process
+        :return: dict of stage counts
+        """
+        path_queue = queue.Queue()
+        for file_path in file_path_list:
+            path_queue.put(file_path)
+        logger.info("Processing {0} filings with {1} fetch threads, {2} parse processes, {3} persist threads"
+                    .format(path_queue.qsize(), self.fetch_workers, self.parse_workers, self.persist_workers))
+
+        fetch_queue = queue.Queue(maxsize=self.queue_size)
+        persist_queue = queue.Queue()
+        in_flight = threading.BoundedSemaphore(self.queue_size)
+
+        # Start fetch and persist threads
+        fetch_threads = [threading.Thread(target=self.fetch_stage, args=(path_queue, fetch_queue), daemon=True)
+                         for _ in range(self.fetch_workers)]
+        persist_threads = [threading.Thread(target=self.persist_stage, args=(persist_queue, in_flight), daemon=True)
+                           for _ in range(self.persist_workers)]
+        for thread in fetch_threads + persist_threads:
+            thread.start()
+
+        def fetch_done():
+            for thread in fetch_threads:
+                thread.join()
+            fetch_queue.put(STAGE_DONE)
+
+        threading.Thread(target=fetch_done, daemon=True).start()
+
+        # Dispatch fetched buffers to the parse pool; in_flight bounds parse and persist backlog.  Parse
+        # processes are started on demand while the fetch and persist threads run, so they come from a
+        # forkserver rather than a fork of this threaded process, which could inherit a held lock.
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.parse_workers,
+                                                    mp_context=get_parse_context()) as executor:
+            while True:
+                item = fetch_queue.get()
+                if item is STAGE_DONE:
+                    break
+
+                file_path, filing_buffer = item
+                in_flight.acquire()
+                future = executor.submit(openedgar.parsers.edgar.parse_filing_record, filing_buffer,
+                                         self.store_text)
+                persist_queue.put((file_path, future))
+
+        # Drain persist stage
+        for _ in persist_threads:
+            persist_queue.put(STAGE_DONE)
+        for thread in persist_threads:
+            thread.join()
+
+        logger.info("Completed filing pipeline: {0}".format(self.stats))
+        return dict(self.stats)
@@ -23,10 +23,14 @@ SOFTWARE.
 """
 
 # Libraries
+import concurrent.futures
 import logging
+import time
+from typing import Iterable
 
-from config.settings.base import S3_BUCKET
+from config.settings.base import S3_BUCKET, HTTP_MAX_WORKERS, SWEEP_SUSPECT_SIZE, PAYLOAD_HEAD_SIZE
 import openedgar.clients.edgar
+import openedgar.clients.payload
 import openedgar.clients.s3
 
 # Setup logger
@@ -38,6 +42,25 @@ formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
 console.setFormatter(formatter)
 logger.addHandler(console)
 
+# Empty files plus every kind of stored error page
+SWEEP_KINDS = ("empty",) + openedgar.clients.payload.PAYLOAD_KINDS
+
+
+def classify_object(remote_path: str, size: int, client=None):
+    """
+    Classify a stored object from its listed size, fetching only the head of small objects.
+    :param remote_path: S3 path under bucket
+    :param size: stored size from listing metadata
+    :param client: optional client to re-use
+    :return: tuple of kind of bad object or None, and whether a ranged GET was needed
+    """
+    if size == 0:
+        return "empty", False
+    if size > SWEEP_SUSPECT_SIZE:
+        return None, False
+    buffer = openedgar.clients.s3.S3Client().get_buffer_head(remote_path, PAYLOAD_HEAD_SIZE, client=client)
+    return openedgar.clients.payload.classify_payload(buffer), True
+
 
 def is_access_denied_file(remote_path: str, client=None):
     """
@@ -46,12 +69,8 @@ def is_access_denied_file(remote_path: str, client=None):
     :param client:
     :return:
     """
-    # Create client if not passed
-    buffer = openedgar.clients.s3.get_buffer(remote_path, client)
-    if b"<Error><Code>AccessDenied</Code><Message>Access Denied</Message><RequestId>" in buffer:
-        return True
-    else:
-        return False
+    buffer = openedgar.clients.s3.S3Client().get_buffer_head(remote_path, PAYLOAD_HEAD_SIZE, client=client)
+    return openedgar.clients.payload.classify_payload(buffer) == "access_denied"
 
 
 def is_empty_file(remote_path: str, client=None):
@@ -63,7 +82,7 @@ def is_empty_file(remote_path: str, client=None):
     """
     # Create client if not passed
     if client is None:
-        client = openedgar.clients.s3.get_client()
+        client = openedgar.clients.s3.S3Client().get_client()
 
     # HEAD object
     s3_object = client.head_object(Bucket=S3_BUCKET, Key=remote_path)
@@ -84,7 +103,7 @@ def is_rate_limited_file(remote_path: str, size_only: bool = True, client=None):
     """
     # Create client if not passed
     if client is None:
-        client = openedgar.clients.s3.get_client()
+        client = openedgar.clients.s3.S3Client().get_client()
 
     # Perform requested check type
     if size_only:
@@ -96,136 +115,196 @@ def is_rate_limited_file(remote_path: str, size_only: bool = True, client=None):
         else:
             return False
     else:
-        # GET object
-        s3_object = client.get_object(Bucket=S3_BUCKET, Key=remote_path)
+        # Ranged GET of the head of the object
+        buffer = openedgar.clients.s3.S3Client().get_buffer_head(remote_path, PAYLOAD_HEAD_SIZE, client=client)
+        return openedgar.clients.payload.classify_payload(buffer) == "rate_limited"
 
-        buffer = s3_object["Body"].read()
-        if b"SEC.gov | Request Rate Threshold Exceeded" in buffer:
-            return True
-        else:
-            return False
 
-
-def clean_rate_limited_files(cik: int = None, fix: bool = True, client=None):
+def get_cik_path_list(cik: int = None, shard: int = 0, shard_count: int = 1, client=None):
     """
-    Clean any rate limited files on S3, optionally filtering by CIK.
-    :param cik: CIK to filter by
-    :param fix: whether to fix files by downloading
+    Get the CIK folders to sweep, optionally limited to one shard of the CIK space.
+    :param cik: single CIK to sweep
+    :param shard: shard number, from 0 to shard_count - 1
+    :param shard_count: number of shards the CIK space is split into
     :param client: optional S3 client to re-use
-    :return:
+    :return: list of CIK paths
     """
-    # Create client if not passed
-    if client is None:
-        logger.info("Creating fresh S3 client...")
-        client = openedgar.clients.s3.get_client()
-
-    # Track cleaned files
-    file_list = []
-
-    # Only handle per-CIK case
-    if cik is None:
-        # Get list of CIKs under top-level folder
-        cik_path_list = openedgar.clients.s3.list_path_folders("edgar/data/", client=client)
-    else:
-        # Otherwise populate list with single CIK
-        cik_path_list = [openedgar.clients.edgar.get_cik_path(cik)]
-
-    logger.info("Checking {0} CIKs for bad rate-limited files...".format(len(cik_path_list)))
+    if cik is not None:
+        return [openedgar.clients.edgar.get_cik_path(cik)]
 
+    cik_path_list = openedgar.clients.s3.S3Client().list_path_folders("edgar/data/", client=client)
+    shard_path_list = []
     for cik_path in cik_path_list:
-        for remote_path in openedgar.clients.s3.list_path(cik_path, client=client):
-            # Check if bad
-            is_bad = is_rate_limited_file(remote_path, client=client)
-
-            # Track if bad
-            if is_bad:
-                logger.info("Found bad file: {0}".format(remote_path))
-                file_list.append(remote_path)
+        folder_name = cik_path.strip("/").split("/")[-1]
+        shard_key = int(folder_name) if folder_name.isdigit() else sum(folder_name.encode("utf-8"))
+        if shard_key % shard_count == shard:
+            shard_path_list.append(cik_path)
+    return shard_path_list
 
-                # Fix if requested
-                if fix:
-                    logger.info("Fixing file: {0}".format(remote_path))
 
-                    # Ensure path is correct
-                    if not remote_path.strip("/").startswith("Archives/"):
-                        edgar_url = "/Archives/{0}".format(remote_path.strip("/"))
-                    else:
-                        edgar_url = remote_path
+def fix_object(remote_path: str, kind: str, client=None):
+    """
+    Fix a bad object: re-download rate-limited pages and empty files from EDGAR, and delete objects
+    that EDGAR reports as missing or that recorded an S3 error response.
+    :param remote_path: S3 path under bucket
+    :param kind: kind of bad object
+    :param client: optional S3 client to re-use
+    :return: true if fixed
+    """
+    s3_client = openedgar.clients.s3.S3Client()
+    if kind in ("access_denied", "not_found", "s3_error"):
+        success = s3_client.delete_path(remote_path, client=client)
+        if success:
+            logger.info("Deleted {0}...".format(remote_path))
+        else:
+            logger.error("Unable to delete {0}...".format(remote_path))
+        return bool(success)
 
-                    # Get buffer from EDGAR
-                    buffer, _ = openedgar.clients.edgar.get_buffer(edgar_url)
+    # Ensure path is correct
+    if not remote_path.strip("/").startswith("Archives/"):
+        edgar_url = "/Archives/{0}".format(remote_path.strip("/"))
+    else:
+        edgar_url = remote_path
 
-                    # Replace bad remote path on S3
-                    openedgar.clients.s3.put_buffer(remote_path, buffer, client)
+    # Get buffer from EDGAR and replace bad remote path on S3
+    buffer, _ = openedgar.clients.edgar.get_buffer(edgar_url)
+    if buffer is None or len(buffer) == 0:
+        logger.error("Unable to locate non-zero length replacement for {0}".format(remote_path))
+        return False
+    s3_client.put_buffer(remote_path, buffer, client=client)
+    logger.info("Replaced {0} with new {1}-byte file...".format(remote_path, len(buffer)))
+    return True
 
-                    # Log fix
-                    logger.info("Replaced {0} with new {1}-byte file...".format(remote_path, len(buffer)))
 
-    logger.info("Located {0} bad files...".format(len(file_list)))
-    return file_list
+def new_sweep_report(shard: int = 0, shard_count: int = 1):
+    """
+    Create an empty sweep report.
+    :return: report dictionary
+    """
+    return {"shard": shard, "shard_count": shard_count, "prefixes": 0, "objects": 0, "bytes": 0,
+            "ranged_gets": 0, "fixed": 0, "counts": {kind: 0 for kind in SWEEP_KINDS},
+            "files": {kind: [] for kind in SWEEP_KINDS}, "errors": {}, "elapsed": 0.0}
 
 
-def clean_empty_files(cik: int = None, fix: bool = True, client=None):
+def merge_sweep_reports(report_list: Iterable[dict]):
     """
-    Clean any empty files on S3, optionally filtering by CIK.
-    :param cik: CIK to filter by
-    :param fix: whether to fix files by downloading
+    Combine sweep reports, e.g., from every shard of a distributed sweep.
+    :param report_list: list of reports
+    :return: combined report
+    """
+    report_list = list(report_list)
+    merged = new_sweep_report(shard=None, shard_count=report_list[0]["shard_count"] if report_list else 1)
+    for report in report_list:
+        for key in ("prefixes", "objects", "bytes", "ranged_gets", "fixed"):
+            merged[key] += report[key]
+        for kind in SWEEP_KINDS:
+            merged["counts"][kind] += report["counts"][kind]
+            merged["files"][kind].extend(report["files"][kind])
+        merged["errors"].update(report["errors"])
+        merged["elapsed"] = max(merged["elapsed"], report["elapsed"])
+    return merged
+
+
+def sweep_cik_path(cik_path: str, kinds: Iterable[str] = SWEEP_KINDS, fix: bool = True, client=None):
+    """
+    Sweep every object under one CIK folder.
+    :param cik_path: CIK folder
+    :param kinds: kinds of bad object to report and fix
+    :param fix: whether to fix bad objects
     :param client: optional S3 client to re-use
-    :return:
+    :return: report dictionary for the folder
     """
-    # Create client if not passed
+    report = new_sweep_report()
+    report["prefixes"] = 1
+    for remote_path, size in openedgar.clients.s3.S3Client().list_objects(cik_path, client=client):
+        report["objects"] += 1
+        report["bytes"] += size
+        try:
+            kind, ranged = classify_object(remote_path, size, client=client)
+            report["ranged_gets"] += int(ranged)
+            if kind is None or kind not in kinds:
+                continue
+
+            logger.info("Found bad {0} file: {1}".format(kind, remote_path))
+            report["counts"][kind] += 1
+            report["files"][kind].append(remote_path)
+            if fix and fix_object(remote_path, kind, client=client):
+                report["fixed"] += 1
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Unable to sweep {0}: {1}".format(remote_path, e))
+            report["errors"][remote_path] = str(e)
+    return report
+
+
+def sweep_s3(cik: int = None, shard: int = 0, shard_count: int = 1, kinds: Iterable[str] = SWEEP_KINDS,
+             fix: bool = True, max_workers: int = HTTP_MAX_WORKERS, client=None):
+    """
+    Sweep S3 for empty files and stored error pages in one pass, listing CIK folders in parallel.
+    Objects are classified from listed sizes; only small objects get a ranged GET of their head.
+    :param cik: single CIK to sweep
+    :param shard: shard of the CIK space to sweep, from 0 to shard_count - 1
+    :param shard_count: number of shards the CIK space is split into
+    :param kinds: kinds of bad object to report and fix; see SWEEP_KINDS
+    :param fix: whether to fix bad objects
+    :param max_workers: number of CIK folders swept concurrently
+    :param client: optional S3 client to re-use
+    :return: report dictionary
+    """
+    start_time = time.time()
     if client is None:
-        logger.info("Creating fresh S3 client...")
-        client = openedgar.clients.s3.get_client()
+        client = openedgar.clients.s3.S3Client().get_client()
+    kinds = set(kinds)
 
-    # Track cleaned files
-    file_list = []
+    cik_path_list = get_cik_path_list(cik, shard=shard, shard_count=shard_count, client=client)
+    logger.info("Sweeping {0} CIKs in shard {1}/{2} for {3}...".format(len(cik_path_list), shard, shard_count,
+                                                                      ", ".join(sorted(kinds))))
 
-    # Only handle per-CIK case
-    if cik is None:
-        # Get list of CIKs under top-level folder
-        cik_path_list = openedgar.clients.s3.list_path_folders("edgar/data/", client=client)
-    else:
-        # Otherwise populate list with single CIK
-        cik_path_list = [openedgar.clients.edgar.get_cik_path(cik)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        report_list = list(executor.map(lambda cik_path: sweep_cik_path(cik_path, kinds, fix, client),
+                                        cik_path_list))
 
-    logger.info("Checking {0} CIKs for bad zero-byte files...".format(len(cik_path_list)))
-
-    for cik_path in cik_path_list:
-        for remote_path in openedgar.clients.s3.list_path(cik_path, client=client):
-            # Check if bad
-            is_bad = is_empty_file(remote_path, client=client)
+    report = merge_sweep_reports(report_list)
+    report["shard"] = shard
+    report["shard_count"] = shard_count
+    report["elapsed"] = time.time() - start_time
+    logger.info("Swept {0} objects ({1} bytes) under {2} CIKs with {3} ranged GETs in {4:.1f}s; found {5}, fixed {6}, "
+                "{7} errors".format(report["objects"], report["bytes"], report["prefixes"], report["ranged_gets"],
+                                    report["elapsed"], report["counts"], report["fixed"], len(report["errors"])))
+    return report
 
-            # Track if bad
-            if is_bad:
-                logger.info("Found bad file: {0}".format(remote_path))
-                file_list.append(remote_path)
 
-                # Fix if requested
-                if fix:
-                    logger.info("Fixing file: {0}".format(remote_path))
-
-                    # Ensure path is correct
-                    if not remote_path.strip("/").startswith("Archives/"):
-                        edgar_url = "/Archives/{0}".format(remote_path.strip("/"))
-                    else:
-                        edgar_url = remote_path
+def dispatch_sweep(shard_count: int, kinds: Iterable[str] = SWEEP_KINDS, fix: bool = True):
+    """
+    Queue one sweep task per shard of the CIK space, so each Celery worker takes a shard.
+    :param shard_count: number of shards
+    :param kinds: kinds of bad object to report and fix
+    :param fix: whether to fix bad objects
+    :return: list of AsyncResult; pass their results to merge_sweep_reports
+    """
+    from openedgar.tasks import sweep_s3_shard
+    return [sweep_s3_shard.delay(shard, shard_count, kinds=list(kinds), fix=fix) for shard in range(shard_count)]
 
-                    # Get buffer from EDGAR
-                    buffer, _ = openedgar.clients.edgar.get_buffer(edgar_url)
 
-                    # Replace bad remote path on S3
-                    if len(buffer) > 0:
-                        openedgar.clients.s3.put_buffer(remote_path, buffer, client)
+def clean_rate_limited_files(cik: int = None, fix: bool = True, client=None):
+    """
+    Clean any rate limited files on S3, optionally filtering by CIK.
+    :param cik: CIK to filter by
+    :param fix: whether to fix files by downloading
+    :param client: optional S3 client to re-use
+    :return:
+    """
+    return sweep_s3(cik=cik, kinds=["rate_limited"], fix=fix, client=client)["files"]["rate_limited"]
 
-                        # Log fix
-                        logger.info("Replaced {0} with new {1}-byte file...".format(remote_path, len(buffer)))
-                    else:
-                        # Log error
-                        logger.error("Unable to locate non-zero length replacement for {0}".format(remote_path))
 
-    logger.info("Located {0} bad files...".format(len(file_list)))
-    return file_list
+def clean_empty_files(cik: int = None, fix: bool = True, client=None):
+    """
+    Clean any empty files on S3, optionally filtering by CIK.
+    :param cik: CIK to filter by
+    :param fix: whether to fix files by downloading
+    :param client: optional S3 client to re-use
+    :return:
+    """
+    return sweep_s3(cik=cik, kinds=["empty"], fix=fix, client=client)["files"]["empty"]
 
 
 def clean_access_denied_files(cik: int = None, fix: bool = True, client=None):
@@ -236,48 +315,4 @@ def clean_access_denied_files(cik: int = None, fix: bool = True, client=None):
     :param client: optional S3 client to re-use
     :return:
     """
-    # Create client if not passed
-    if client is None:
-        logger.info("Creating fresh S3 client...")
-        client = openedgar.clients.s3.get_client()
-
-    # Track cleaned files
-    file_list = []
-
-    # Only handle per-CIK case
-    if cik is None:
-        # Get list of CIKs under top-level folder
-        cik_path_list = openedgar.clients.s3.list_path_folders("edgar/data/", client=client)
-    else:
-        # Otherwise populate list with single CIK
-        cik_path_list = [openedgar.clients.edgar.get_cik_path(cik)]
-
-    logger.info("Checking {0} CIKs for bad access denied files...".format(len(cik_path_list)))
-
-    for cik_path in cik_path_list:
-        for remote_path in openedgar.clients.s3.list_path(cik_path, client=client):
-            # Check if bad
-            is_bad = is_access_denied_file(remote_path, client=client)
-
-            # Track if bad
-            if is_bad:
-                logger.info("Found bad file: {0}".format(remote_path))
-                file_list.append(remote_path)
-
-                # Fix if requested
-                if fix:
-                    logger.info("Removing file: {0}".format(remote_path))
-
-                    # Replace bad remote path on S3
-                    success = openedgar.clients.s3.delete_path(remote_path, client)
-
-                    # Log fix
-                    if success:
-                        logger.info("Deleted {0}...".format(remote_path))
-                    else:
-                        logger.error("Unable to delete {0}...".format(remote_path))
-            else:
-                logger.info("No issues found with {0}".format(remote_path))
-
-    logger.info("Located {0} bad files...".format(len(file_list)))
-    return file_list
+    return sweep_s3(cik=cik, kinds=["access_denied"], fix=fix, client=client)["files"]["access_denied"]
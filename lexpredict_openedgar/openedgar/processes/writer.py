@@ -0,0 +1,309 @@
+"""
+MIT License
+
+Copyright (c) 2018 ContraxSuite, LLC
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Libraries
+import datetime
+import logging
+import threading
+from typing import Iterable
+
+# Packages
+import django.db.transaction
+
+# Project
+from openedgar.clients.blob import BlobStore
+from openedgar.models import Company, CompanyInfo, Filing, FilingDocument
+
+# Logging setup
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+console.setFormatter(formatter)
+logger.addHandler(console)
+
+
+def to_date(value):
+    """
+    Normalize a parsed filing date to a date.
+    :param value: date, datetime, or None
+    :return: date or None
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def build_filing_document(filing: Filing, document: dict):
+    """
+    Build an unsaved FilingDocument record from a parse_filing document.
+    :param filing: Filing record
+    :param document: document dictionary from parse_filing
+    :return: FilingDocument
+    """
+    filing_doc = FilingDocument()
+    filing_doc.filing = filing
+    filing_doc.type = document["type"]
+    filing_doc.sequence = document["sequence"]
+    filing_doc.file_name = document["file_name"]
+    filing_doc.content_type = document["content_type"]
+    filing_doc.description = document["description"]
+    filing_doc.sha1 = document["sha1"]
+    filing_doc.start_pos = document["start_pos"]
+    filing_doc.end_pos = document["end_pos"]
+    filing_doc.is_processed = True
+    filing_doc.is_error = len(document["content"]) > 0
+    return filing_doc
+
+
+def find_stored_contents(blob_store: BlobStore, documents: Iterable[dict], store_raw: bool = False,
+                         store_text: bool = False):
+    """
+    Check which document contents are already stored, with one batched existence check per kind.
+    :param blob_store: content-addressed document store
+    :param documents: document dictionaries from parse_filing
+    :param store_raw: whether raw contents will be stored
+    :param store_text: whether text contents will be stored
+    :return: set of "kind/sha1" keys already stored
+    """
+    documents = list(documents)
+    stored = set()
+    if store_raw:
+        sha1_list = {document["sha1"] for document in documents if len(document["content"]) > 0}
+        stored.update("raw/{0}".format(sha1) for sha1 in blob_store.exists_many("raw", sha1_list))
+    if store_text:
+        sha1_list = {document["sha1"] for document in documents if document["content_text"] is not None}
+        stored.update("text/{0}".format(sha1) for sha1 in blob_store.exists_many("text", sha1_list))
+    return stored
+
+
+def store_document_contents(blob_store: BlobStore, filing, document: dict, store_raw: bool = False,
+                            store_text: bool = False, stored: set = None):
+    """
+    Store raw and text contents of a filing document by sha1 if not already present.
+    :param blob_store: content-addressed document store
+    :param filing: Filing record or path, for logging
+    :param document: document dictionary from parse_filing
+    :param store_raw: whether to store raw contents
+    :param store_text: whether to store text contents
+    :param stored: optional result of find_stored_contents, updated as contents are stored
+    :return:
+    """
+    # Upload raw if requested
+    if store_raw and len(document["content"]) > 0:
+        key = "raw/{0}".format(document["sha1"])
+        if blob_store.put("raw", document["sha1"], document["content"],
+                          exists=None if stored is None else key in stored):
+            logger.info("Uploaded raw file for filing={0}, sequence={1}, sha1={2}"
+                        .format(filing, document["sequence"], document["sha1"]))
+        else:
+            logger.info("Raw file for filing={0}, sequence={1}, sha1={2} already exists"
+                        .format(filing, document["sequence"], document["sha1"]))
+        if stored is not None:
+            stored.add(key)
+
+    # Upload text if requested
+    if store_text and document["content_text"] is not None:
+        key = "text/{0}".format(document["sha1"])
+        if blob_store.put("text", document["sha1"], document["content_text"],
+                          exists=None if stored is None else key in stored):
+            logger.info("Uploaded text contents for filing={0}, sequence={1}, sha1={2}"
+                        .format(filing, document["sequence"], document["sha1"]))
+        else:
+            logger.info("Text contents for filing={0}, sequence={1}, sha1={2} already exists"
+                        .format(filing, document["sequence"], document["sha1"]))
+        if stored is not None:
+            stored.add(key)
+
+
+class FilingBatchWriter:
+    """
+    Accumulate parsed filings and write their Company, CompanyInfo, Filing and FilingDocument rows
+    in one transaction per batch, using ON CONFLICT DO NOTHING for companies and documents.  If a
+    batch fails, each filing is retried in its own savepoint so one bad filing only fails itself.
+    Per-filing outcomes are kept in filings and errors.
+    """
+
+    def __init__(self, blob_store: BlobStore, batch_size: int = 100, store_raw: bool = False,
+                 store_text: bool = False):
+        """
+        :param blob_store: content-addressed store for raw and text document contents
+        :param batch_size: number of filings per transaction
+        :param store_raw: whether to store raw document contents
+        :param store_text: whether to store document text contents
+        """
+        self.blob_store = blob_store
+        self.batch_size = batch_size
+        self.store_raw = store_raw
+        self.store_text = store_text
+        self.pending = []
+        self.filings = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, file_path: str, filing_data: dict):
+        """
+        Queue a parsed filing, flushing when the batch is full.
+        :param file_path: storage path of the filing
+        :param filing_data: result of parse_filing_record
+        :return:
+        """
+        with self.lock:
+            self.pending.append((file_path, filing_data))
+            if len(self.pending) >= self.batch_size:
+                self.flush_pending()
+
+    def persist(self, client, file_path: str, filing_data: dict, store_raw: bool = False, store_text: bool = False):
+        """
+        FilingPipeline persist callable; outcomes are recorded once the batch is flushed.
+        :return: file_path
+        """
+        self.add(file_path, filing_data)
+        return file_path
+
+    def flush(self):
+        """
+        Write all pending filings.
+        :return:
+        """
+        with self.lock:
+            self.flush_pending()
+
+    def flush_pending(self):
+        """
+        Write pending filings; caller holds the lock.
+        :return:
+        """
+        batch, self.pending = self.pending, []
+        if len(batch) == 0:
+            return
+
+        # Screen out unparseable and already-recorded filings
+        existing_paths = set(Filing.objects.filter(s3_path__in=[file_path for file_path, _ in batch])
+                             .values_list("s3_path", flat=True))
+        good_batch = []
+        for file_path, filing_data in batch:
+            if filing_data.get("cik") is None:
+                self.errors[file_path] = "Unable to parse CIK from filing"
+            elif file_path in existing_paths:
+                self.errors[file_path] = "Filing has already been created"
+            else:
+                good_batch.append((file_path, filing_data))
+                existing_paths.add(file_path)
+        if len(good_batch) == 0:
+            return
+
+        # Store document contents outside the transaction; paths are content-addressed
+        try:
+            stored = find_stored_contents(self.blob_store, (document for _, filing_data in good_batch
+                                                            for document in filing_data["documents"]),
+                                          store_raw=self.store_raw, store_text=self.store_text)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning("Unable to check stored document contents in bulk: {0}".format(e))
+            stored = None
+        stored_batch = []
+        for file_path, filing_data in good_batch:
+            try:
+                for document in filing_data["documents"]:
+                    store_document_contents(self.blob_store, file_path, document, store_raw=self.store_raw,
+                                            store_text=self.store_text, stored=stored)
+                stored_batch.append((file_path, filing_data))
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Unable to store document contents for {0}: {1}".format(file_path, e))
+                self.errors[file_path] = str(e)
+        good_batch = stored_batch
+        if len(good_batch) == 0:
+            return
+
+        try:
+            with django.db.transaction.atomic():
+                filing_list = self.write(good_batch)
+            self.filings.update((filing.s3_path, filing) for filing in filing_list)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning("Batch of {0} filings failed, retrying individually: {1}".format(len(good_batch), e))
+            for file_path, filing_data in good_batch:
+                try:
+                    with django.db.transaction.atomic():
+                        filing_list = self.write([(file_path, filing_data)])
+                    self.filings[file_path] = filing_list[0]
+                except Exception as f:  # pylint: disable=broad-except
+                    logger.error("Unable to create filing records for {0}: {1}".format(file_path, f))
+                    self.errors[file_path] = str(f)
+
+        logger.info("Flushed {0} filings; {1} written, {2} errors".format(len(batch), len(self.filings),
+                                                                       len(self.errors)))
+
+    def write(self, batch: Iterable):
+        """
+        Upsert records for a batch of filings inside the caller's transaction.
+        :param batch: list of (file_path, filing_data)
+        :return: list of created Filing records
+        """
+        # Companies
+        cik_list = sorted({int(filing_data["cik"]) for _, filing_data in batch})
+        Company.objects.bulk_create([Company(cik=cik) for cik in cik_list], ignore_conflicts=True)
+
+        # CompanyInfo has no unique constraint, so concurrent writers are serialized on their company
+        # rows, locked in cik order as in bulk_create_light_filings, before checking for existing info
+        list(Company.objects.select_for_update().filter(cik__in=cik_list).order_by("cik").values_list("cik", flat=True))
+
+        # Company info for each new (company, date)
+        existing_info = set(CompanyInfo.objects.filter(company_id__in=cik_list).values_list("company_id", "date"))
+        company_info_list = []
+        for _, filing_data in batch:
+            info_key = (int(filing_data["cik"]), to_date(filing_data["date_filed"]))
+            if info_key in existing_info:
+                continue
+            existing_info.add(info_key)
+            company_info_list.append(CompanyInfo(company_id=info_key[0], name=filing_data["company_name"],
+                                                 sic=filing_data["sic"],
+                                                 state_incorporation=filing_data["state_incorporation"],
+                                                 state_location=filing_data["state_location"],
+                                                 date=info_key[1]))
+        CompanyInfo.objects.bulk_create(company_info_list)
+
+        # Filings; documents are written in the same transaction, so they are processed on commit
+        filing_list = [Filing(form_type=filing_data["form_type"], accession_number=filing_data["accession_number"],
+                              date_filed=to_date(filing_data["date_filed"]),
+                              document_count=filing_data["document_count"],
+                              company_id=int(filing_data["cik"]), sha1=filing_data["sha1"], s3_path=file_path,
+                              is_processed=True, is_error=False)
+                       for file_path, filing_data in batch]
+        Filing.objects.bulk_create(filing_list)
+
+        # Backends that cannot return ids from bulk inserts need a lookup
+        if any(filing.pk is None for filing in filing_list):
+            filing_ids = dict(Filing.objects.filter(s3_path__in=[filing.s3_path for filing in filing_list])
+                              .values_list("s3_path", "id"))
+            for filing in filing_list:
+                filing.pk = filing_ids[filing.s3_path]
+
+        # Filing documents
+        document_list = [build_filing_document(filing, document)
+                         for filing, (_, filing_data) in zip(filing_list, batch)
+                         for document in filing_data["documents"]]
+        FilingDocument.objects.bulk_create(document_list, ignore_conflicts=True)
+
+        return filing_list
@@ -24,28 +24,32 @@ SOFTWARE.
 
 # Libraries
 import datetime
-import hashlib
 import logging
-import tempfile
 import os
-import pathlib
-from typing import Iterable, Union
+from typing import Iterable, Tuple, Union
 import pandas
+import lxml.html
 from lxml.html import parse
 import urllib
 import re
 import numpy
 # Packages
 import dateutil.parser
+import django.db.transaction
 import django.db.utils
 from celery import shared_task
 
 # Project
-from config.settings.base import S3_DOCUMENT_PATH
-from openedgar.clients.s3 import S3Client
-from openedgar.clients.local import LocalClient
+from config.settings.base import S3_DOCUMENT_PATH, STORAGE_MAX_CONCURRENCY
+import openedgar.clients
+from openedgar.clients.aio import map_concurrent
+from openedgar.clients.blob import BlobStore
 import openedgar.clients.edgar
 import openedgar.parsers.edgar
+from openedgar.processes.pipeline import FilingPipeline
+import openedgar.processes.s3
+from openedgar.processes.writer import FilingBatchWriter, build_filing_document, find_stored_contents, \
+    store_document_contents
 from openedgar.models import Filing, CompanyInfo, Company, FilingDocument, SearchQuery, SearchQueryTerm, \
     SearchQueryResult, FilingIndex, TableBookmark
 
@@ -61,15 +65,14 @@ formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
 console.setFormatter(formatter)
 logger.addHandler(console)
 
-CLIENT_TYPE = "LOCAL_CLIENT"
+CLIENT_TYPE = openedgar.clients.get_client_type()
 LOCAL_DOCUMENT_PATH = os.environ["DOWNLOAD_PATH"]
 DOCUMENT_PATH = ""
 
+client = openedgar.clients.get_client(CLIENT_TYPE)
 if CLIENT_TYPE == "S3":
-    client = S3Client()
     DOCUMENT_PATH = S3_DOCUMENT_PATH
 else:
-    client = LocalClient()
     DOCUMENT_PATH = LOCAL_DOCUMENT_PATH
 
 def process_company_filings(client_type: str, cik: str, store_raw: bool = False, store_text: bool = False):
@@ -90,13 +93,11 @@ def process_company_filings(client_type: str, cik: str, store_raw: bool = False,
     cik_path = openedgar.clients.edgar.get_cik_path(cik)
     links = links_10k(cik)
 
-    if client_type == "S3":
-        client = S3Client()
-    else:
-        client = LocalClient()
+    client = openedgar.clients.get_client(client_type)
 
-    # Iterate through links
+    # Find links without a filing record
     bad_record_count = 0
+    new_filing_paths = []
     for row in links:
 
         # Cleanup path
@@ -118,34 +119,17 @@ def process_company_filings(client_type: str, cik: str, store_raw: bool = False,
             # Create new filing record
             logger.info("No Filing record found for {0}, creating...".format(filing_path))
             logger.info("Raw exception: {0}".format(f))
-
-
-            # Check if exists; download and upload to S3 if missing
-            if not client.path_exists(filing_path):
-                # Download
-                try:
-                    filing_buffer, _ = openedgar.clients.edgar.get_buffer("/Archives/{0}".format(filing_path))
-                except RuntimeError as g:
-                    logger.error("Unable to access resource {0} from EDGAR: {1}".format(filing_path, g))
-                    bad_record_count += 1
-                    #create_filing_error(row, filing_path)
-                    continue
-
-                # Upload
-                client.put_buffer(filing_path, filing_buffer)
-
-                logger.info("Downloaded from EDGAR and uploaded to {}...".format(client_type))
-            else:
-            # Download
-                logger.info("File already stored on {}, retrieving and processing...".format(client_type))
-                filing_buffer = client.get_buffer(filing_path)
-
-            # Parse
-            filing_result = process_filing(client, filing_path, filing_buffer, store_raw=store_raw, store_text=store_text)
-            if filing_result is None:
-                logger.error("Unable to process filing.")
-                bad_record_count += 1
-                #create_filing_error(row, filing_path)
+            new_filing_paths.append(filing_path)
+
+    # Fetch, parse and persist new filings in parallel stages, writing records in batches
+    writer = FilingBatchWriter(BlobStore(client, DOCUMENT_PATH), store_raw=store_raw, store_text=store_text)
+    pipeline = FilingPipeline(client, writer.persist, store_raw=store_raw, store_text=store_text)
+    pipeline_stats = pipeline.run(new_filing_paths)
+    writer.flush()
+    bad_record_count += pipeline_stats["errors"] + len(writer.errors)
+    logger.info("Processed {0} new filings for cik {1}; {2} errors".format(len(writer.filings), cik,
+                                                                         bad_record_count))
+    logger.info("Document store: {0}".format(writer.blob_store.dedupe_report()))
 
 def bulk_create_bookmarks(filename, label):
     data_file = pandas.read_csv(filename)
@@ -253,8 +237,8 @@ def write_all_comp_diluted_eps():
 def links_10k(cik):
     url = "https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK={0}&type=10-K&dateb=&owner=include&count=100".format(cik)
     print("links url: {0}".format(url))
-    parsed = parse(urllib.request.urlopen(url))
-    doc = parsed.getroot()
+    buffer, _ = openedgar.clients.edgar.get_buffer(url)
+    doc = lxml.html.fromstring(buffer)
     print("parsed doc root tag: {0}".format(doc.tag))
     links = doc.xpath("//a[@id='documentsbutton']")
     link_strings = []
@@ -312,6 +296,11 @@ def create_filing(cik, form_type, filing_path):
         except RuntimeError as g:
             logger.error("Unable to access resource {0} from EDGAR: {1}".format(filing_path, g))
             create_filing_error(row, filing_path)
+            return
+        if filing_buffer is None:
+            logger.error("Unable to retrieve resource {0} from EDGAR".format(filing_path))
+            create_filing_error(row, filing_path)
+            return
         # Upload
         client.put_buffer(filing_path, filing_buffer)
         logger.info("Downloaded from EDGAR and uploaded to {}...".format(CLIENT_TYPE))
@@ -325,46 +314,64 @@ def create_filing(cik, form_type, filing_path):
         logger.error("Unable to process filing.")
         create_filing_error(row, filing_path)
 
-def uploading_text_in_filing_documents(store_raw: False, store_text: True):
-
-    client=LocalClient()
-    processed_filings = Filing.objects.filter(is_processed=True)
-
-    for filing in processed_filings:
-        buffer_data = client.get_buffer(filing.s3_path)       
-        logger.info("parsing id# {0} s3_path: {1}".format(filing.id, filing.s3_path))
-        filing_data = openedgar.parsers.edgar.parse_filing(buffer_data, extract=True)
-        filing_documents = filing.filingdocument_set.all()
-        logger.info("number of FilingDocument objects calculated: {0}".format(len(filing_documents)) )
-        documents_data = filing_data["documents"]
-        logger.info("number of documents coming from data stream: {0}".format(len(documents_data)) )
-
-        # Iterate through documents
-        for document in filing_documents:
-            logger.info("WE'RE IN!!!!!!!!!!!!!!!!!!!!!")
-            filing_data = None
-
-            for d in documents_data:
-                logger.info("documents_data sequence: {0} type: {1}".format(d["sequence"], type(d["sequence"])))
-                logger.info("FilingDocument sequence: {0} type: {1}".format(document.sequence,type(document.sequence)))
-                if int(d["sequence"]) == document.sequence:
-                    logger.info("YAY")
-                    filing_data = d
-            if filing_data is not None:
-           # Upload text to S3 if requested
-                if store_text and filing_data["content_text"] is not None:
-                    raw_path = pathlib.Path(DOCUMENT_PATH, "text", filing_data["sha1"]).as_posix()
-                    if not client.path_exists(raw_path):
-                        client.put_buffer(raw_path, filing_data["content_text"], write_bytes=False)
-                        logger.info("Uploaded text contents for filing={0}, sequence={1}, sha1={2}"
-                                    .format(filing, filing_data["sequence"], filing_data["sha1"]))
-                    else:
-                        logger.info("Text contents for filing={0}, sequence={1}, sha1={2} already exists on S3"
-                                    .format(filing, filing_data["sequence"], filing_data["sha1"]))
+def uploading_text_in_filing_documents(store_raw: False, store_text: True, batch_size: int = STORAGE_MAX_CONCURRENCY):
+    """
+    Re-parse processed filings and upload missing document text blobs.  Processed filings are read
+    batch_size at a time by id, and each batch's filing buffers are fetched and text blobs stored
+    concurrently.
+    :param store_raw: unused; raw blobs are stored at ingestion
+    :param store_text: whether to upload document text
+    :param batch_size: number of filings fetched concurrently
+    :return:
+    """
+    client = openedgar.clients.get_client(CLIENT_TYPE)
+    blob_store = BlobStore(client, DOCUMENT_PATH)
+
+    last_id = 0
+    while True:
+        filing_batch = list(Filing.objects.filter(is_processed=True, id__gt=last_id).order_by("id")
+                            .values_list("id", "s3_path")[:batch_size])
+        if len(filing_batch) == 0:
+            break
+        last_id = filing_batch[-1][0]
+        buffer_list = map_concurrent(client, client.get_buffer, [(s3_path,) for _, s3_path in filing_batch],
+                                     max_concurrency=batch_size)
+
+        text_list = []
+        for (filing_id, s3_path), buffer_data in zip(filing_batch, buffer_list):
+            if isinstance(buffer_data, Exception):
+                logger.error("Unable to retrieve filing id# {0} s3_path: {1}: {2}"
+                             .format(filing_id, s3_path, buffer_data))
+                continue
+            logger.info("parsing id# {0} s3_path: {1}".format(filing_id, s3_path))
+            filing_data = openedgar.parsers.edgar.parse_filing(buffer_data, extract=True)
+            documents_data = {int(d["sequence"]): d for d in filing_data["documents"]}
+
+            # Match documents by sequence
+            for document in FilingDocument.objects.filter(filing_id=filing_id):
+                document_data = documents_data.get(document.sequence)
+                if document_data is None:
+                    document.is_processed = False
+                    document.is_error = True
+                    document.save()
+                elif store_text and document_data["content_text"] is not None:
+                    text_list.append((filing_id, document_data))
+
+        # Upload text blobs concurrently
+        result_list = map_concurrent(blob_store, blob_store.put, [("text", d["sha1"], d["content_text"])
+                                                                  for _, d in text_list],
+                                     max_concurrency=batch_size)
+        for (filing_id, document_data), result in zip(text_list, result_list):
+            if isinstance(result, Exception):
+                logger.error("Unable to upload text contents for filing id# {0}, sequence={1}, sha1={2}: {3}"
+                             .format(filing_id, document_data["sequence"], document_data["sha1"], result))
+            elif result:
+                logger.info("Uploaded text contents for filing id# {0}, sequence={1}, sha1={2}"
+                            .format(filing_id, document_data["sequence"], document_data["sha1"]))
             else:
-                document.is_processed = False
-                document.is_error = True
-                document.save()
+                logger.info("Text contents for filing id# {0}, sequence={1}, sha1={2} already exists"
+                            .format(filing_id, document_data["sequence"], document_data["sha1"]))
+
 
 def create_filing_documents(client, documents, filing, store_raw: bool = False, store_text: bool = False):
     """
@@ -377,44 +384,13 @@ def create_filing_documents(client, documents, filing, store_raw: bool = False,
     :return:
     """
     # Iterate through documents
+    blob_store = BlobStore(client, DOCUMENT_PATH)
+    stored = find_stored_contents(blob_store, documents, store_raw=store_raw, store_text=store_text)
     document_records = []
     for document in documents:
-        # Create DB object
-        filing_doc = FilingDocument()
-        filing_doc.filing = filing
-        filing_doc.type = document["type"]
-        filing_doc.sequence = document["sequence"]
-        filing_doc.file_name = document["file_name"]
-        filing_doc.content_type = document["content_type"]
-        filing_doc.description = document["description"]
-        filing_doc.sha1 = document["sha1"]
-        filing_doc.start_pos = document["start_pos"]
-        filing_doc.end_pos = document["end_pos"]
-        filing_doc.is_processed = True
-        filing_doc.is_error = len(document["content"]) > 0
-        document_records.append(filing_doc)
-
-        # Upload raw if requested
-        if store_raw and len(document["content"]) > 0:
-            raw_path = pathlib.Path(DOCUMENT_PATH, "raw", document["sha1"]).as_posix()
-            if not client.path_exists(raw_path):
-                client.put_buffer(raw_path, document["content"])
-                logger.info("Uploaded raw file for filing={0}, sequence={1}, sha1={2}"
-                            .format(filing, document["sequence"], document["sha1"]))
-            else:
-                logger.info("Raw file for filing={0}, sequence={1}, sha1={2} already exists on S3"
-                            .format(filing, document["sequence"], document["sha1"]))
-
-        # Upload text to S3 if requested
-        if store_text and document["content_text"] is not None:
-            raw_path = pathlib.Path(DOCUMENT_PATH, "text", document["sha1"]).as_posix()
-            if not client.path_exists(raw_path):
-                client.put_buffer(raw_path, document["content_text"], write_bytes=False)
-                logger.info("Uploaded text contents for filing={0}, sequence={1}, sha1={2}"
-                            .format(filing, document["sequence"], document["sha1"]))
-            else:
-                logger.info("Text contents for filing={0}, sequence={1}, sha1={2} already exists on S3"
-                            .format(filing, document["sequence"], document["sha1"]))
+        document_records.append(build_filing_document(filing, document))
+        store_document_contents(blob_store, filing, document, store_raw=store_raw, store_text=store_text,
+                                stored=stored)
 
     # Create in bulk
     FilingDocument.objects.bulk_create(document_records)
@@ -557,6 +533,101 @@ def create_light_filing(row, filing_path: str):
     filing.save()
     return True
 
+def bulk_create_light_filings(filing_index_data: pandas.DataFrame, form_type_list: Iterable[str] = None,
+                              batch_size: int = 1000):
+    """
+    Create Filing records, and any missing Company/CompanyInfo records, for every new row of a
+    parsed filing index using set-based lookups and batched inserts.
+    :param filing_index_data: data frame from parse_index_file
+    :param form_type_list: optional list of form type to process
+    :param batch_size: number of rows per query or insert
+    :return: tuple of created filing count, bad record count
+    """
+    if filing_index_data.shape[0] == 0:
+        return 0, 0
+
+    # Check for form type whitelist
+    index_data = filing_index_data
+    if form_type_list is not None:
+        index_data = index_data.loc[index_data["Form Type"].isin(list(form_type_list))]
+
+    # Cleanup paths
+    file_names = index_data["File Name"].astype(str)
+    file_names_lower = file_names.str.lower()
+    is_data_path = file_names_lower.str.startswith("data/")
+    is_edgar_path = file_names_lower.str.startswith("edgar/")
+    bad_record_count = int((~(is_data_path | is_edgar_path)).sum())
+    index_data = index_data.loc[is_data_path | is_edgar_path] \
+        .assign(s3_path=file_names.where(is_edgar_path, "edgar/" + file_names)) \
+        .drop_duplicates(subset="s3_path")
+
+    # Resolve existing filings with one query per batch
+    s3_path_list = index_data["s3_path"].tolist()
+    existing_paths = set()
+    for i in range(0, len(s3_path_list), batch_size):
+        existing_paths.update(Filing.objects.filter(s3_path__in=s3_path_list[i:i + batch_size])
+                              .values_list("s3_path", flat=True))
+    index_data = index_data.loc[~index_data["s3_path"].isin(existing_paths)]
+    logger.info("Found {0} existing and {1} new filings in index".format(len(existing_paths), index_data.shape[0]))
+    if index_data.shape[0] == 0:
+        return 0, bad_record_count
+
+    # Normalize CIK and date columns
+    index_data = index_data.assign(
+        cik=pandas.to_numeric(index_data["CIK"], errors="coerce"),
+        date_filed=pandas.to_datetime(index_data["Date Filed"].astype(str), errors="coerce"))
+    bad_record_count += int(index_data["cik"].isnull().sum())
+    index_data = index_data.loc[index_data["cik"].notnull()]
+    index_data = index_data.assign(cik=index_data["cik"].astype(numpy.int64))
+    date_filed_list = [d.date() if not pandas.isnull(d) else None for d in index_data["date_filed"]]
+    cik_list = [int(cik) for cik in index_data["cik"].unique()]
+
+    with django.db.transaction.atomic():
+        # Create missing companies; ON CONFLICT DO NOTHING handles existing and concurrent inserts
+        Company.objects.bulk_create([Company(cik=cik) for cik in cik_list], batch_size=batch_size,
+                                    ignore_conflicts=True)
+
+        # Filing and CompanyInfo have no unique constraint for ignore_conflicts to act on, so
+        # concurrent imports are serialized on their company rows, locked in cik order, and
+        # existence is re-checked under the lock
+        locked_cik_list = sorted(cik_list)
+        for i in range(0, len(locked_cik_list), batch_size):
+            list(Company.objects.select_for_update().filter(cik__in=locked_cik_list[i:i + batch_size])
+                 .order_by("cik").values_list("cik", flat=True))
+        s3_path_list = index_data["s3_path"].tolist()
+        concurrent_paths = set()
+        for i in range(0, len(s3_path_list), batch_size):
+            concurrent_paths.update(Filing.objects.filter(s3_path__in=s3_path_list[i:i + batch_size])
+                                    .values_list("s3_path", flat=True))
+        if len(concurrent_paths) > 0:
+            is_new = ~index_data["s3_path"].isin(concurrent_paths).values
+            index_data = index_data.loc[is_new]
+            date_filed_list = [d for d, keep in zip(date_filed_list, is_new) if keep]
+
+        # Create missing company info records for each (company, date)
+        existing_info = set()
+        for i in range(0, len(cik_list), batch_size):
+            existing_info.update(CompanyInfo.objects.filter(company_id__in=cik_list[i:i + batch_size])
+                                 .values_list("company_id", "date"))
+        company_info_list = []
+        for cik, company_name, date_filed in zip(index_data["cik"], index_data["Company Name"], date_filed_list):
+            if date_filed is None or (cik, date_filed) in existing_info:
+                continue
+            existing_info.add((cik, date_filed))
+            company_info_list.append(CompanyInfo(company_id=int(cik), name=company_name, sic=None,
+                                                 state_incorporation=None, state_location=None, date=date_filed))
+        CompanyInfo.objects.bulk_create(company_info_list, batch_size=batch_size)
+
+        # Create filings
+        filing_list = [Filing(form_type=form_type, date_filed=date_filed, s3_path=s3_path, company_id=int(cik),
+                              is_error=False, is_processed=False)
+                       for form_type, date_filed, s3_path, cik in zip(index_data["Form Type"], date_filed_list,
+                                                                     index_data["s3_path"], index_data["cik"])]
+        Filing.objects.bulk_create(filing_list, batch_size=batch_size)
+
+    logger.info("Created {0} filings and {1} company info records".format(len(filing_list), len(company_info_list)))
+    return len(filing_list), bad_record_count
+
 @shared_task
 def process_filing_index(client_type: str, file_path: str, filing_index_buffer: Union[str, bytes] = None,
                          form_type_list: Iterable[str] = None, store_raw: bool = False, store_text: bool = False):
@@ -572,58 +643,27 @@ def process_filing_index(client_type: str, file_path: str, filing_index_buffer:
     # Log entry
     logger.info("Processing filing index {0}...".format(file_path))
 
-    if client_type == "S3":
-        client = S3Client()
-    else:
-        client = LocalClient()
+    client = openedgar.clients.get_client(client_type)
 
     # Retrieve buffer if not passed
     if filing_index_buffer is None:
         logger.info("Retrieving filing index buffer for: {}...".format(file_path))
         filing_index_buffer = client.get_buffer(file_path)
 
-    # Write to disk to handle headaches
-    temp_file = tempfile.NamedTemporaryFile(delete=False)
-    temp_file.write(filing_index_buffer)
-    temp_file.close()
-
     # Get main filing data structure
-    filing_index_data = openedgar.parsers.edgar.parse_index_file(temp_file.name)
+    filing_index_data = openedgar.parsers.edgar.parse_index_buffer(filing_index_buffer)
     logger.info("Parsed {0} records from index".format(filing_index_data.shape[0]))
 
-    # Iterate through rows
-    bad_record_count = 0
-    for _, row in filing_index_data.iterrows():
-        # Check for form type whitelist
-        if form_type_list is not None:
-            if row["Form Type"] not in form_type_list:
-                logger.info("Skipping filing {0} with form type {1}...".format(row["File Name"], row["Form Type"]))
-                continue
-
-        # Cleanup path
-        if row["File Name"].lower().startswith("data/"):
-            filing_path = "edgar/{0}".format(row["File Name"])
-        elif row["File Name"].lower().startswith("edgar/"):
-            filing_path = row["File Name"]
+    # Create records for new filings in bulk
+    _, bad_record_count = bulk_create_light_filings(filing_index_data, form_type_list=form_type_list)
 
-        # Check if filing record exists
-        try:
-            filing = Filing.objects.get(s3_path=filing_path)
-            logger.info("Filing record already exists: {0}".format(filing))
-        except Filing.MultipleObjectsReturned as e:
-            # Create new filing record
-            logger.error("Multiple Filing records found for s3_path={0}, skipping...".format(filing_path))
-            logger.info("Raw exception: {0}".format(e))
-            continue
-        except Filing.DoesNotExist as f:
-            # Create new filing record
-            logger.info("No Filing record found for {0}, creating...".format(filing_path))
-            logger.info("Raw exception: {0}".format(f))
-            create_light_filing(row, filing_path)
     # Create a filing index record
     edgar_url = "//{0}".format(file_path).replace("//", "/")
+    index_type, date_published = openedgar.parsers.edgar.parse_index_path(file_path)
     try:
         filing_index = FilingIndex.objects.get(edgar_url=edgar_url)
+        filing_index.index_type = index_type
+        filing_index.date_published = date_published
         filing_index.total_record_count = filing_index_data.shape[0]
         filing_index.bad_record_count = bad_record_count
         filing_index.is_processed = True
@@ -633,7 +673,8 @@ def process_filing_index(client_type: str, file_path: str, filing_index_buffer:
     except FilingIndex.DoesNotExist:
         filing_index = FilingIndex()
         filing_index.edgar_url = edgar_url
-        filing_index.date_published = None
+        filing_index.index_type = index_type
+        filing_index.date_published = date_published
         filing_index.date_downloaded = datetime.date.today()
         filing_index.total_record_count = filing_index_data.shape[0]
         filing_index.bad_record_count = bad_record_count
@@ -642,9 +683,6 @@ def process_filing_index(client_type: str, file_path: str, filing_index_buffer:
         filing_index.save()
         logger.info("Created new filing index record.")
 
-    # Delete file if we make it this far
-    os.remove(temp_file.name)
-
 
 @shared_task
 def process_filing(client, file_path: str, filing_buffer: Union[str, bytes] = None, store_raw: bool = False,
@@ -679,89 +717,28 @@ def process_filing(client, file_path: str, filing_buffer: Union[str, bytes] = No
         filing_buffer = client.get_buffer(file_path)
 
     # Get main filing data structure
-    filing_data = openedgar.parsers.edgar.parse_filing(filing_buffer, extract=store_text)
-    if filing_data["cik"] is None:
-        logger.error("Unable to parse CIK from filing {0}; assuming broken and halting...".format(file_path))
-        return None
+    filing_data = openedgar.parsers.edgar.parse_filing_record(filing_buffer, extract=store_text)
+    return persist_filing(client, file_path, filing_data, store_raw=store_raw, store_text=store_text)
 
-    try:
-        # Get company
-        company = Company.objects.get(cik=filing_data["cik"])
-        logger.info("Found existing company record.")
 
-        # Check if record exists for date
-        try:
-            _ = CompanyInfo.objects.get(company=company, date=filing_data["date_filed"])
-
-            logger.info("Found existing company info record.")
-        except CompanyInfo.DoesNotExist:
-            # Create company info record
-            company_info = CompanyInfo()
-            company_info.company = company
-            company_info.name = filing_data["company_name"]
-            company_info.sic = filing_data["sic"]
-            company_info.state_incorporation = filing_data["state_incorporation"]
-            company_info.state_location = filing_data["state_location"]
-            company_info.date = filing_data["date_filed"].date() if isinstance(filing_data["date_filed"],
-                                                                               datetime.datetime) else \
-                filing_data["date_filed"]
-            company_info.save()
-
-            logger.info("Created new company info record.")
-
-    except Company.DoesNotExist:
-        # Create company
-        company = Company()
-        company.cik = filing_data["cik"]
-
-        try:
-            # Catch race with another task/thread
-            company.save()
-
-            try:
-                _ = CompanyInfo.objects.get(company=company, date=filing_data["date_filed"])
-            except CompanyInfo.DoesNotExist:
-                # Create company info record
-                company_info = CompanyInfo()
-                company_info.company = company
-                company_info.name = filing_data["company_name"]
-                company_info.sic = filing_data["sic"]
-                company_info.state_incorporation = filing_data["state_incorporation"]
-                company_info.state_location = filing_data["state_location"]
-                company_info.date = filing_data["date_filed"]
-                company_info.save()
-        except django.db.utils.IntegrityError:
-            company = Company.objects.get(cik=filing_data["cik"])
-
-        logger.info("Created company and company info records.")
-
-    # Now create the filing record
-    try:
-        filing = Filing()
-        filing.form_type = filing_data["form_type"]
-        filing.accession_number = filing_data["accession_number"]
-        filing.date_filed = filing_data["date_filed"]
-        filing.document_count = filing_data["document_count"]
-        filing.company = company
-        filing.sha1 = hashlib.sha1(filing_buffer).hexdigest()
-        filing.s3_path = file_path
-        filing.is_processed = False
-        filing.is_error = True
-        filing.save()
-    except Exception as e:  # pylint: disable=broad-except
-        logger.error("Unable to create filing record: {0}".format(e))
-        return None
-
-    # Create filing document records
-    try:
-        create_filing_documents(client, filing_data["documents"], filing, store_raw=store_raw, store_text=store_text)
-        filing.is_processed = True
-        filing.is_error = False
-        filing.save()
-        return filing
-    except Exception as e:  # pylint: disable=broad-except
-        logger.error("Unable to create filing documents for {0}: {1}".format(filing, e))
+def persist_filing(client, file_path: str, filing_data: dict, store_raw: bool = False, store_text: bool = False):
+    """
+    Create company, filing and filing document records for a parsed filing.
+    :param client: storage client for raw and text document contents
+    :param file_path: storage path of the filing
+    :param filing_data: result of parse_filing_record
+    :param store_raw:
+    :param store_text:
+    :return: Filing record, or None on error
+    """
+    writer = FilingBatchWriter(BlobStore(client, DOCUMENT_PATH), batch_size=1, store_raw=store_raw,
+                               store_text=store_text)
+    writer.add(file_path, filing_data)
+    writer.flush()
+    if file_path in writer.errors:
+        logger.error("Unable to create records for filing {0}: {1}".format(file_path, writer.errors[file_path]))
         return None
+    return writer.filings.get(file_path)
 
 
 @shared_task
@@ -784,6 +761,32 @@ def extract_filing(client, file_path: str, filing_buffer: Union[str, bytes] = No
     _ = openedgar.parsers.edgar.parse_filing(filing_buffer)
 
 
+@shared_task
+def sweep_s3_shard(shard: int, shard_count: int, kinds: Iterable[str] = None, fix: bool = True):
+    """
+    Sweep one shard of the CIK space on S3 for empty files and stored error pages.
+    :param shard: shard number, from 0 to shard_count - 1
+    :param shard_count: number of shards
+    :param kinds: kinds of bad object to report and fix; all by default
+    :param fix: whether to fix bad objects
+    :return: sweep report
+    """
+    return openedgar.processes.s3.sweep_s3(shard=shard, shard_count=shard_count,
+                                           kinds=kinds or openedgar.processes.s3.SWEEP_KINDS, fix=fix)
+
+
+@shared_task
+def backfill_filing_document_offsets_chunk(filing_id_list: Iterable[int]):
+    """
+    Recompute FilingDocument byte offsets for a chunk of filings.
+    :param filing_id_list: list of Filing ids
+    :return: number of FilingDocument rows updated
+    """
+    # Imported here as openedgar.processes.edgar imports this module
+    import openedgar.processes.edgar
+    return openedgar.processes.edgar.backfill_filing_document_offsets(filing_id_list=filing_id_list)
+
+
 @shared_task
 def search_filing_document_sha1(client, sha1: str, term_list: Iterable[str], search_query_id: int, document_id: int,
                                 case_sensitive: bool = False,
@@ -801,9 +804,55 @@ def search_filing_document_sha1(client, sha1: str, term_list: Iterable[str], sea
     """
     # Get buffer
     logger.info("Retrieving buffer from S3...")
-    text_s3_path = pathlib.Path(DOCUMENT_PATH, "text", sha1).as_posix()
-    document_buffer = client.get_buffer(text_s3_path).decode("utf-8")
+    document_buffer = BlobStore(client, DOCUMENT_PATH).get("text", sha1).decode("utf-8")
+    return search_document_buffer(document_buffer, term_list, search_query_id, document_id,
+                                  case_sensitive=case_sensitive, token_search=token_search, stem_search=stem_search)
 
+
+@shared_task
+def search_filing_documents_sha1(document_list: Iterable[Tuple[str, int]], term_list: Iterable[str],
+                                 search_query_id: int, case_sensitive: bool = False,
+                                 token_search: bool = False, stem_search: bool = False):
+    """
+    Search a batch of filing documents, fetching each distinct text blob once and concurrently.
+    :param document_list: list of (sha1, document_id) pairs
+    :param term_list: list of terms
+    :param search_query_id:
+    :param case_sensitive:
+    :param token_search:
+    :param stem_search:
+    :return: number of documents searched
+    """
+    document_list = list(document_list)
+    sha1_list = sorted({sha1 for sha1, _ in document_list})
+    blob_store = BlobStore(client, DOCUMENT_PATH)
+    buffer_list = map_concurrent(blob_store, blob_store.get, [("text", sha1) for sha1 in sha1_list])
+    buffers = dict(zip(sha1_list, buffer_list))
+
+    n = 0
+    for sha1, document_id in document_list:
+        if isinstance(buffers[sha1], Exception):
+            logger.error("Unable to retrieve text for document sha1={0}: {1}".format(sha1, buffers[sha1]))
+            continue
+        search_document_buffer(buffers[sha1].decode("utf-8"), term_list, search_query_id, document_id,
+                               case_sensitive=case_sensitive, token_search=token_search, stem_search=stem_search)
+        n += 1
+    return n
+
+
+def search_document_buffer(document_buffer: str, term_list: Iterable[str], search_query_id: int, document_id: int,
+                           case_sensitive: bool = False, token_search: bool = False, stem_search: bool = False):
+    """
+    Count search terms in a document text buffer and store the results.
+    :param document_buffer: document text
+    :param term_list: list of terms
+    :param search_query_id:
+    :param document_id:
+    :param case_sensitive:
+    :param token_search:
+    :param stem_search:
+    :return:
+    """
     # Check if case
     if not case_sensitive:
         document_buffer = document_buffer.lower()
@@ -855,7 +904,7 @@ def search_filing_document_sha1(client, sha1: str, term_list: Iterable[str], sea
     # Create if any
     if len(results) > 0:
         SearchQueryResult.objects.bulk_create(results)
-    logger.info("Found {0} search terms in document sha1={1}".format(len(results), sha1))
+    logger.info("Found {0} search terms in document id={1}".format(len(results), document_id))
     return True
 
 
@@ -870,8 +919,7 @@ def extract_filing_document_data_sha1(client, sha1: str):
     """
     # Get buffer
     logger.info("Retrieving buffer from S3...")
-    text_s3_path = pathlib.Path(DOCUMENT_PATH, "text", sha1).as_posix()
-    document_buffer = client.get_buffer(text_s3_path).decode("utf-8")
+    document_buffer = BlobStore(client, DOCUMENT_PATH).get("text", sha1).decode("utf-8")
 
     # TODO: Build your own database here.
     _ = len(document_buffer)
@@ -23,12 +23,32 @@ SOFTWARE.
 """
 
 # Client imports
+import asyncio
 import datetime
+import http.server
+import io
+import os
+import tempfile
+import threading
+import zlib
 
-from nose.tools import assert_list_equal, assert_equal, assert_is_instance
+from nose.tools import assert_list_equal, assert_equal, assert_is_instance, assert_true
 
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+
+import openedgar.clients.aio
+import openedgar.clients.blob
+import openedgar.clients.cache
+import openedgar.clients.compression
+import openedgar.clients.download
 import openedgar.clients.edgar
+import openedgar.clients.local
+import openedgar.clients.payload
 import openedgar.clients.s3
+import openedgar.clients.segment
 
 
 def test_client_list_dir_index():
@@ -79,3 +99,585 @@ def test_client_index_year():
     result = len(index_list)
     expected = 119
     assert_equal(result, expected)
+
+
+class StubEdgarHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Stub EDGAR server that answers with the rate threshold page a fixed number of times per path.
+    """
+    rate_limited_count = 1
+    rate_limited_status = 200
+    request_counts = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            count = self.request_counts.get(self.path, 0)
+            self.request_counts[self.path] = count + 1
+
+        if count < self.rate_limited_count:
+            body = b"<html><title>SEC.gov | Request Rate Threshold Exceeded</title></html>"
+            self.send_response(self.rate_limited_status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        elif self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        else:
+            body = "contents of {0}".format(self.path).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        self.send_header("Last-Modified", "Mon, 01 Jan 2018 00:00:00 GMT")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def run_stub_server(rate_limited_status: int = 200):
+    """
+    Start a stub EDGAR server on an ephemeral port.
+    :param rate_limited_status: HTTP status of the rate threshold page
+    :return: server, base URL
+    """
+    StubEdgarHandler.request_counts = {}
+    StubEdgarHandler.rate_limited_status = rate_limited_status
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubEdgarHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{0}/".format(server.server_address[1])
+
+
+def test_download_engine_rate_limit_backoff():
+    """
+    Test that the download engine retries rate-limited responses after a global back-off, whether
+    EDGAR serves the rate threshold page with a 200 or a 403.
+    :return:
+    """
+    for rate_limited_status in [200, 403]:
+        check_rate_limit_backoff(rate_limited_status)
+
+
+def check_rate_limit_backoff(rate_limited_status: int):
+    """
+    Fetch through a stub server that rate limits each path once.
+    :param rate_limited_status: HTTP status of the rate threshold page
+    :return:
+    """
+    server, base_path = run_stub_server(rate_limited_status)
+    try:
+        engine = openedgar.clients.download.DownloadEngine(base_path=base_path, rate=100, max_workers=4,
+                                                           fail_sleep=[0.01, 0.01])
+        paths = ["/Archives/edgar/data/{0}.txt".format(i) for i in range(8)]
+        results = {path: (buffer, last_modified_date, error)
+                   for path, buffer, last_modified_date, error in engine.map_buffers(paths)}
+
+        assert_equal(sorted(results), sorted(paths))
+        for path, (buffer, last_modified_date, error) in results.items():
+            assert_equal(error, None)
+            assert_equal(buffer, "contents of {0}".format(path).encode("utf-8"))
+            assert_equal(last_modified_date, datetime.date(2018, 1, 1))
+        assert_true(engine.backoff_count >= len(paths))
+
+        # Requests are submitted in a bounded window ahead of the consumer
+        engine = openedgar.clients.download.DownloadEngine(base_path=base_path, rate=100, max_workers=1,
+                                                           fail_sleep=[0.01, 0.01])
+        pulled_paths = []
+
+        def iter_paths():
+            for path in paths:
+                pulled_paths.append(path)
+                yield path
+
+        result_iter = engine.map_buffers(iter_paths())
+        next(result_iter)
+        assert_true(len(pulled_paths) <= 3)
+        assert_equal(len(list(result_iter)), len(paths) - 1)
+    finally:
+        server.shutdown()
+
+
+def test_token_bucket_rate():
+    """
+    Test that the token bucket holds requests to its configured rate after the initial burst.
+    :return:
+    """
+    bucket = openedgar.clients.download.TokenBucket(rate=50, capacity=1)
+    start = datetime.datetime.now()
+    for _ in range(11):
+        bucket.acquire()
+    elapsed = (datetime.datetime.now() - start).total_seconds()
+    assert_true(elapsed >= 0.18)
+
+
+def test_download_engine_conditional_get():
+    """
+    Test that cached responses are served while fresh and revalidated with a 304 once stale.
+    :return:
+    """
+    server, base_path = run_stub_server()
+    StubEdgarHandler.rate_limited_count = 0
+    try:
+        engine = openedgar.clients.download.DownloadEngine(base_path=base_path, rate=100, fail_sleep=[0.01])
+        cache_path = os.path.join(tempfile.mkdtemp(), "http-cache.sqlite3")
+        cache = openedgar.clients.cache.HTTPCache(cache_path, ttl=3600, max_bytes=1024)
+        path = "/Archives/edgar/daily-index/2018/QTR1/"
+        expected = "contents of {0}".format(path).encode("utf-8")
+
+        # First request fills the cache, second is served from it without a request
+        assert_equal(engine.get_buffer(path, cache=cache)[0], expected)
+        assert_equal(engine.get_buffer(path, cache=cache)[0], expected)
+        assert_equal(StubEdgarHandler.request_counts[path], 1)
+
+        # Stale entries are revalidated; the 304 is answered from the cache
+        cache.ttl = 0
+        buffer, last_modified_date = engine.get_buffer(path, cache=cache)
+        assert_equal(buffer, expected)
+        assert_equal(last_modified_date, datetime.date(2018, 1, 1))
+        assert_equal(StubEdgarHandler.request_counts[path], 2)
+
+        # Oversized caches evict least recently used entries
+        for i in range(40):
+            cache.put("http://example.com/{0}".format(i), b"x" * 100)
+        assert_true(cache.size() <= 1024)
+    finally:
+        StubEdgarHandler.rate_limited_count = 1
+        server.shutdown()
+
+
+def test_blob_store_dedupe():
+    """
+    Test sharded blob writes, dedupe, legacy path fallback and bloom filter persistence.
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as temp_path:
+        bloom_path = os.path.join(temp_path, "bloom.bin")
+        bloom_filter = openedgar.clients.blob.BloomFilter(capacity=1000, path=bloom_path)
+        client = openedgar.clients.local.LocalClient()
+        blob_store = openedgar.clients.blob.BlobStore(client, temp_path, codecs={"raw": "none", "text": "zlib"},
+                                                      bloom_filter=bloom_filter)
+
+        sha1 = "abcdef0123456789abcdef0123456789abcdef01"
+        assert_true(blob_store.put("text", sha1, "exhibit"))
+        assert_true(not blob_store.put("text", sha1, "exhibit"))
+        with open(os.path.join(temp_path, "text", "ab", "cd", sha1), "rb") as blob_file:
+            assert_equal(openedgar.clients.compression.detect_codec(blob_file.read())[0].name, "zlib")
+        assert_equal(blob_store.get("text", sha1), b"exhibit")
+
+        # Legacy flat paths remain readable
+        legacy_sha1 = "0123456789abcdef0123456789abcdef01234567"
+        client.put_buffer(os.path.join(temp_path, "raw", legacy_sha1), b"legacy")
+        assert_equal(blob_store.get("raw", legacy_sha1), b"legacy")
+
+        report = blob_store.dedupe_report()
+        assert_equal((report["puts"], report["stored"], report["deduped"]), (2, 1, 1))
+        assert_equal(report["dedupe_ratio"], 0.5)
+
+        # Saved filter is reloaded by a new instance
+        bloom_filter.save()
+        reloaded_filter = openedgar.clients.blob.BloomFilter(capacity=1000, path=bloom_path)
+        assert_true("text/{0}".format(sha1) in reloaded_filter)
+        assert_true("text/{0}".format(legacy_sha1) not in reloaded_filter)
+
+        # A fresh filter on another host has not seen stored blobs, which are still deduplicated
+        other_store = openedgar.clients.blob.BlobStore(client, temp_path, codecs={"raw": "none", "text": "zlib"},
+                                                       bloom_filter=openedgar.clients.blob.BloomFilter(capacity=1000))
+        assert_true(other_store.exists("raw", legacy_sha1))
+        assert_true(not other_store.put("text", sha1, "exhibit"))
+        assert_equal(other_store.dedupe_report()["deduped"], 1)
+
+
+def test_s3_client_shared_pool():
+    """
+    Test that S3Client instances and threads share one pooled client against a moto S3 stand-in.
+    :return:
+    """
+    bucket = openedgar.clients.s3.S3_BUCKET
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        try:
+            openedgar.clients.s3.S3_BUCKET = "openedgar-test"
+            openedgar.clients.s3.reset_shared_client()
+            client = openedgar.clients.s3.S3Client()
+            client.get_client().create_bucket(Bucket="openedgar-test")
+
+            # One client, and one connection pool, for all instances and threads
+            thread_clients = []
+            threads = [threading.Thread(target=lambda: thread_clients.append(openedgar.clients.s3.S3Client()
+                                                                             .get_client()))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert_true(all(c is client.get_client() for c in thread_clients))
+            assert_equal(client.get_client().meta.config.max_pool_connections,
+                         openedgar.clients.s3.S3_MAX_POOL_CONNECTIONS)
+
+            # Round trip through the shared client
+            assert_true(client.put_buffer("edgar/data/1/test.txt", b"filing"))
+            assert_true(client.path_exists("edgar/data/1/test.txt"))
+            assert_true(not client.path_exists("edgar/data/1/missing.txt"))
+            assert_equal(client.get_buffer("edgar/data/1/test.txt"), b"filing")
+            assert_equal(client.get_bucket().name, "openedgar-test")
+        finally:
+            openedgar.clients.s3.S3_BUCKET = bucket
+            openedgar.clients.s3.reset_shared_client()
+
+
+def test_s3_client_streaming_multipart():
+    """
+    Test streaming multipart upload and incremental download against a moto S3 stand-in.
+    :return:
+    """
+    bucket = openedgar.clients.s3.S3_BUCKET
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    part_size = 5 * 1024 * 1024
+    buffer = os.urandom(2 * part_size) + b"<DOCUMENT>" * 100000
+    with mock_aws():
+        try:
+            openedgar.clients.s3.S3_BUCKET = "openedgar-test"
+            openedgar.clients.s3.reset_shared_client()
+            client = openedgar.clients.s3.S3Client()
+            client.get_client().create_bucket(Bucket="openedgar-test")
+
+            # Incompressible data spans several parts and stays readable as one zlib object
+            assert_true(client.put_stream("edgar/data/1/large.txt", io.BytesIO(buffer), part_size=part_size))
+            assert_equal(client.get_buffer("edgar/data/1/large.txt"), buffer)
+            chunks = list(client.get_stream("edgar/data/1/large.txt", chunk_size=256 * 1024))
+            assert_true(max(len(chunk) for chunk in chunks) <= 256 * 1024)
+            assert_equal(b"".join(chunks), buffer)
+
+            # Files round trip through disk
+            with tempfile.TemporaryDirectory() as temp_path:
+                local_path = os.path.join(temp_path, "large.txt")
+                client.get_file("edgar/data/1/large.txt", local_path)
+                assert_true(client.put_file("edgar/data/1/copy.txt", local_path))
+            assert_equal(client.get_buffer("edgar/data/1/copy.txt"), buffer)
+
+            # Small streams use a single put
+            assert_true(client.put_stream("edgar/data/1/small.txt", io.BytesIO(b"filing"), deflate=False))
+            assert_equal(client.get_buffer("edgar/data/1/small.txt", deflate=False), b"filing")
+        finally:
+            openedgar.clients.s3.S3_BUCKET = bucket
+            openedgar.clients.s3.reset_shared_client()
+
+
+def test_compression_codecs():
+    """
+    Test one-shot and streaming round trips and codec detection for each installed codec.
+    :return:
+    """
+    buffer = b"<DOCUMENT>\n<TYPE>EX-21\n<TEXT>\nSubsidiaries of the registrant\n</TEXT>\n" * 5000
+    for codec in openedgar.clients.compression.CODECS.values():
+        if not codec.available:
+            continue
+        encoded = openedgar.clients.compression.encode(buffer, codec)
+        assert_equal(openedgar.clients.compression.detect_codec(encoded)[0].name, codec.name)
+        assert_equal(openedgar.clients.compression.decode(encoded), buffer)
+
+        # Streaming output decodes in arbitrary pieces
+        compressor = codec.compressobj()
+        streamed = codec.header + compressor.compress(buffer[:1000]) + compressor.compress(buffer[1000:]) \
+            + compressor.flush()
+        detected_codec, header_size = openedgar.clients.compression.detect_codec(streamed)
+        decompressor = detected_codec.decompressobj()
+        decoded = b"".join(decompressor.decompress(streamed[i:i + 4096])
+                           for i in range(header_size, len(streamed), 4096)) + decompressor.flush()
+        assert_equal(decoded, buffer)
+
+    # Objects written before codec headers: zlib is only assumed for zlib-looking buffers
+    assert_equal(openedgar.clients.compression.decode(zlib.compress(buffer), legacy="zlib"), buffer)
+    assert_equal(openedgar.clients.compression.decode(buffer, legacy="zlib"), buffer)
+
+    # Raw text can start with a valid zlib header; it is only zlib if it inflates
+    for raw in [b"80 some text", b"8O" + b"x" * 4096]:
+        assert_true(not openedgar.clients.compression.is_zlib_stream(raw))
+        assert_equal(openedgar.clients.compression.decode(raw, legacy="zlib"), raw)
+
+
+def test_segment_client():
+    """
+    Test packed segment storage: round trips, ranged reads, overwrites and segment rollover.
+    :return:
+    """
+    buffer = b"<DOCUMENT>\n<TYPE>10-K\n<TEXT>\nAnnual report\n</TEXT>\n</DOCUMENT>\n" * 200
+    with tempfile.TemporaryDirectory() as temp_path:
+        client = openedgar.clients.segment.SegmentClient(temp_path, max_segment_bytes=256, codec="zlib")
+        assert_equal(client.path_exists("edgar/data/1/0001.txt"), False)
+
+        for i in range(8):
+            assert_true(client.put_buffer("edgar/data/1/{0:04d}.txt".format(i), buffer))
+        client.put_buffer("edgar/data/1/raw.txt", "plain text", codec="none")
+
+        assert_true(client.path_exists("edgar/data/1/0001.txt"))
+        assert_equal(client.get_buffer("edgar/data/1/0007.txt"), buffer)
+        assert_equal(bytes(client.get_buffer_segment("edgar/data/1/0003.txt", 11, 23)), buffer[11:23])
+        assert_equal(bytes(client.get_buffer_segment("edgar/data/1/raw.txt", 6, 10)), b"text")
+
+        # Overwrites repoint the index
+        client.put_buffer("edgar/data/1/0003.txt", b"amended")
+        assert_equal(client.get_buffer("edgar/data/1/0003.txt"), b"amended")
+        assert_equal(bytes(client.get_buffer_segment("edgar/data/1/0003.txt", 0, 5)), b"amend")
+
+        # Small segments roll over, and a second client sees the same index
+        stats = client.stats()
+        assert_equal(stats["blobs"], 9)
+        assert_true(len([name for name in os.listdir(temp_path) if name.endswith(".dat")]) > 1)
+        assert_equal(openedgar.clients.segment.SegmentClient(temp_path).get_buffer("edgar/data/1/0005.txt"), buffer)
+
+        # The active segment is recorded in the index rather than found by listing the directory
+        segment_list = [int(match.group(1)) for match in
+                        (openedgar.clients.segment.SEGMENT_NAME_RE.match(name) for name in os.listdir(temp_path))
+                        if match]
+        assert_equal(client.get_active_segment(client.get_connection()), max(segment_list))
+        client.put_buffer("edgar/data/1/small.txt", b"x", codec="none")
+        assert_equal(client.lookup("edgar/data/1/small.txt")[0], client.get_active_segment(client.get_connection()))
+
+
+def test_local_client_buffer_segment():
+    """
+    Test local ranged reads of plain and compressed files, decoded buffer re-use and missing files.
+    :return:
+    """
+    buffer = b"<DOCUMENT>\n<TYPE>10-K\n<TEXT>\nAnnual report\n</TEXT>\n</DOCUMENT>\n" * 200
+    with tempfile.TemporaryDirectory() as temp_path:
+        client = openedgar.clients.local.LocalClient()
+        raw_path = os.path.join(temp_path, "raw.txt")
+        compressed_path = os.path.join(temp_path, "compressed.txt")
+        client.put_buffer(raw_path, buffer, codec="none")
+        client.put_buffer(compressed_path, buffer, codec="zlib")
+
+        assert_equal(bytes(client.get_buffer_segment(raw_path, 11, 23)), buffer[11:23])
+        assert_equal(bytes(client.get_buffer_segment(compressed_path, 11, 23)), buffer[11:23])
+        assert_true(compressed_path in openedgar.clients.local._decoded_cache)
+        assert_true(raw_path not in openedgar.clients.local._decoded_cache)
+        assert_equal(bytes(client.get_buffer_segment(compressed_path, 0, 10)), b"<DOCUMENT>")
+
+        # Rewrites drop the decoded buffer
+        client.put_buffer(compressed_path, b"amended", codec="zlib")
+        assert_true(compressed_path not in openedgar.clients.local._decoded_cache)
+        assert_equal(bytes(client.get_buffer_segment(compressed_path, 0, 5)), b"amend")
+
+        # Missing and empty files raise rather than returning an empty segment
+        for path, error_type in [(os.path.join(temp_path, "missing.txt"), FileNotFoundError),
+                                 (os.path.join(temp_path, "empty.txt"), EOFError)]:
+            if error_type is EOFError:
+                client.put_buffer(path, b"", codec="none")
+            try:
+                client.get_buffer_segment(path, 0, 5)
+                assert_true(False)
+            except error_type:
+                pass
+
+
+def test_local_client_mmap():
+    """
+    Test re-use of local memory maps and that rewrites replace files atomically under live mappings.
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as temp_path:
+        client = openedgar.clients.local.LocalClient()
+        path = os.path.join(temp_path, "edgar", "data", "1", "0001.txt")
+        client.put_buffer(path, b"original filing", codec="none")
+
+        file_map = openedgar.clients.local.get_mmap(path)
+        assert_true(openedgar.clients.local.get_mmap(path) is file_map)
+        view = client.get_buffer_segment(path, 0, 8)
+
+        # The old mapping and views keep the old contents; new reads see the new file
+        client.put_buffer(path, b"amended filing", codec="none")
+        assert_equal(bytes(view), b"original")
+        assert_equal(file_map[0:8], b"original")
+        assert_true(openedgar.clients.local.get_mmap(path) is not file_map)
+        assert_equal(bytes(client.get_buffer_segment(path, 0, 7)), b"amended")
+        assert_equal(os.listdir(os.path.dirname(path)), ["0001.txt"])
+
+        empty_path = os.path.join(temp_path, "empty.txt")
+        client.put_buffer(empty_path, b"", codec="none")
+        assert_equal(openedgar.clients.local.get_mmap(empty_path), None)
+
+
+def test_get_client_type():
+    """
+    Test that every caller resolves the same client from CLIENT_TYPE.
+    :return:
+    """
+    client_type = os.environ.get("CLIENT_TYPE")
+    try:
+        for value, expected_type in [(None, "LOCAL"), ("", "LOCAL"), ("SEGMENT", "SEGMENT")]:
+            if value is None:
+                os.environ.pop("CLIENT_TYPE", None)
+            else:
+                os.environ["CLIENT_TYPE"] = value
+            assert_equal(openedgar.clients.get_client_type(), expected_type)
+
+        os.environ["CLIENT_TYPE"] = "LOCAL"
+        assert_is_instance(openedgar.clients.get_client(), openedgar.clients.local.LocalClient)
+    finally:
+        if client_type is None:
+            os.environ.pop("CLIENT_TYPE", None)
+        else:
+            os.environ["CLIENT_TYPE"] = client_type
+
+
+def test_async_storage_client():
+    """
+    Test concurrent get/put/exists through the asyncio wrapper, with errors returned in place.
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as temp_path:
+        client = openedgar.clients.segment.SegmentClient(temp_path, codec="none")
+        path_list = ["edgar/data/{0}/filing.txt".format(i) for i in range(50)]
+        with openedgar.clients.aio.AsyncStorageClient(client, max_concurrency=8) as async_client:
+            async def round_trip():
+                await asyncio.gather(*[async_client.aput_buffer(path, path.encode("utf-8")) for path in path_list])
+                exists = await async_client.apath_exists(path_list[0])
+                buffers = await async_client.aget_many(path_list + ["edgar/data/missing.txt"])
+                return exists, buffers
+
+            exists, buffer_list = asyncio.run(round_trip())
+        assert_true(exists)
+        assert_list_equal(buffer_list[:-1], [path.encode("utf-8") for path in path_list])
+        assert_is_instance(buffer_list[-1], FileNotFoundError)
+
+        # Synchronous entry point for tasks
+        result_list = openedgar.clients.aio.map_concurrent(client, client.path_exists, [(path,) for path in path_list])
+        assert_true(all(result_list))
+
+
+def test_paths_exist():
+    """
+    Test batched existence checks on local, segment and S3 storage, and through the blob store.
+    :return:
+    """
+    stored = ["edgar/data/1/a.txt", "edgar/data/1/b.txt", "edgar/data/2/c.txt"]
+    queried = stored + ["edgar/data/1/missing.txt", "edgar/data/3/missing.txt"]
+    expected = {path: path in stored for path in queried}
+
+    with tempfile.TemporaryDirectory() as temp_path:
+        local_client = openedgar.clients.local.LocalClient()
+        local_paths = [os.path.join(temp_path, path) for path in queried]
+        local_client.put_buffer(local_paths[0], b"filing")
+        assert_equal(local_client.paths_exist(local_paths[:2])[local_paths[1]], False)
+        for path in local_paths[1:3]:
+            local_client.put_buffer(path, b"filing")
+        assert_equal(local_client.paths_exist(local_paths), {os.path.join(temp_path, path): value
+                                                             for path, value in expected.items()})
+
+        # A few paths are checked without scanning; scans confirm misses, so other writers are seen
+        flat_dir = os.path.join(temp_path, "documents", "raw")
+        flat_paths = [os.path.join(flat_dir, "{0:02d}".format(i)) for i in range(4)]
+        local_client.put_buffer(flat_paths[0], b"blob")
+        assert_equal(local_client.paths_exist(flat_paths[:2]), {flat_paths[0]: True, flat_paths[1]: False})
+        assert_true(flat_dir not in local_client.manifest)
+        min_paths = openedgar.clients.local.MANIFEST_MIN_PATHS
+        try:
+            openedgar.clients.local.MANIFEST_MIN_PATHS = 2
+            assert_equal(local_client.paths_exist(flat_paths[:2]), {flat_paths[0]: True, flat_paths[1]: False})
+            assert_true(flat_dir in local_client.manifest)
+            openedgar.clients.local.LocalClient().put_buffer(flat_paths[1], b"blob")
+            assert_equal(local_client.paths_exist(flat_paths[:2]), {flat_paths[0]: True, flat_paths[1]: True})
+        finally:
+            openedgar.clients.local.MANIFEST_MIN_PATHS = min_paths
+
+        segment_client = openedgar.clients.segment.SegmentClient(os.path.join(temp_path, "segments"))
+        for path in stored:
+            segment_client.put_buffer(path, b"filing")
+        assert_equal(segment_client.paths_exist(queried), expected)
+
+        # Blob store treats bloom filter misses as hints until the filter is seeded from a listing
+        blob_store = openedgar.clients.blob.BlobStore(segment_client, "documents",
+                                                      bloom_filter=openedgar.clients.blob.BloomFilter(capacity=100))
+        blob_store.put("raw", "a" * 40, b"raw")
+        segment_client.put_buffer(blob_store.legacy_path("raw", "b" * 40), b"legacy")
+        assert_equal(blob_store.exists_many("raw", ["a" * 40, "b" * 40, "c" * 40]), {"a" * 40, "b" * 40})
+        assert_true("raw/" + "b" * 40 in blob_store.bloom_filter)
+
+        seeded_store = openedgar.clients.blob.BlobStore(segment_client, "documents",
+                                                        bloom_filter=openedgar.clients.blob.BloomFilter(capacity=100))
+        seeded_store.seed_bloom_filter({"raw": ["a" * 40]})
+        assert_equal(seeded_store.exists_many("raw", ["a" * 40, "b" * 40, "c" * 40]), {"a" * 40})
+        assert_true(not seeded_store.exists("raw", "b" * 40))
+
+    bucket = openedgar.clients.s3.S3_BUCKET
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        try:
+            openedgar.clients.s3.S3_BUCKET = "openedgar-test"
+            openedgar.clients.s3.reset_shared_client()
+            s3_client = openedgar.clients.s3.S3Client()
+            s3_client.get_client().create_bucket(Bucket="openedgar-test")
+            for path in stored + ["edgar/data/1/subfolder/d.txt"]:
+                s3_client.put_buffer(path, b"filing")
+            assert_equal(s3_client.paths_exist(queried), expected)
+
+            # Large flat prefixes are listed for a bounded number of pages, then checked with HEAD
+            flat_paths = ["documents/raw/{0:02d}".format(i) for i in range(10)]
+            for path in flat_paths:
+                s3_client.put_buffer(path, b"blob")
+            flat_queried = flat_paths[1:4:2] + [flat_paths[8], "documents/raw/05x", "documents/raw/99"]
+            list_calls = []
+            s3_client.get_client().meta.events.register("before-call.s3.ListObjectsV2",
+                                                         lambda **kwargs: list_calls.append(kwargs))
+            page_size, heads_per_page = (openedgar.clients.s3.PATHS_EXIST_PAGE_SIZE,
+                                         openedgar.clients.s3.PATHS_EXIST_HEADS_PER_PAGE)
+            try:
+                openedgar.clients.s3.PATHS_EXIST_PAGE_SIZE = 2
+                openedgar.clients.s3.PATHS_EXIST_HEADS_PER_PAGE = 2
+                assert_equal(s3_client.paths_exist(flat_queried), {path: path in flat_paths for path in flat_queried})
+                assert_equal(len(list_calls), 2)
+            finally:
+                openedgar.clients.s3.PATHS_EXIST_PAGE_SIZE = page_size
+                openedgar.clients.s3.PATHS_EXIST_HEADS_PER_PAGE = heads_per_page
+        finally:
+            openedgar.clients.s3.S3_BUCKET = bucket
+            openedgar.clients.s3.reset_shared_client()
+
+
+def test_payload_classifier():
+    """
+    Test bad payload classification from status, Content-Type and the head of the payload only.
+    :return:
+    """
+    classify_payload = openedgar.clients.payload.classify_payload
+    rate_limited = b"<html><head><title>SEC.gov | Request Rate Threshold Exceeded</title></head></html>"
+    not_found = b"<HTML><HEAD><TITLE>SEC.gov | File Not Found Error Alert (404)</TITLE></HEAD></HTML>"
+    access_denied = b'<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>AccessDenied</Code>' \
+                    b"<Message>Access Denied</Message><RequestId>1</RequestId></Error>"
+    filing = b"<SEC-DOCUMENT>0000950134-05-005462.txt : 20050316\n<SEC-HEADER>\n" + b" " * 8192 + \
+             b"<TITLE>SEC.gov | Request Rate Threshold Exceeded</TITLE>"
+
+    assert_equal(classify_payload(rate_limited), "rate_limited")
+    assert_equal(classify_payload(not_found), "not_found")
+    assert_equal(classify_payload(access_denied), "access_denied")
+    assert_equal(classify_payload(b"<Error><Code>SlowDown</Code></Error>"), "s3_error")
+    assert_equal(classify_payload(b"", status_code=429), "rate_limited")
+    assert_equal(classify_payload(b"<html><title>Access Denied</title></html>", "text/html"), "access_denied")
+
+    # The title wins over the status; the status decides only when the payload is not recognised
+    assert_equal(classify_payload(rate_limited, "text/html", 403), "rate_limited")
+    assert_equal(classify_payload(b"Forbidden", "text/plain", 403), "access_denied")
+    assert_equal(classify_payload(b"", status_code=404), "not_found")
+
+    # Markers past the head, in plain text, or inside XML filings are not error pages
+    assert_equal(classify_payload(filing), None)
+    assert_equal(classify_payload(rate_limited, "text/plain"), None)
+    assert_equal(classify_payload(b"<xbrl><Error><Code>AccessDenied</Code></Error></xbrl>"), None)
+
+    try:
+        openedgar.clients.edgar.check_buffer(access_denied)
+        assert_true(False)
+    except openedgar.clients.payload.BadPayloadError as e:
+        assert_equal(e.kind, "access_denied")
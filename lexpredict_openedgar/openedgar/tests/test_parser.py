@@ -22,11 +22,25 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import re
 import tempfile
-from nose.tools import assert_equal
+import unittest.mock
+from nose.tools import assert_equal, assert_true
 
+import openedgar.benchmarks.content_parser
 import openedgar.clients.edgar
+import openedgar.clients.segment
 import openedgar.parsers.edgar
+import openedgar.parsers.line_cache
+import openedgar.parsers.line_store
+import openedgar.parsers.term_matcher
+import openedgar.references
+from openedgar.parsers.sec_filing_content_parser import SECFilingContentParser
 
 
 def test_filing_parser():
@@ -139,3 +153,353 @@ def test_index_parser():
     result = index_data.shape[0]
     expected = 226
     assert_equal(result, expected)
+
+
+SAMPLE_FILING = """<SEC-DOCUMENT>0000000000-18-000001.txt : 20180102
+<SEC-HEADER>0000000000-18-000001.hdr.sgml : 20180102
+ACCESSION NUMBER:\t\t0000000000-18-000001
+CONFORMED SUBMISSION TYPE:\t10-K
+PUBLIC DOCUMENT COUNT:\t\t2
+CONFORMED PERIOD OF REPORT:\t20171231
+FILED AS OF DATE:\t\t20180102
+COMPANY DATA:
+\tCOMPANY CONFORMED NAME:\t\t\tSAMPLE CAFÉ CORP
+\tCENTRAL INDEX KEY:\t\t\t0000000001
+\tSTATE OF INCORPORATION:\t\t\tDE
+</SEC-HEADER>
+<DOCUMENT>
+<TYPE>10-K
+<SEQUENCE>1
+<FILENAME>sample10k.htm
+<DESCRIPTION>ANNUAL REPORT
+<TEXT>
+<HTML><BODY><P>Café résumé</P></BODY></HTML>
+</TEXT>
+</DOCUMENT>
+<DOCUMENT>
+<TYPE>EX-99
+<SEQUENCE>2
+<FILENAME>ex99.txt
+<TEXT>
+Exhibit § 99
+</TEXT>
+</DOCUMENT>
+</SEC-DOCUMENT>
+""".encode("utf-8")
+
+
+def test_filing_stream_parser():
+    """
+    Test single-pass streaming parser against parse_filing.
+    :return:
+    """
+    filing_data = openedgar.parsers.edgar.parse_filing(SAMPLE_FILING)
+    stream_results = list(openedgar.parsers.edgar.parse_filing_stream(io.BytesIO(SAMPLE_FILING)))
+
+    assert_equal(len(stream_results), 2)
+    header, _ = stream_results[0]
+    assert_equal(header["cik"], filing_data["cik"])
+    assert_equal(header["company_name"], "SAMPLE CAFÉ CORP")
+    assert_equal(header["document_count"], 2)
+
+    for (_, document), expected in zip(stream_results, filing_data["documents"]):
+        for key in ["type", "sequence", "file_name", "description", "content_type", "sha1", "content"]:
+            assert_equal(document[key], expected[key])
+
+        # Offsets are byte offsets into the raw submission
+        segment = SAMPLE_FILING[document["start_pos"]:document["end_pos"]]
+        assert_true(segment.startswith(b"<DOCUMENT>"))
+        assert_true(segment.endswith(b"</DOCUMENT>"))
+
+
+def test_filing_parser_byte_offsets():
+    """
+    Test that document offsets index the raw bytes of a non-ASCII filing.
+    :return:
+    """
+    filing_data = openedgar.parsers.edgar.parse_filing(SAMPLE_FILING)
+    last_document = filing_data["documents"][-1]
+    segment = SAMPLE_FILING[last_document["start_pos"]:last_document["end_pos"]]
+    assert_equal(segment, b"<DOCUMENT>\n<TYPE>EX-99\n<SEQUENCE>2\n<FILENAME>ex99.txt\n<TEXT>\n"
+                          b"Exhibit \xc2\xa7 99\n</TEXT>\n</DOCUMENT>")
+
+
+
+def test_filing_parser_sha1_encoding():
+    """
+    Test that document hashes and content are UTF-8 re-encoded from the filing encoding, so
+    ISO 8859-1 filings keep the sha1 values they have always had.
+    :return:
+    """
+    utf8_documents = openedgar.parsers.edgar.parse_filing(SAMPLE_FILING)["documents"]
+    latin1_filing = SAMPLE_FILING.decode("utf-8").encode("iso-8859-1")
+    assert_equal(openedgar.parsers.edgar.get_filing_encoding(latin1_filing), "iso-8859-1")
+    assert_equal(openedgar.parsers.edgar.get_filing_encoding(SAMPLE_FILING), "utf-8")
+
+    latin1_documents = openedgar.parsers.edgar.parse_filing(latin1_filing)["documents"]
+    for utf8_document, latin1_document in zip(utf8_documents, latin1_documents):
+        assert_equal(latin1_document["content"], utf8_document["content"])
+        assert_equal(latin1_document["sha1"], hashlib.sha1(utf8_document["content"]).hexdigest())
+        assert_equal(latin1_document["sha1"], utf8_document["sha1"])
+
+    # A single invalid byte makes the whole filing ISO 8859-1, as when it was decoded in full
+    mixed_filing = SAMPLE_FILING.replace("Exhibit § 99".encode("utf-8"), "Exhibit § 99".encode("iso-8859-1"))
+    mixed_documents = openedgar.parsers.edgar.parse_filing(mixed_filing)["documents"]
+    expected_content = utf8_documents[0]["content"].decode("iso-8859-1").encode("utf-8")
+    assert_equal(mixed_documents[0]["content"], expected_content)
+    assert_equal(mixed_documents[0]["sha1"], hashlib.sha1(expected_content).hexdigest())
+
+
+SAMPLE_FORM_INDEX = """Description:           Daily Index of EDGAR Dissemination Feed by Form Type
+Last Data Received:    January 02, 2018
+Comments:              webmaster@sec.gov
+Anonymous FTP:         ftp://ftp.sec.gov/edgar/
+
+
+
+
+Form Type   Company Name                                                  CIK         Date Filed  File Name
+---------------------------------------------------------------------------------------------------------------------------------------------
+10-K        SAMPLE CORP                                                   1000001     20180102    edgar/data/1000001/0001000001-18-000001.txt
+SC 13G/A    SAMPLE HOLDINGS, L.P.                                         1000002     20180102    edgar/data/1000002/0001000002-18-000001.txt
+8-K         A VERY LONG COMPANY NAME THAT RUNS PAST THE START OF THE CIK COLUMN 1000003   20180102    edgar/data/1000003/0001000003-18-000001.txt
+"""
+
+SAMPLE_MASTER_INDEX = """Description:           Master Index of EDGAR Dissemination Feed
+Last Data Received:    March 31, 2018
+Comments:              webmaster@sec.gov
+Anonymous FTP:         ftp://ftp.sec.gov/edgar/
+
+
+
+
+CIK|Company Name|Form Type|Date Filed|Filename
+--------------------------------------------------------------------------------
+1000001|SAMPLE CORP|10-K|2018-01-02|edgar/data/1000001/0001000001-18-000001.txt
+1000002|SAMPLE|PIPE CO|SC 13G|2018-01-03|edgar/data/1000002/0001000002-18-000001.txt
+"""
+
+
+def test_index_buffer_parser():
+    """
+    Test parsing fixed-width form index from raw and gzipped buffers.
+    :return:
+    """
+    for buffer in [SAMPLE_FORM_INDEX, SAMPLE_FORM_INDEX.encode("utf-8"),
+                   gzip.compress(SAMPLE_FORM_INDEX.encode("utf-8"))]:
+        index_data = openedgar.parsers.edgar.parse_index_buffer(buffer)
+        assert_equal(index_data.shape[0], 3)
+        assert_equal(list(index_data.columns), openedgar.parsers.edgar.INDEX_COLUMNS)
+        assert_equal(index_data["CIK"].tolist(), [1000001, 1000002, 1000003])
+        assert_equal(index_data["Form Type"].tolist(), ["10-K", "SC 13G/A", "8-K"])
+        assert_equal(index_data["Company Name"].iloc[1], "SAMPLE HOLDINGS, L.P.")
+        assert_equal(index_data["Date Filed"].iloc[0].date(), datetime.date(2018, 1, 2))
+        assert_equal(index_data["File Name"].iloc[2], "edgar/data/1000003/0001000003-18-000001.txt")
+
+
+def test_master_index_buffer_parser():
+    """
+    Test parsing pipe-delimited master index.
+    :return:
+    """
+    index_data = openedgar.parsers.edgar.parse_index_buffer(SAMPLE_MASTER_INDEX.encode("utf-8"))
+    assert_equal(index_data.shape[0], 2)
+    assert_equal(index_data["Company Name"].tolist(), ["SAMPLE CORP", "SAMPLE|PIPE CO"])
+    assert_equal(index_data["Form Type"].tolist(), ["10-K", "SC 13G"])
+    assert_equal(index_data["File Name"].iloc[1], "edgar/data/1000002/0001000002-18-000001.txt")
+
+
+def test_index_path_parser():
+    """
+    Test identifying index type and publication date from index file names.
+    :return:
+    """
+    assert_equal(openedgar.parsers.edgar.parse_index_path("/Archives/edgar/daily-index/2021/QTR1/form.20210126.idx"),
+                 ("form", datetime.date(2021, 1, 26)))
+    assert_equal(openedgar.parsers.edgar.parse_index_path("/Archives/edgar/daily-index/1994/QTR3/form.093094.idx"),
+                 ("form", datetime.date(1994, 9, 30)))
+    assert_equal(openedgar.parsers.edgar.parse_index_path("edgar/full-index/2018/QTR1/master.idx"), ("master", None))
+    assert_equal(openedgar.parsers.edgar.parse_index_path("edgar/daily-index/index.json"), (None, None))
+
+
+SAMPLE_10K_HTML = b"""<html><head><title>10-K</title></head><body>
+<p style="text-align:center"><b>PART II</b></p>
+<p>ITEM 7. Management&#8217;s Discussion and Analysis</p>
+<p>Revenue <font style="font-weight:bold">increased</font> 12% in fiscal&#160;2018.</p>
+<div style="page-break-after:always"></div>
+<p>Item 8. Financial Statements and Supplementary Data</p>
+<table><tr><td>Cash and cash equivalents</td><td>$</td><td>1,000</td></tr>
+<tr><td>Total assets</td><td>$</td><td>12,000</td></tr></table>
+<p>CONSOLIDATED STATEMENTS OF OPERATIONS</p>
+<table style="width:100%"><tr><th>Year</th><th>2018</th></tr><tr><td>Net revenue</td><td>5,400</td></tr></table>
+<hr/>
+<p>Item 9A. Controls and Procedures</p><p>None.</p>
+</body></html>"""
+
+
+def test_line_cache():
+    """
+    Test that line models round trip through the columnar cache, keyed by sha1 and parser version.
+    :return:
+    """
+    lines = SECFilingContentParser(SAMPLE_10K_HTML, False).parse()
+    for serializer in [openedgar.parsers.line_cache.msgpack, None]:
+        if serializer is None and openedgar.parsers.line_cache.msgpack is None:
+            continue
+        with unittest.mock.patch.object(openedgar.parsers.line_cache, "msgpack", serializer):
+            model = openedgar.parsers.line_cache.decode_lines(openedgar.parsers.line_cache.encode_lines(lines, False))
+        assert_equal(model["lines"], lines)
+        assert_equal(model["version"], SECFilingContentParser.VERSION)
+
+    with tempfile.TemporaryDirectory() as temp_path:
+        client = openedgar.clients.segment.SegmentClient(temp_path)
+        sha1 = "0123456789abcdef0123456789abcdef01234567"
+        line_cache = openedgar.parsers.line_cache.LineCache(client)
+        assert_equal(line_cache.get(sha1, False), None)
+        assert_true(line_cache.put(sha1, lines, False))
+        assert_equal(line_cache.get(sha1, False), lines)
+        assert_equal(line_cache.get(sha1, True), None)
+
+        # Models written by other parser versions are not read
+        assert_equal(openedgar.parsers.line_cache.LineCache(client, version=0).get(sha1, False), None)
+
+
+def test_process_html_single_pass():
+    """
+    Test that the single-pass HTML line model matches the legacy builder and handles nested tables.
+    :return:
+    """
+    for document in [SAMPLE_10K_HTML, openedgar.benchmarks.content_parser.build_10k_html(paragraphs_per_item=5)]:
+        parser = SECFilingContentParser(document, False)
+        assert_equal(parser.process_html(), openedgar.benchmarks.content_parser.legacy_process_html(parser))
+
+    lines = SECFilingContentParser(SAMPLE_10K_HTML, False).process_html()
+    table_lines = [line for line in lines if line["tag"] == "table"]
+    assert_equal([line["table_index"] for line in table_lines], ["0", "1"])
+    assert_equal([line["item_number"] for line in table_lines], ["8", "8"])
+    assert_equal([line["page_number"] for line in table_lines], [2, 2])
+    assert_equal(lines[-1]["page_number"], 3)
+    assert_equal(lines[-1]["item_number"], "9A")
+
+    # Nested tables are parsed as part of the outer table
+    nested = b"<html><body><p>Item 8.</p><table><tr><td><table><tr><td>Inner</td></tr></table></td>" \
+             b"<td>Outer</td></tr></table><p>After</p></body></html>"
+    lines = SECFilingContentParser(nested, False).process_html()
+    assert_equal([line["tag"] for line in lines], ["div", "p", "table", "p"])
+    assert_equal(lines[2]["item_number"], "8")
+    assert_equal(lines[2]["table_data"][0][-1], "Outer")
+
+
+SAMPLE_10K_TEXT = b"""                                    FORM 10-K
+PART I
+ITEM 1.  BUSINESS
+     The Company designs and sells widgets.
+<PAGE>   2
+ITEM 7.  MANAGEMENT'S DISCUSSION AND ANALYSIS
+     Revenue increased 12% in fiscal 1998.
+<TABLE>
+<CAPTION>
+                                              1998        1997
+                                            --------    --------
+<S>                                         <C>         <C>
+Net revenue...............................  $  5,400    $  4,800
+Cost of revenue...........................     3,100       2,900
+Gross profit..............................     2,300       1,900
+</TABLE>
+<PAGE>   3
+ITEM 8.  FINANCIAL STATEMENTS AND SUPPLEMENTARY DATA
+<TABLE>
+<S>                                         <C>         <C>
+Cash and cash equivalents.................  $  1,000    $    900
+Total assets..............................    12,000      11,000
+</TABLE>
+ITEM 9.  CHANGES IN AND DISAGREEMENTS WITH ACCOUNTANTS
+     None.
+"""
+
+
+def test_process_text_single_pass():
+    """
+    Test that the streaming text line model collapses each <TABLE> region into one line, matching the
+    legacy builder once the rows it leaves behind are dropped.
+    :return:
+    """
+    for document in [SAMPLE_10K_TEXT, openedgar.benchmarks.content_parser.build_10k_text(paragraphs_per_item=5)]:
+        parser = SECFilingContentParser(document, True)
+        assert_equal(parser.process_text(),
+                     openedgar.benchmarks.content_parser.legacy_text_lines(
+                         openedgar.benchmarks.content_parser.legacy_process_text(parser)))
+
+    lines = SECFilingContentParser(SAMPLE_10K_TEXT, True).process_text()
+    assert_equal(len(lines), 15)
+    table_lines = [line for line in lines if line["tag"] == "table"]
+    assert_equal([line["table_index"] for line in table_lines], [1, 2])
+    assert_equal([line["line_index"] for line in table_lines], [7, 18])
+    assert_equal([line["item_number"] for line in table_lines], ["7", "8"])
+    assert_equal([line["page_number"] for line in table_lines], [2, 3])
+    assert_equal(len(table_lines[0]["content"]), 8)
+    assert_equal(table_lines[1]["table_data"][1][2].strip(), "11,000")
+    assert_true(all(line["table_index"] is None for line in lines if line["tag"] is None))
+
+    # A table left open at the end of the document is still collapsed
+    lines = SECFilingContentParser(b"ITEM 8.\n<TABLE>\nTotal assets   12,000\n", True).process_text()
+    assert_equal([line["tag"] for line in lines], [None, "table"])
+
+
+def test_line_store():
+    """
+    Test that the column store reads back the parsed line dicts and finds rows by column.
+    :return:
+    """
+    for document, is_text_file in [(SAMPLE_10K_HTML, False), (SAMPLE_10K_TEXT, True)]:
+        lines = SECFilingContentParser(document, is_text_file).parse()
+        store = openedgar.parsers.line_store.LineStore.from_lines(lines)
+        assert_equal(len(store), len(lines))
+        assert_equal(store, lines)
+        assert_equal(store.to_dicts(), lines)
+        assert_equal(store[-1], lines[-1])
+        assert_equal(store[2:4], lines[2:4])
+        assert_true(openedgar.parsers.line_store.LineStore.from_lines(store) is store)
+        assert_equal(openedgar.parsers.line_store.LineStore.from_columns(store.to_columns()), lines)
+        assert_equal(store.find("tag", "table"), [line for line in lines if line["tag"] == "table"])
+        assert_equal(store.find("page_number", 3), [line for line in lines if line["page_number"] == 3])
+        assert_equal(store.find("tag", "blink"), [])
+
+    # Repeated values are held once
+    store = openedgar.parsers.line_store.LineStore.from_lines(SECFilingContentParser(SAMPLE_10K_HTML, False).parse())
+    assert_equal(len(store.categories["tag"]), len(set(line["tag"] for line in store)))
+    assert_equal(dict(store[0]), store[0].to_dict())
+    assert_equal(store[0]["element_index"], 0)
+    assert_equal(list(store[0]), openedgar.parsers.line_store.LINE_COLUMNS)
+    assert_equal(json.loads(json.dumps(store.tolist(), default=dict)), json.loads(json.dumps(store.to_dicts())))
+
+
+def test_term_matcher():
+    """
+    Test that the compiled term matcher agrees with searching each term, and reports the matched term.
+    :return:
+    """
+    candidates = ["Consolidated Balance Sheets", "  CONSOLIDATED STATEMENTS OF CASH FLOWS (continued)",
+                  "Consolidated Statements of Income  34", "Notes to consolidated balance sheets", "",
+                  "Consolidated Statements of Operations", "stockholders' equity statements", "Item 8."]
+    term_lists = [openedgar.references.balance_sheet_terms, openedgar.references.income_statement_terms,
+                  openedgar.references.cash_flow_statement_terms, openedgar.references.equity_statement_terms,
+                  openedgar.references.comprehensive_income_terms, ["balance", "^item", "cash|income"],
+                  [r"(\w+) \1"], ["sheets", "notes"]]
+    for terms in term_lists:
+        matcher = openedgar.parsers.term_matcher.get_term_matcher(tuple(terms))
+        assert_true(matcher is openedgar.parsers.term_matcher.get_term_matcher(tuple(terms)))
+        for text in candidates:
+            matched = [term for term in terms if re.search(term, text, re.IGNORECASE)]
+            assert_equal(matcher.matches_any(text), bool(matched))
+            assert_equal(matcher.matches_all(text), len(matched) == len(terms))
+            term = matcher.search(text)
+            assert_true(term in matched if matched else term is None)
+
+    # Anchored terms are hoisted, terms with back-references fall back to one pattern per term
+    assert_true(openedgar.parsers.term_matcher.TermMatcher(["^a", "^b"]).pattern.pattern.startswith("^(?:"))
+    assert_equal(openedgar.parsers.term_matcher.TermMatcher([r"(\w+) \1"]).pattern, None)
+    matcher = openedgar.parsers.term_matcher.TermMatcher(["^x", "^balance|cash"])
+    assert_equal(matcher.search("net cash used"), "^balance|cash")
+    assert_equal(openedgar.parsers.term_matcher.TermMatcher(["(notes) to", "balance"]).search("notes to balance"),
+                 "(notes) to")
@@ -22,7 +22,29 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import datetime
+import itertools
+import os
+import re
+
+import pandas
+from nose.tools import assert_equal, assert_list_equal, assert_true
+
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+
+from openedgar.clients.blob import BlobStore, BloomFilter
+import openedgar.clients.s3
 from openedgar.clients.s3 import S3Client
+from openedgar.models import Company, CompanyInfo, DocumentContent, Filing, FilingIndex
+import openedgar.parsers.edgar
+import openedgar.processes.edgar
+from openedgar.processes.pipeline import FilingPipeline
+import openedgar.processes.s3
+from openedgar.processes.writer import FilingBatchWriter
+from openedgar.tests.test_parser import SAMPLE_FILING, SAMPLE_10K_HTML, SAMPLE_10K_TEXT
 import openedgar.tasks
 from config.settings.base import S3_BUCKET
 
@@ -38,3 +60,297 @@ def test_process_filing():
         client = S3Client()
         buffer = client.get_buffer("edgar/data/1000180/0000950134-05-005462.txt")
         openedgar.tasks.process_filing(buffer)
+
+
+class MemoryClient:
+    """
+    In-memory storage client for pipeline tests.
+    """
+
+    def __init__(self, buffers):
+        self.buffers = dict(buffers)
+
+    def path_exists(self, path: str):
+        return path in self.buffers
+
+    def paths_exist(self, path_list):
+        return {path: path in self.buffers for path in path_list}
+
+    def get_buffer(self, path: str):
+        return self.buffers[path]
+
+    def put_buffer(self, path: str, buffer, write_bytes: bool = True, codec: str = None):
+        self.buffers[path] = buffer
+
+
+def test_filing_pipeline():
+    """
+    Test that every stored filing is parsed in the process pool and persisted once.
+    :return:
+    """
+    file_path_list = ["edgar/data/1/{0:010d}-18-000001.txt".format(i) for i in range(20)]
+    client = MemoryClient({file_path: SAMPLE_FILING for file_path in file_path_list})
+    persisted = []
+
+    def persist(_, file_path, filing_data, store_raw=False, store_text=False):
+        persisted.append((file_path, len(filing_data["documents"]), filing_data["sha1"]))
+        return file_path
+
+    pipeline = FilingPipeline(client, persist, fetch_workers=4, parse_workers=2, queue_size=3)
+    stats = pipeline.run(file_path_list)
+    assert_equal(stats["persisted"], 20)
+    assert_equal(stats["errors"], 0)
+    assert_equal(sorted(p[0] for p in persisted), sorted(file_path_list))
+    assert_equal({p[1] for p in persisted}, {2})
+
+
+def test_filing_batch_writer():
+    """
+    Test batched filing writes with per-filing error accounting.
+    :return:
+    """
+    filing_data = openedgar.parsers.edgar.parse_filing_record(SAMPLE_FILING)
+    bad_filing_data = dict(filing_data, cik=None)
+    broken_filing_data = dict(filing_data, documents=[{"type": None}])
+    file_path_list = ["edgar/data/1/{0:010d}-18-000002.txt".format(i) for i in range(5)]
+
+    blob_store = BlobStore(MemoryClient({}), "documents", bloom_filter=BloomFilter(capacity=1000))
+    writer = FilingBatchWriter(blob_store, batch_size=3, store_raw=True)
+    for file_path in file_path_list:
+        writer.add(file_path, filing_data)
+    writer.add("edgar/data/1/bad.txt", bad_filing_data)
+    writer.add("edgar/data/1/broken.txt", broken_filing_data)
+    writer.flush()
+
+    assert_equal(sorted(writer.filings), sorted(file_path_list))
+    assert_equal(sorted(writer.errors), ["edgar/data/1/bad.txt", "edgar/data/1/broken.txt"])
+    assert_equal(Filing.objects.filter(s3_path__in=file_path_list).count(), 5)
+    assert_equal(Filing.objects.get(s3_path=file_path_list[0]).filingdocument_set.count(), 2)
+    assert_equal(blob_store.dedupe_report()["stored"], 2)
+
+    # A second writer for the same company and date adds no CompanyInfo, and unknown counts stay unknown
+    info_count = CompanyInfo.objects.filter(company_id=int(filing_data["cik"])).count()
+    other_writer = FilingBatchWriter(blob_store, batch_size=3)
+    other_writer.add("edgar/data/1/unknown-count.txt", dict(filing_data, document_count=None))
+    other_writer.flush()
+    assert_equal(CompanyInfo.objects.filter(company_id=int(filing_data["cik"])).count(), info_count)
+    assert_equal(Filing.objects.get(s3_path="edgar/data/1/unknown-count.txt").document_count, None)
+
+
+def test_bulk_create_light_filings():
+    """
+    Test set-based filing creation from a parsed index: path cleanup, bad records, and re-runs
+    that must not duplicate Filing or CompanyInfo rows.
+    :return:
+    """
+    Company.objects.bulk_create([Company(cik=9000001)])
+    Filing.objects.create(form_type="10-K", s3_path="edgar/data/9000001/0000000000-18-000009.txt",
+                          company_id=9000001, is_error=False, is_processed=False)
+    index_data = pandas.DataFrame([
+        [9000001, "Existing Co", "10-K", "2018-03-01", "edgar/data/9000001/0000000000-18-000009.txt"],
+        [9000001, "Existing Co", "8-K", "2018-03-01", "data/9000001/0000000000-18-000010.txt"],
+        [9000002, "New Co", "10-K", "2018-03-02", "edgar/data/9000002/0000000000-18-000011.txt"],
+        [9000002, "New Co", "10-K", "2018-03-02", "edgar/data/9000002/0000000000-18-000011.txt"],
+        [9000002, "New Co", "10-Q", "2018-03-02", "edgar/data/9000002/0000000000-18-000012.txt"],
+        ["bad", "Bad Co", "10-K", "2018-03-02", "edgar/data/0/0000000000-18-000013.txt"],
+        [9000003, "Bad Path Co", "10-K", "2018-03-02", "other/0000000000-18-000014.txt"]],
+        columns=["CIK", "Company Name", "Form Type", "Date Filed", "File Name"])
+
+    assert_equal(openedgar.tasks.bulk_create_light_filings(index_data, form_type_list=["10-K", "8-K"]), (2, 2))
+    assert_true(Filing.objects.filter(s3_path="edgar/data/9000001/0000000000-18-000010.txt").exists())
+    assert_true(not Filing.objects.filter(s3_path="edgar/data/9000002/0000000000-18-000012.txt").exists())
+    assert_equal(Filing.objects.filter(company_id__in=[9000001, 9000002]).count(), 3)
+    assert_equal(CompanyInfo.objects.filter(company_id=9000002).count(), 1)
+
+    # Re-running the same index creates nothing new
+    assert_equal(openedgar.tasks.bulk_create_light_filings(index_data, form_type_list=["10-K", "8-K"]), (0, 2))
+    assert_equal(Filing.objects.filter(company_id__in=[9000001, 9000002]).count(), 3)
+    assert_equal(CompanyInfo.objects.filter(company_id__in=[9000001, 9000002]).count(), 2)
+
+
+def test_process_daily_index_delta():
+    """
+    Test the daily index high-water mark and that only newer indices are processed, in publication
+    order, stopping at the first failure.
+    :return:
+    """
+    edgar_process = openedgar.processes.edgar
+    list_index = openedgar.clients.edgar.list_index
+    download_filing_index_data = edgar_process.download_filing_index_data
+    process_filing_index = edgar_process.process_filing_index
+    list_calls, processed_paths = [], []
+
+    def fake_list_index(index_type="form", min_date=None, **kwargs):
+        list_calls.append((index_type, min_date))
+        return ["/Archives/edgar/daily-index/2018/QTR1/form.20180307.idx",
+                "/Archives/edgar/daily-index/2018/QTR1/form.20180305.idx",
+                "/Archives/edgar/daily-index/2018/QTR1/form.20180306.idx"]
+
+    def fake_download_filing_index_data(filing_index_list=None, **kwargs):
+        return [("edgar/daily-index/2018/QTR1/" + os.path.basename(path), None, False) for path in filing_index_list]
+
+    def fake_process_filing_index(client_type, file_path, **kwargs):
+        if file_path.endswith("form.20180307.idx"):
+            raise ValueError("bad index")
+        processed_paths.append(file_path)
+
+    try:
+        openedgar.clients.edgar.list_index = fake_list_index
+        edgar_process.download_filing_index_data = fake_download_filing_index_data
+        edgar_process.process_filing_index = fake_process_filing_index
+
+        # First run: no FilingIndex rows, so the delta starts at min_date
+        FilingIndex.objects.filter(index_type="form").delete()
+        assert_equal(edgar_process.get_index_high_water_mark(), None)
+        edgar_process.process_daily_index_delta(min_date=datetime.date(2018, 3, 1))
+        assert_equal(list_calls[-1], ("form", datetime.date(2018, 3, 1)))
+
+        # Only processed, dated indices of the requested type count
+        FilingIndex.objects.bulk_create([
+            FilingIndex(edgar_url="form.20180302.idx", index_type="form", date_published=datetime.date(2018, 3, 2),
+                        is_processed=True),
+            FilingIndex(edgar_url="form.20180304.idx", index_type="form", date_published=datetime.date(2018, 3, 4),
+                        is_processed=False),
+            FilingIndex(edgar_url="company.20180309.idx", index_type="company",
+                        date_published=datetime.date(2018, 3, 9), is_processed=True),
+            FilingIndex(edgar_url="form.idx", index_type="form", date_published=None, is_processed=True)])
+        assert_equal(edgar_process.get_index_high_water_mark(), datetime.date(2018, 3, 2))
+        assert_equal(edgar_process.get_index_high_water_mark("company"), datetime.date(2018, 3, 9))
+
+        processed_paths.clear()
+        result = edgar_process.process_daily_index_delta(min_date=datetime.date(2018, 1, 1))
+        assert_equal(list_calls[-1], ("form", datetime.date(2018, 3, 2)))
+        assert_list_equal(result, ["edgar/daily-index/2018/QTR1/form.20180305.idx",
+                                   "edgar/daily-index/2018/QTR1/form.20180306.idx"])
+        assert_list_equal(processed_paths, result)
+    finally:
+        openedgar.clients.edgar.list_index = list_index
+        edgar_process.download_filing_index_data = download_filing_index_data
+        edgar_process.process_filing_index = process_filing_index
+
+
+def test_backfill_filing_document_offsets():
+    """
+    Test that the offset backfill rewrites character offsets as byte offsets into the stored filing.
+    :return:
+    """
+    file_path = "edgar/data/1/0000000003-18-000001.txt"
+    filing_data = openedgar.parsers.edgar.parse_filing_record(SAMPLE_FILING)
+    client = MemoryClient({file_path: SAMPLE_FILING})
+    writer = FilingBatchWriter(BlobStore(MemoryClient({}), "documents"), batch_size=1)
+    writer.add(file_path, filing_data)
+    writer.flush()
+    filing = Filing.objects.get(s3_path=file_path)
+
+    # Character offsets, as recorded over the decoded filing before offsets were in bytes
+    text = SAMPLE_FILING.decode("utf-8")
+    start_list = [match.start() for match in re.finditer("<DOCUMENT>", text)]
+    end_list = [match.end() for match in re.finditer("</DOCUMENT>", text)]
+    for filing_document in filing.filingdocument_set.all():
+        filing_document.start_pos = start_list[filing_document.sequence - 1]
+        filing_document.end_pos = end_list[filing_document.sequence - 1]
+        filing_document.save()
+    sha1_list = sorted(filing.filingdocument_set.values_list("sha1", flat=True))
+
+    updated_count = openedgar.processes.edgar.backfill_filing_document_offsets(filing_id_list=[filing.id],
+                                                                              client=client)
+    assert_equal(updated_count, 2)
+    for filing_document in filing.filingdocument_set.all():
+        segment = SAMPLE_FILING[filing_document.start_pos:filing_document.end_pos]
+        assert_true(segment.startswith(b"<DOCUMENT>"))
+        assert_true(segment.endswith(b"</DOCUMENT>"))
+    assert_equal(sorted(filing.filingdocument_set.values_list("sha1", flat=True)), sha1_list)
+
+    # A second run finds nothing to update
+    assert_equal(openedgar.processes.edgar.backfill_filing_document_offsets(filing_id_list=[filing.id],
+                                                                           client=client), 0)
+
+
+def test_sweep_s3():
+    """
+    Test that the S3 sweep classifies objects from listed sizes and ranged heads, by shard.
+    :return:
+    """
+    bucket = openedgar.clients.s3.S3_BUCKET
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        try:
+            openedgar.clients.s3.S3_BUCKET = "openedgar-test"
+            openedgar.processes.s3.S3_BUCKET = "openedgar-test"
+            openedgar.clients.s3.reset_shared_client()
+            client = S3Client()
+            client.get_client().create_bucket(Bucket="openedgar-test")
+            client.put_buffer("edgar/data/1/filing.txt", SAMPLE_FILING)
+            client.put_buffer("edgar/data/1/large.txt", os.urandom(openedgar.processes.s3.SWEEP_SUSPECT_SIZE + 1),
+                              deflate=False)
+            client.get_client().put_object(Bucket="openedgar-test", Key="edgar/data/2/empty.txt", Body=b"")
+            client.put_buffer("edgar/data/2/rate.txt", b"<html><head><title>SEC.gov | Request Rate Threshold "
+                                                       b"Exceeded</title></head>" + b" " * 2000 + b"</html>")
+            client.put_buffer("edgar/data/3/denied.txt", b"<?xml version=\"1.0\"?><Error><Code>AccessDenied</Code>"
+                                                         b"<Message>Access Denied</Message><RequestId>1</RequestId>",
+                              codec="none")
+
+            report = openedgar.processes.s3.sweep_s3(fix=False, max_workers=2)
+            assert_equal((report["prefixes"], report["objects"], report["ranged_gets"]), (3, 5, 3))
+            assert_equal(report["counts"], {"empty": 1, "rate_limited": 1, "not_found": 0, "access_denied": 1,
+                                             "s3_error": 0})
+
+            # Shards split the CIK space; fixes only apply to the requested kinds
+            report = openedgar.processes.s3.sweep_s3(shard=1, shard_count=2, kinds=["access_denied"], fix=True)
+            assert_equal(report["prefixes"], 2)
+            assert_list_equal(report["files"]["access_denied"], ["edgar/data/3/denied.txt"])
+            assert_equal(report["fixed"], 1)
+            assert_true(not client.path_exists("edgar/data/3/denied.txt"))
+            assert_true(client.path_exists("edgar/data/2/rate.txt"))
+        finally:
+            openedgar.clients.s3.S3_BUCKET = bucket
+            openedgar.processes.s3.S3_BUCKET = bucket
+            openedgar.clients.s3.reset_shared_client()
+
+
+def scan_lines(lines, row_type=None, item_sections=(), page_lines=()):
+    """
+    Select searched lines by scanning every line, as DocumentContent.search did before its indexes.
+    :return: list of line dicts
+    """
+    if row_type == "rows":
+        lines = [line for line in lines if line["tag"] not in ("table", "tr", "td", "th")]
+    elif row_type == "tables":
+        lines = [line for line in lines if line["tag"] == "table"]
+    if item_sections:
+        lines = [line for line in lines if line["item_number"] in item_sections]
+    if page_lines:
+        lines_w_content = [line for line in lines if line["content"]]
+        lines = [line for _, page in itertools.groupby(lines_w_content, key=lambda x: x["page_number"])
+                 for index, line in enumerate(page) if index in page_lines]
+    return lines
+
+
+def test_document_content_indexes():
+    """
+    Test that indexed DocumentContent searches select the same lines as full scans.
+    :return:
+    """
+    for document, is_text_file in [(SAMPLE_10K_HTML, False), (SAMPLE_10K_TEXT, True)]:
+        content = DocumentContent(document, is_text_file)
+        lines = content.lines.to_dicts()
+        for row_type in [None, "rows", "tables"]:
+            for item_sections in [[], ["8"], ["7", "9A", "9"]]:
+                for page_lines in [[], range(0, 2), [1, 3]]:
+                    expected = [line for line in scan_lines(lines, row_type, item_sections, page_lines)
+                                if content.execute_search(line, ["\\w"], "any")]
+                    response = content.search(["\\w"], row_type=row_type, item_sections=item_sections,
+                                              page_lines=page_lines)
+                    assert_equal(response["results"] if response else [], expected)
+
+        assert_equal(content.nonTableRows(), scan_lines(lines, "rows"))
+        response = content.search(["total assets"], response_type="page")
+        assert_equal(response["results"], [[line for line in lines if line["page_number"] == 3 - (not is_text_file)]])
+
+    # The first of equally big tables on a page wins; pages without tables are skipped
+    content = DocumentContent(SAMPLE_10K_HTML, False)
+    response = content.biggest_table_on_page(["net revenue", "item 7", "controls"])
+    assert_equal([line["table_index"] for line in response["results"]], ["0"])
+    assert_equal(content.biggest_table_on_page(["controls"])["results"], [])